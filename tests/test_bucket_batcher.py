@@ -0,0 +1,18 @@
+from bucket_batcher import BucketBatcher
+
+LENGTHS = [2, 100, 3, 98, 7, 7, 7, 40, 1]
+
+
+def test_padding_report_leaves_the_shuffle_as_is():
+    batcher = BucketBatcher(batch_size=2, max_len=100, shuffle=True)
+    untouched = BucketBatcher(batch_size=2, max_len=100, shuffle=True)
+    report = batcher.padding_report(LENGTHS)
+    assert batcher.index_batches(LENGTHS) == \
+        untouched.index_batches(LENGTHS)
+    # the slots of the batches index_batches makes
+    batches = untouched.index_batches(LENGTHS)
+    assert report['bucket_slots'] == \
+        sum(len(batch)*max(LENGTHS[idx] for idx in batch)
+            for batch in batches)
+    assert BucketBatcher(batch_size=2, max_len=100).padding_report(
+        [2, 100, 3, 98])['global_pad_ratio'] == 0.4925
@@ -0,0 +1,34 @@
+import numpy as np
+
+from embedding_store import EmbeddingStore
+
+VECTORS = {'password': [0.1, 0.2, 0.3], 'reset': [1.0, -1.0, 0.5],
+           'outlook': [0.0, 0.25, -0.5], 'new york': [2.0, 2.0, 2.0]}
+
+
+def test_converted_vectors_round_trip(tmp_path):
+    path = tmp_path / 'vectors.txt'
+    lines = [f'{word} ' + ' '.join(map(str, vector))
+             for word, vector in VECTORS.items()]
+    # a duplicated word keeps its first vector
+    lines.append('reset 9 9 9')
+    path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+    store = EmbeddingStore.open(path)
+    assert len(store) == 5 and store.dim == 3
+    for word, vector in VECTORS.items():
+        assert np.allclose(store.get(word), vector)
+    assert 'erp' not in store and store.get('erp') is None
+
+    # the words of the tokenizer not found are looked up lowercased
+    matrix, stats = store.embedding_matrix({'password': 1, 'Outlook': 2,
+                                            'erp': 3})
+    assert np.allclose(matrix[1], VECTORS['password'])
+    assert np.allclose(matrix[2], VECTORS['outlook'])
+    assert not matrix[0].any() and not matrix[3].any()
+    assert stats['oov_words'] == ['erp']
+
+    # the unchanged file is not converted again
+    mtime = (tmp_path / 'vectors' / 'meta.json').stat().st_mtime_ns
+    reopened = EmbeddingStore.open(path)
+    assert (tmp_path / 'vectors' / 'meta.json').stat().st_mtime_ns == mtime
+    assert np.allclose(reopened.get('new york'), VECTORS['new york'])
@@ -0,0 +1,56 @@
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from entity_handler import EntityHandler
+
+TICKETS = ["phone 212 555 1234 on 12/03/2020, mail john.doe@gmail.com",
+           "call 273 7924 on 12/03 or mail john.doe@gmail.com, "
+           "see www.google.com/?search",
+           "see www.google.com/?search and mail john@mail.company.com",
+           "critical:hostname_221.company.com mountpoint /oracle/erp",
+           "kein email von p.eggert@karl-roll.de. http://a.com/x(y)",
+           "login to https://portal.company.de/home, ..www.x.co.uk.",
+           "job job_1424 failed in job_scheduler at: 10/31/2016 10:21:00",
+           "tel +49 (0) 711 1234567 fax 0711-7654321 ext 12",
+           "source ip: 10.16.90.249 port 55198 on sep 26 08:23:55",
+           "unable to login to erp, password reset",
+           ""]
+
+
+def sequential(handler, text):
+    '''The TEL, DATE, LINK and MAIL handlers run one after the other'''
+    toks = text.split()
+    text = ' '.join(toks)
+    tags = ['O']*len(toks)
+    found = {}
+    for label in handler.order:
+        indices = handler.handlers[label].match_ref(text, toks, tags)
+        found[label] = list(indices)
+        tags = [label if idx in indices else tag
+                for idx, tag in enumerate(tags)]
+    return found
+
+
+def fused(handler, text):
+    toks = text.split()
+    return handler.match_ref(' '.join(toks), toks, ['O']*len(toks))
+
+
+@pytest.mark.parametrize('safe', [False, True])
+@pytest.mark.parametrize('text', TICKETS)
+def test_fused_scan_tags_as_the_handlers_in_sequence(text, safe):
+    handler = EntityHandler(safe=safe)
+    assert fused(handler, text) == sequential(handler, text)
+
+
+def test_fused_scan_tags_the_real_tickets_as_the_handlers():
+    data = Path(__file__).resolve().parents[1] / 'data' / 'input_data.xlsx'
+    if not data.is_file():
+        pytest.skip('input_data.xlsx is not available')
+    texts = pd.read_excel(data, usecols=['Description'])['Description']
+    handler = EntityHandler(safe=True)
+    for text in texts.dropna().astype(str).head(500):
+        text = text.lower()
+        assert fused(handler, text) == sequential(handler, text), text
@@ -0,0 +1,30 @@
+import numpy as np
+
+from feature_store import FeatureStore
+
+TEXTS = ['vpn is down', 'erp login fails', 'vpn is slow again']
+
+
+def test_saving_an_existing_key_leaves_one_entry(tmp_path):
+    store = FeatureStore(tmp_path)
+    X_train, X_test, vectorizer, selector = store.tfidf(TEXTS, [0, 1, 0])
+    key = store.key(TEXTS, [0, 1, 0])
+    # a second writer of the same features, as from another process
+    store.save(key, X_train, X_test, vectorizer, selector)
+    assert [path.name for path in tmp_path.iterdir()] == [key]
+    assert store.stats()['entries'] == 1
+
+
+def test_features_round_trip_through_a_new_store(tmp_path):
+    params = {'ngram_range': (1, 2)}
+    X_train, X_test, vectorizer, selector = FeatureStore(tmp_path).tfidf(
+        TEXTS, [0, 1, 0], ['vpn down'], params=params, k=3)
+    store = FeatureStore(tmp_path)
+    loaded = store.tfidf(TEXTS, [0, 1, 0], ['vpn down'], params=params, k=3)
+    assert store.stats()['hits'] == 1 and store.stats()['misses'] == 0
+    assert (loaded[0] != X_train).nnz == 0 and (loaded[1] != X_test).nnz == 0
+    assert loaded[2].vocabulary_ == vectorizer.vocabulary_
+    assert np.array_equal(loaded[3].get_support(), selector.get_support())
+    # another parameter is another entry
+    store.tfidf(TEXTS, [0, 1, 0], ['vpn down'], params=params, k=2)
+    assert store.stats()['misses'] == 1 and store.stats()['entries'] == 2
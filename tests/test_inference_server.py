@@ -0,0 +1,57 @@
+import json
+import asyncio
+
+from inference_server import MicroBatcher, connection_handler
+
+
+def failing_predict(texts):
+    raise RuntimeError('model not loaded')
+
+
+async def exchange(predict_fn, lines):
+    batcher = MicroBatcher(predict_fn, max_wait_ms=1)
+    await batcher.start()
+    server = await asyncio.start_server(connection_handler(batcher),
+                                        '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    try:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(''.join(line + '\n' for line in lines).encode())
+        writer.write_eof()
+        # the server closes the connection once every line is answered
+        responses = await asyncio.wait_for(reader.read(), 5)
+        writer.close()
+    finally:
+        server.close()
+        await server.wait_closed()
+        await batcher.stop()
+    return [json.loads(line) for line in responses.decode().splitlines()]
+
+
+def test_predict_failures_are_answered():
+    responses = asyncio.run(exchange(failing_predict,
+                                     ['{"id": 1, "text": "vpn down"}',
+                                      'not json']))
+    assert sorted((response['id'] or 0, response['error'].split(':')[0])
+                  for response in responses) == [(0, 'JSONDecodeError'),
+                                                 (1, 'RuntimeError')]
+
+
+def test_requests_are_answered():
+    def predict(texts):
+        return [('GRP_0', 0.5) for _ in texts]
+
+    responses = asyncio.run(exchange(predict, ['{"id": 1, "text": "vpn"}']))
+    assert responses == [{'id': 1, 'group': 'GRP_0', 'score': 0.5}]
+
+
+def test_short_results_fail_the_whole_batch():
+    def predict(texts):
+        return [('GRP_0', 0.5)]*(len(texts) - 1)
+
+    responses = asyncio.run(exchange(predict,
+                                     ['{"id": 1, "text": "vpn"}',
+                                      '{"id": 2, "text": "erp"}']))
+    assert sorted(response['id'] for response in responses) == [1, 2]
+    assert all(response['error'].startswith('RuntimeError: predict_fn')
+               for response in responses)
@@ -0,0 +1,33 @@
+import pandas as pd
+
+import keyword_features
+from utils import load_dataset
+
+
+def fake_extract(texts, params=None, n_jobs=None, chunksize=256):
+    return [text.split()[0] for text in texts]
+
+
+def test_keywords_survive_the_reconversions(tmp_path, monkeypatch):
+    monkeypatch.setattr(keyword_features, 'extract_keywords', fake_extract)
+    path = tmp_path / 'tickets.csv'
+    pd.DataFrame({'translated_description': ['vpn down', 'reset password'],
+                  'group': ['GRP_0', 'GRP_1']}).to_csv(path, index=False)
+    data, stats = keyword_features.add_keywords(path)
+    assert data['keywords'].tolist() == ['vpn', 'reset']
+    assert stats['extracted'] == 2
+
+    # the categorical columns changed, the conversion is rerun
+    data = load_dataset(path, categorical=('group',))
+    assert data['keywords'].tolist() == ['vpn', 'reset']
+    # the rows added to the source have no keywords until the next run
+    pd.DataFrame({'translated_description': ['printer jam', 'vpn down'],
+                  'group': ['GRP_2', 'GRP_0']}) \
+        .to_csv(path, mode='a', header=False, index=False)
+    data = load_dataset(path, columns=['keywords', 'group'])
+    assert list(data.columns) == ['keywords', 'group']
+    assert data['keywords'].tolist() == ['vpn', 'reset', None, 'vpn']
+    _, stats = keyword_features.add_keywords(path)
+    assert stats['extracted'] == 1
+    assert load_dataset(path, columns=['keywords'])['keywords'].tolist() \
+        == ['vpn', 'reset', 'printer', 'vpn']
@@ -0,0 +1,23 @@
+import numpy as np
+
+from knn_index import AnnIndex
+
+
+def test_saved_index_searches_the_same(tmp_path):
+    rng = np.random.RandomState(7)
+    vectors = rng.normal(size=(300, 16)).astype(np.float32)
+    groups = [f'GRP_{idx % 4}' for idx in range(300)]
+    index = AnnIndex.build(tmp_path / 'knn', vectors, np.arange(300), groups,
+                           nlist=8, nprobe=8, shard_size=128)
+    index.add(vectors[:2] + 0.01, [1000, 1001], ['GRP_9', 'GRP_9'])
+    index.delete([5])
+    # an id added again keeps its last row only
+    index.add(vectors[7:8], [7], ['GRP_8'])
+    index.save()
+    loaded = AnnIndex.open(tmp_path / 'knn')
+    assert len(loaded) == len(index) == 301
+    for found, expected in zip(loaded.search(vectors[:10], k=5),
+                               index.search(vectors[:10], k=5)):
+        assert np.array_equal(found, expected)
+    ids, _, groups = loaded.search(vectors[5:8], k=1)
+    assert ids[0, 0] != 5 and ids[2, 0] == 7 and groups[2, 0] == 'GRP_8'
@@ -0,0 +1,75 @@
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+import cleaning
+from log_template import LogTemplates, UNSEEN, is_alert
+
+ALERT = ("source ip: 10.16.90.249_x000D_\n"
+         "source port: 55198_x000D_\n"
+         "event summary: internal outbreak for 137/udp_x000D_\n"
+         "protocol: udp_x000D_\n"
+         "action: blocked_x000D_\n"
+         "host and connection information_x000D_\n"
+         "sep 26 08:23:55 80.71.06.702 %asa-4-106023: deny udp_x000D_\n"
+         "we are escalating this incident to you via a ticket_x000D_\n"
+         "we are escalating this incident to you via a ticket_x000D_\n")
+FORM = ("source ip :\nsystem name :lmsl9516338\nuser  name:trhdyd mffbsf\n"
+        "location :usa\ndsw event log:see below\n")
+MAIL = "from: soc\nsubject: event summary: weekly scan\nplease review"
+
+
+def test_gate_keeps_the_source_ip_tickets_only():
+    assert is_alert(ALERT) and is_alert(FORM)
+    assert not is_alert(MAIL)
+    assert cleaning.clean_security_logs(MAIL) == MAIL
+
+
+def test_canonical_keeps_the_free_text_once():
+    _, canonical = LogTemplates().fit([ALERT]).compress(ALERT)
+    assert canonical == ('internal outbreak for 137/udp udp blocked we are '
+                         'escalating this incident to you via a ticket')
+
+
+def test_alerts_without_summary_fall_back_to_the_field_cleaning():
+    template, canonical = LogTemplates().fit([FORM]).compress(FORM)
+    assert template == 'T0' and canonical == ''
+    cleaned = cleaning.clean_security_logs(FORM)
+    assert cleaned == cleaning.clean_security_fields(FORM)
+    assert 'usa' in cleaned and 'trhdyd mffbsf' in cleaned
+
+
+def test_saved_skeletons_give_the_same_ids(tmp_path):
+    templates = LogTemplates().fit([ALERT, FORM])
+    templates.save(tmp_path / 'templates.json')
+    loaded = LogTemplates.load(tmp_path / 'templates.json')
+    assert [loaded.compress(text)[0] for text in (ALERT, FORM)] == \
+        [templates.compress(text)[0] for text in (ALERT, FORM)]
+    assert loaded.compress('source ip: 1.2.3.4\nfoo bar: x')[0] == UNSEEN
+
+
+def test_boilerplate_lines_are_dropped():
+    other = ALERT.replace('137/udp', '7/udp') + \
+        'the source host contacted a sinkhole domain twice_x000D_\n'
+    templates = LogTemplates().fit([ALERT, other])
+    assert templates.boilerplate == \
+        ['we are escalating this incident to you via a ticket']
+    assert templates.compress(other)[1] == \
+        ('internal outbreak for 7/udp udp blocked the source host '
+         'contacted a sinkhole domain twice')
+    # the near copies of a boilerplate line are dropped as well
+    assert templates.is_boilerplate(
+        'we are escalating this incident to you via a phone call')
+
+
+def test_real_alerts_compress_to_a_short_summary():
+    data = Path(__file__).resolve().parents[1] / 'data' / 'input_data.xlsx'
+    if not data.is_file():
+        pytest.skip('input_data.xlsx is not available')
+    texts = pd.read_excel(data, usecols=['Description'])['Description']
+    alerts = [text for text in texts.dropna().astype(str) if is_alert(text)]
+    words = sorted(len(cleaning.clean_security_logs(text).split())
+                   for text in alerts)
+    assert len(alerts) == 30
+    assert words[-1] <= 40 and words[len(words)//2] <= 16
@@ -0,0 +1,30 @@
+from near_duplicate import NearDuplicateIndex, shingles
+
+
+def test_blank_tickets_match_nothing():
+    assert len(shingles('  \n\t')) == 0
+    index = NearDuplicateIndex()
+    for key, text in enumerate(['', ' \n ',
+                                'Job Job_1424 failed in job_scheduler']):
+        index.insert(text, 'GRP_0' if key < 2 else 'GRP_8', key)
+    assert len(index) == 1
+    assert index.lookup('') is None and index.lookup('   ') is None
+    assert index.lookup('Job Job_1480 failed in job_scheduler') == \
+        {'key': 2, 'group': 'GRP_8', 'similarity': 1.0}
+
+
+def test_saved_index_looks_up_the_same(tmp_path):
+    index = NearDuplicateIndex(threshold=0.5)
+    tickets = ['Job Job_1424 failed in job_scheduler at: 10/31/2016',
+               'unable to login to erp after the password reset',
+               'outlook keeps crashing when opening the calendar']
+    for key, text in enumerate(tickets):
+        index.insert(text, f'GRP_{key}', key=f'INC{key}')
+    index.save(tmp_path / 'index')
+    loaded = NearDuplicateIndex.load(tmp_path / 'index')
+    queries = tickets + ['Job Job_1480 failed in job_scheduler at: 11/01/2016',
+                         'printer out of toner']
+    assert len(loaded) == len(index)
+    assert [loaded.lookup(text) for text in queries] == \
+        [index.lookup(text) for text in queries]
+    assert loaded.lookup(queries[3])['key'] == 'INC0'
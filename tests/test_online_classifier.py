@@ -0,0 +1,17 @@
+from online_classifier import OnlineClassifier
+
+TEXTS = ['unable to login to erp', 'vpn is down', 'erp password reset',
+         'vpn connection drops']
+GROUPS = ['GRP_0', 'GRP_1', 'GRP_0', 'GRP_1']
+
+
+def test_checkpoint_warm_starts_the_same_model(tmp_path):
+    clf = OnlineClassifier(GROUPS, checkpoint_dir=tmp_path)
+    clf.partial_fit(TEXTS, GROUPS)
+    clf.checkpoint()
+    # only the checkpoint and the pointer to it, no temp file left
+    assert sorted(path.name for path in tmp_path.iterdir()) == \
+        ['latest.json', 'online_000000004.joblib']
+    loaded = OnlineClassifier.load(tmp_path)
+    assert loaded.seen == 4
+    assert list(loaded.predict(TEXTS)) == list(clf.predict(TEXTS))
@@ -0,0 +1,19 @@
+from date_handler import DateHandler
+from tel_handler import TelHandler
+
+TICKETS = ['phone 212 555 1234 on 12/03/2020', 'vpn is down',
+           'no digits in this one', '']
+
+
+def tag(handler, text):
+    toks = text.split()
+    return handler.match_ref(' '.join(toks), toks, ['O']*len(toks))
+
+
+def test_every_ticket_is_counted():
+    for handler in (TelHandler(profile=True), DateHandler(profile=True)):
+        for text in TICKETS:
+            tag(handler, text)
+        assert handler.skipped >= 2
+        assert handler.profiler.tickets == len(TICKETS)
+        assert handler.profiler.total_tags > 0
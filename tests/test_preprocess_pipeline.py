@@ -0,0 +1,45 @@
+import sys
+import types
+
+import cleaning
+from preprocess_pipeline import PreprocessPipeline
+
+CONFIG = {'strip_mojibake': True, 'remove_gibberish': True}
+
+
+def test_gibberish_normalization_runs_on_every_path():
+    pipeline = PreprocessPipeline(CONFIG)
+    assert pipeline.clean('Outlook #crash & a b c-d') == \
+        'outlook crash and b d'
+    assert pipeline.clean('Outlook #crash & a b c-dÃ¼') == \
+        'outlook crash and b d'
+    # the clean tickets keep their 'xd' and non-ascii chars
+    assert pipeline.clean('ohxdwngl vpn') == 'ohxdwngl vpn'
+    assert pipeline.clean('login 密码') == 'login 密码'
+    assert pipeline.paths == {cleaning.CLEAN: 2, cleaning.SUSPECT: 1,
+                              cleaning.NON_LATIN: 1}
+
+
+def test_mojibake_is_stripped_before_the_accents_are_folded():
+    pipeline = PreprocessPipeline(dict(CONFIG, replace_accented=True))
+    assert pipeline.steps.index('strip_mojibake') < \
+        pipeline.steps.index('replace_accented')
+    # folded first, the mojibake would be kept as 'far aa'
+    assert pipeline.clean('Outlook fÃ¼r ÃxdÃ©') == 'outlook r'
+    assert pipeline.clean('Café login') == 'cafe login'
+
+
+def test_default_config_loads_from_any_cwd(tmp_path, monkeypatch):
+    excluded = []
+
+    def load(model, exclude=()):
+        excluded.append(sorted(exclude))
+        return object()
+
+    monkeypatch.setitem(sys.modules, 'spacy',
+                        types.SimpleNamespace(load=load))
+    monkeypatch.chdir(tmp_path)
+    pipeline = PreprocessPipeline()
+    assert 'get_lemmas' in pipeline.steps
+    # the lemmatizer is kept, as the get_lemmas flag of the config asks
+    assert excluded == [['ner', 'parser', 'senter']]
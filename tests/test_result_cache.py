@@ -0,0 +1,51 @@
+from link_handler import LinkHandler
+from result_cache import ResultCache, strip_lower
+
+TEXT = 'see www.google.com/home and http://a.com/x(y)'
+
+
+def tag(match_ref, text):
+    toks = text.split()
+    return match_ref(' '.join(toks), toks, ['O']*len(toks))
+
+
+def test_handlers_configured_differently_dont_share_results(tmp_path):
+    with ResultCache(path=tmp_path / 'tags') as cache:
+        for handler in (LinkHandler(), LinkHandler(safe=True),
+                        LinkHandler()):
+            tag(cache.memoize(handler.match_ref, normalize=strip_lower),
+                TEXT)
+        assert cache.stats()['misses'] == 2 and cache.stats()['hits'] == 1
+
+
+def test_lru_hits_and_evictions():
+    cache = ResultCache(maxsize=2)
+    calls = []
+
+    def upper(text):
+        calls.append(text)
+        return [text.upper()]
+
+    cached = cache.memoize(upper, normalize=strip_lower)
+    assert cached('vpn') == ['VPN']
+    # the same normalized text is a hit, the copy can be mutated
+    cached(' VPN ').append('x')
+    assert cached('vpn') == ['VPN']
+    cached('erp')
+    cached('sap')
+    assert cache.stats()['evictions'] == 1 and cache.stats()['size'] == 2
+    # 'vpn' was the least recently used, it is computed again
+    cached('vpn')
+    assert calls == ['vpn', 'erp', 'sap', 'vpn']
+    assert cache.stats()['hits'] == 2 and cache.stats()['misses'] == 4
+
+
+def test_persistent_tier_survives_the_memory(tmp_path):
+    with ResultCache(path=tmp_path / 'tags') as cache:
+        match_ref = cache.memoize(LinkHandler().match_ref)
+        tagged = tag(match_ref, TEXT)
+    with ResultCache(path=tmp_path / 'tags') as cache:
+        match_ref = cache.memoize(LinkHandler().match_ref)
+        assert tag(match_ref, TEXT) == tagged
+        assert cache.stats()['disk_hits'] == 1
+        assert cache.stats()['misses'] == 0
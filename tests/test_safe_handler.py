@@ -0,0 +1,124 @@
+import re
+import time
+
+import pytest
+
+from deadline_scan import scan
+from email_handler import EmailHandler
+from entity_handler import EntityHandler
+from link_handler import LinkHandler
+from pathological import pathological_tickets
+from safe_handler import SafeHandler
+from tel_handler import TelHandler
+
+# the dotted run the link pattern used to rescan from every label
+DOTTED = 'a' + '.a'*127 + '@'
+TICKETS = ["phone 212 555 1234 on 12/03/2020, mail john.doe@gmail.com",
+           "see www.google.com/?search and mail john@mail.company.com",
+           "critical:hostname_221.company.com mountpoint /oracle/erp",
+           "kein email von p.eggert@karl-roll.de. http://a.com/x(y)",
+           "login to https://portal.company.de/home, ..www.x.co.uk."]
+
+
+def best_time(func, *args, repeat=3):
+    times = []
+    for _ in range(repeat):
+        began = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - began)
+    return min(times)
+
+
+def tag(handler, text):
+    toks = text.split()
+    return handler.match_ref(' '.join(toks), toks, ['O']*len(toks))
+
+
+@pytest.mark.parametrize('make', [lambda n: 'a' + '.a'*n + '@',
+                                  lambda n: 'a@' + 'a-'*n + '!',
+                                  lambda n: 'x_a' + '.a'*n + '@'])
+def test_safe_link_scan_is_linear(make):
+    handler = LinkHandler(safe=True)
+    small = best_time(handler.find_link_regex, make(2000))
+    large = best_time(handler.find_link_regex, make(16000))
+    # 8 times the chars, 64 times the time if quadratic
+    assert large < 16*small + 0.01
+
+
+@pytest.mark.parametrize('text', TICKETS)
+def test_safe_link_tags_as_the_original(text):
+    assert tag(LinkHandler(safe=True), text) == tag(LinkHandler(), text)
+    assert tag(EntityHandler(safe=True), text) == tag(EntityHandler(), text)
+
+
+@pytest.mark.parametrize('pattern', [LinkHandler(safe=True).pattern,
+                                     EmailHandler().pattern,
+                                     re.compile(r'\d+|(?=\s)')])
+def test_windowed_scan_matches_finditer(pattern):
+    text = ' '.join(TICKETS*20).lower()
+    spans = [match.span() for match in pattern.finditer(text)]
+    windowed = [match.span() for match in
+                scan(pattern, text, time.perf_counter()+60, window=37,
+                     overlap=128)]
+    assert windowed == spans
+
+
+@pytest.mark.parametrize('make', [lambda: EntityHandler(safe=True),
+                                  lambda: LinkHandler(safe=True)])
+def test_budget_bounds_a_scan_backtracking_without_matches(make):
+    text = ' '.join([DOTTED]*75)
+    handler = SafeHandler(make(), budget=0.02, char_budget=0)
+    began = time.perf_counter()
+    tag(handler, text)
+    elapsed = time.perf_counter() - began
+    # one window past the deadline at most
+    assert elapsed < 0.02 + 0.1
+    assert handler.stats()['masked'] == 0
+    assert handler.stats()['timeouts'] == \
+        (1 if isinstance(handler.handler, EntityHandler) else 0)
+
+
+def test_timed_out_ticket_keeps_the_tags_found_before_the_deadline():
+    text = 'phone 212 555 1234 on 12/03/2020 ' + \
+        ' '.join([DOTTED]*150)
+    handler = SafeHandler(EntityHandler(safe=True), budget=0.01,
+                          char_budget=0)
+    tags = tag(handler, text)
+    assert handler.stats()['timeouts'] == 1
+    assert tags['TEL'] == [0, 1, 2, 3] and tags['DATE'] == [5]
+
+
+def test_pathological_tickets_stay_within_the_budget():
+    handler = SafeHandler(EntityHandler(safe=True))
+    for name, text in pathological_tickets():
+        toks = text.split()
+        text = ' '.join(toks)
+        began = time.perf_counter()
+        handler.match_ref(text, toks, ['O']*len(toks))
+        bound = handler.budget + handler.char_budget*len(text) + 0.1
+        assert time.perf_counter() - began < bound, name
+
+
+@pytest.mark.parametrize('text', ['phone 212 555 1234 {} on 12/03/2020',
+                                  'see www.google.com/home {} end',
+                                  'mail john@gmail.com {}',
+                                  '{} http://a.com/x(y) {}'])
+def test_masked_run_next_to_a_match_keeps_the_tags(text):
+    handler = SafeHandler(EntityHandler(safe=True))
+    masked = tag(handler, text.format('A'*300, 'B'*300))
+    assert handler.stats()['masked'] == 1
+    assert masked == tag(EntityHandler(safe=True), text.format('a', 'b'))
+
+
+def test_windowed_scan_ignores_the_end_of_the_window():
+    # $ matched at the end of the chars the scan saw, past the number
+    text = 'tel' + ' '*2033 + '212 555 1234' + '5 end'
+    handler = TelHandler()
+    assert handler.find_tel_regex(text) == []
+    handler.deadline = time.perf_counter() + 60
+    assert handler.find_tel_regex(text) == []
+
+
+def test_overlong_token_len_is_rejected():
+    with pytest.raises(ValueError):
+        SafeHandler(LinkHandler(safe=True), max_token_len=4096)
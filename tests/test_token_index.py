@@ -0,0 +1,33 @@
+import random
+
+from date_handler import DateHandler
+from token_index import TokenIndex, tagged_index
+
+
+def char_map_tokens(token_list, start, end):
+    '''The tokens of the span by the char map the handlers used before'''
+    char_map = DateHandler().char_mapping(token_list)
+    return sorted({char_map[idx] for idx in range(start, end)
+                   if idx in char_map})
+
+
+def test_span_tokens_as_the_char_map():
+    rng = random.Random(7)
+    for _ in range(300):
+        tokens = [''.join(rng.choice('ab1.@/') for _ in
+                          range(rng.randint(1, 6)))
+                  for _ in range(rng.randint(1, 8))]
+        length = len(' '.join(tokens))
+        start = rng.randint(0, length)
+        end = rng.randint(start, length+2)
+        assert TokenIndex(tokens).span_tokens(start, end) == \
+            char_map_tokens(tokens, start, end)
+
+
+def test_span_tokens_examples():
+    index = TokenIndex(['ab', 'cd', 'ef'])
+    assert index.span_tokens(1, 4) == [0, 1]
+    # the spaces between the tokens belong to none of them
+    assert index.span_tokens(2, 3) == []
+    assert index.span_tokens(0, 100) == [0, 1, 2]
+    assert tagged_index(['O', 'TEL', 'O', 'DATE']) == {1, 3}
@@ -0,0 +1,39 @@
+import sys
+import types
+
+import tokenize_stage
+
+
+class Doc(list):
+    pass
+
+
+class Token:
+    def __init__(self, text):
+        self.text = text
+        self.lemma_ = text
+
+
+class FakeNlp:
+    def pipe(self, texts, batch_size=256, n_process=1):
+        for text in texts:
+            yield Doc(Token(word) for word in text.split())
+
+
+def test_default_nlp_reads_the_config_from_any_cwd(tmp_path, monkeypatch):
+    excluded = []
+
+    def load(model, exclude=()):
+        excluded.append(sorted(exclude))
+        return FakeNlp()
+
+    # spaCy isn't needed to check which components are loaded
+    monkeypatch.setitem(sys.modules, 'spacy',
+                        types.SimpleNamespace(load=load))
+    monkeypatch.chdir(tmp_path)
+    assert list(tokenize_stage.tokenize_records(['tel 273'])) == \
+        [('tel 273', ['tel', '273'], ['O', 'O'])]
+    # get_lemmas is enabled in config.hjson
+    assert excluded == [['ner', 'parser', 'senter']]
+    tokenize_stage.load_nlp(config=None)
+    assert excluded[-1] == sorted(tokenize_stage.PIPES)
@@ -0,0 +1,36 @@
+import random
+
+import numpy as np
+import pandas as pd
+
+from utils import (clean_text, clean_texts, load_dataset, replace_accented,
+                   subscript_to_normal, superscript_to_normal)
+
+
+def three_pass_clean_text(text):
+    '''clean_text before CleanTable folded its passes in one translate'''
+    text = subscript_to_normal(text)
+    text = superscript_to_normal(text)
+    text = replace_accented(text.strip())
+    return ' '.join(text.split())
+
+
+def test_read_kwargs_rerun_the_conversion(tmp_path):
+    path = tmp_path / 'tickets.csv'
+    pd.DataFrame({'A': ['1', '2'], 'B': ['x', 'y']}).to_csv(path, index=False)
+    assert list(load_dataset(path).columns) == ['A', 'B']
+    assert list(load_dataset(path, usecols=['B']).columns) == ['B']
+    assert load_dataset(path, dtype={'A': str})['A'].tolist() == ['1', '2']
+    assert load_dataset(path)['A'].tolist() == [1, 2]
+
+
+def test_clean_table_cleans_as_the_three_passes():
+    chars = ''.join(map(chr, range(1, 0x3000)))
+    assert clean_text(chars) == three_pass_clean_text(chars)
+    rng = random.Random(7)
+    alphabet = 'abc XYZ \t\n.,\'éüßøÅ₂³ⁿ中ﬁ\u0301'
+    for _ in range(2000):
+        text = ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 30)))
+        assert clean_text(text) == three_pass_clean_text(text), repr(text)
+    texts = np.array(['Café ₂ ³', None, 'ok'], dtype=object)
+    assert clean_texts(texts).tolist() == ['Cafe 2 3', None, 'ok']
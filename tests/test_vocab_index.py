@@ -0,0 +1,25 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from vocab_index import VOCAB_DIR, VocabIndex, build_vocab_index
+
+WORDS = ['reset', 'password', 'the', 'a'] * 2000
+
+
+def build_and_load(path):
+    build_vocab_index(WORDS, path)
+    return len(VocabIndex(path))
+
+
+def test_concurrent_builds_never_load_a_partial_index(tmp_path):
+    path = tmp_path / 'words.npy'
+    with ProcessPoolExecutor(max_workers=4) as executor:
+        sizes = list(executor.map(build_and_load, [path]*16))
+    assert sizes == [4]*16
+    assert [file.name for file in tmp_path.iterdir()] == ['words.npy']
+    assert VocabIndex(path).contains(['reset', 'pwd']).tolist() == \
+        [True, False]
+
+
+def test_vocab_dir_does_not_depend_on_the_cwd():
+    assert VOCAB_DIR.is_absolute() and VOCAB_DIR.parts[-2:] == \
+        ('models', 'vocab')
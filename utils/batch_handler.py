@@ -0,0 +1,107 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from tel_handler import TelHandler
+from date_handler import DateHandler
+from link_handler import LinkHandler
+from email_handler import EmailHandler
+from entity_handler import EntityHandler
+
+HANDLERS = {'TEL': TelHandler,
+            'DATE': DateHandler,
+            'LINK': LinkHandler,
+            'MAIL': EmailHandler,
+            'ENTITY': EntityHandler}
+
+# the handler of the worker process, compiled once by init_worker
+_handler = None
+
+
+def init_worker(entity):
+    '''Compiles the handler of the entity once per worker process'''
+    global _handler
+    _handler = HANDLERS[entity]()
+
+
+def match_record(record):
+    '''Runs the worker handler match_ref on a (text, tokens, tags) record'''
+    text, token_list, tags_list = record
+    return _handler.match_ref(text, token_list, tags_list)
+
+
+def match_chunk(records):
+    '''Runs match_record on a chunk of records'''
+    return [match_record(record) for record in records]
+
+
+def chunked(iterable, size):
+    '''Yields lists of size elements from the iterable'''
+    chunk = []
+    for element in iterable:
+        chunk.append(element)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def match_ref_batch(records, entity='ENTITY', n_jobs=None, chunksize=256):
+    '''
+    Given an iterable of (text, token_list, tags_list) records, returns
+    the match_ref results of the entity handler in the input order.
+    The records are sharded in chunks across n_jobs worker processes,
+    each compiling its handler once, n_jobs=1 runs in this process
+    eg: Input = [("tel 273 7924", ["tel", "273", "7924"], ["O"]*3)]
+        Output = [{'TEL': [1, 2], 'DATE': [], 'LINK': [], 'MAIL': []}]
+    '''
+    if entity not in HANDLERS:
+        raise ValueError(f"Unknown entity: {entity}, "
+                         f"expected one of {list(HANDLERS)}")
+    n_jobs = n_jobs or os.cpu_count() or 1
+    if n_jobs == 1:
+        init_worker(entity)
+        return [match_record(record) for record in records]
+
+    results = []
+    with ProcessPoolExecutor(max_workers=n_jobs,
+                             initializer=init_worker,
+                             initargs=(entity,)) as executor:
+        for chunk in executor.map(match_chunk, chunked(records, chunksize)):
+            results.extend(chunk)
+    return results
+
+
+def tag_corpus(texts, token_lists, tags_lists=None,
+               n_jobs=None, chunksize=256):
+    '''
+    Given iterables or pandas Series of texts, token lists and optionally
+    tags lists, returns the tags lists with the TEL, DATE, LINK and MAIL
+    tokens tagged, in the input order
+    '''
+    token_lists = list(token_lists)
+    if tags_lists is None:
+        tags_lists = [['O']*len(tokens) for tokens in token_lists]
+    tags_lists = list(tags_lists)
+    records = zip(texts, token_lists, tags_lists)
+    results = match_ref_batch(records, entity='ENTITY',
+                              n_jobs=n_jobs, chunksize=chunksize)
+    tagged = []
+    for tags, entity_indices in zip(tags_lists, results):
+        tags = list(tags)
+        for tag, indices in entity_indices.items():
+            for idx in indices:
+                tags[idx] = tag
+        tagged.append(tags)
+    return tagged
+
+
+if __name__ == '__main__':
+    from pprint import pprint
+
+    tests = ["COMPANY REGISTRATION NUMBER 273 7924",
+             "mailto: john.doe@gmail.com from: jane.doe@outlook.com",
+             "www.google.com/?search Search Results: ..."]
+    toks = [test.split() for test in tests]
+    texts = [" ".join(tok) for tok in toks]
+    pprint(tag_corpus(texts, toks, n_jobs=2, chunksize=1), compact=True)
@@ -0,0 +1,211 @@
+'''
+Benchmarks the preprocessing and tagging hot paths on a sample of the
+tickets and on the pathological tickets, reporting the throughput, the
+p50/p99 latency and the peak memory of each case
+eg: python benchmark.py --data ../data/input_data.xlsx --out bench.json
+    python benchmark.py --baseline bench.json --threshold 0.2
+'''
+import sys
+import json
+import time
+import random
+import argparse
+import tracemalloc
+from pathlib import Path
+
+from utils import check_file_exists, clean_text, strip_commas, \
+    load_dataset
+from tel_handler import TelHandler
+from date_handler import DateHandler
+from link_handler import LinkHandler
+from email_handler import EmailHandler
+from entity_handler import EntityHandler
+from safe_handler import SafeHandler
+from pathological import pathological_tickets
+
+
+def load_tickets(path: Path, sample=2000, seed=7):
+    '''
+    Returns a reproducible sample of the merged short description and
+    description of the tickets
+    '''
+    data = load_dataset(path, columns=['Short description', 'Description'])
+    data = data.fillna('')
+    texts = (data['Short description'].astype(str) + ' ' +
+             data['Description'].astype(str)).tolist()
+    random.Random(seed).shuffle(texts)
+    return texts[:sample]
+
+
+def records(texts):
+    '''Returns the (text, tokens, tags) records the handlers take'''
+    out = []
+    for text in texts:
+        toks = text.split()
+        out.append((" ".join(toks), toks, ['O']*len(toks)))
+    return out
+
+
+def mask_corpus(texts, handler):
+    '''Cleans the texts and replaces the tagged tokens by their tag'''
+    masked = []
+    for text in texts:
+        toks = clean_text(text).split()
+        tags = ['O']*len(toks)
+        for tag, indices in handler.match_ref(" ".join(toks), toks,
+                                              tags).items():
+            for idx in indices:
+                tags[idx] = tag
+        masked.append(" ".join(tok if tag == 'O' else tag
+                               for tok, tag in zip(toks, tags)))
+    return masked
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values)-1, int(q*len(values)))]
+
+
+def run_case(func, items, repeat=3):
+    '''
+    Calls func on each of the items repeat times, returns the throughput
+    of the fastest round, the latency percentiles over all the rounds and
+    the peak memory traced in a separate pass
+    '''
+    # warm up the lazily built tables and caches
+    func(items[0])
+    latencies = []
+    rounds = []
+    for _ in range(repeat):
+        began = time.perf_counter()
+        for item in items:
+            start = time.perf_counter()
+            func(item)
+            latencies.append(time.perf_counter()-start)
+        rounds.append(time.perf_counter()-began)
+
+    tracemalloc.start()
+    for item in items:
+        func(item)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    best = min(rounds)
+    return {'items': len(items),
+            'samples': len(latencies),
+            'seconds': round(best, 6),
+            'tickets_per_sec': round(len(items)/best, 2) if best else 0.0,
+            'p50_ms': round(percentile(latencies, 0.5)*1000, 4),
+            'p99_ms': round(percentile(latencies, 0.99)*1000, 4),
+            'peak_kb': round(peak/1024, 2)}
+
+
+def cases(texts, safe=False):
+    '''
+    Returns the benchmark name, function and items of each case, the
+    safe cases run the handlers through SafeHandler
+    '''
+    recs = records(texts)
+    out = []
+    for handler in (TelHandler(), DateHandler(), LinkHandler(safe=safe),
+                    EmailHandler(), EntityHandler(safe=safe)):
+        name = type(handler).__name__
+        if safe:
+            handler = SafeHandler(handler)
+        out.append((f'{name}.match_ref',
+                    lambda rec, handler=handler: handler.match_ref(*rec),
+                    recs))
+    char_mapping = TelHandler().char_mapping
+    out.append(('char_mapping', lambda rec: char_mapping(rec[1]), recs))
+    out.append(('clean_text', clean_text, texts))
+    out.append(('strip_commas', strip_commas, texts))
+    # the masking is timed per chunk of 100 tickets
+    entity = EntityHandler(safe=safe)
+    if safe:
+        entity = SafeHandler(entity)
+    chunks = [texts[idx:idx+100] for idx in range(0, len(texts), 100)]
+    out.append(('mask_corpus',
+                lambda chunk: mask_corpus(chunk, entity), chunks))
+    return out
+
+
+def run(texts, repeat=3, safe=False):
+    results = {}
+    for name, func, items in cases(texts, safe):
+        results[name] = run_case(func, items, repeat)
+    return results
+
+
+def regressions(results, baseline, threshold=0.2):
+    '''
+    Returns the cases whose throughput dropped or p99 latency rose more
+    than threshold (a fraction) against the baseline results
+    eg: Input = threshold = 0.2
+        Output = [('tickets', 'clean_text', 'tickets_per_sec', 3000, 2000)]
+    '''
+    failed = []
+    for suite, cases_ in results.items():
+        for name, result in cases_.items():
+            base = baseline.get(suite, {}).get(name)
+            if base is None:
+                continue
+            if result['tickets_per_sec'] < \
+                    base['tickets_per_sec']*(1-threshold):
+                failed.append((suite, name, 'tickets_per_sec',
+                               base['tickets_per_sec'],
+                               result['tickets_per_sec']))
+            # the p99 of a few samples is their max, too noisy to compare
+            if result['samples'] >= 100 and \
+                    result['p99_ms'] > base['p99_ms']*(1+threshold):
+                failed.append((suite, name, 'p99_ms',
+                               base['p99_ms'], result['p99_ms']))
+    return failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--data', type=Path,
+                        default=Path('../data/input_data.xlsx'))
+    parser.add_argument('--sample', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--out', type=Path, default=None,
+                        help='the json file to save the results to')
+    parser.add_argument('--baseline', type=Path, default=None,
+                        help='the json results to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='the allowed regression, as a fraction')
+    args = parser.parse_args(argv)
+
+    texts = load_tickets(args.data, args.sample, args.seed)
+    results = {'tickets': run(texts, args.repeat),
+               # the pathological tickets backtrack for minutes
+               # through the handlers not wrapped in SafeHandler
+               'pathological': run([text for _, text in
+                                    pathological_tickets()],
+                                   args.repeat, safe=True)}
+    for suite, cases_ in results.items():
+        print(f'\n{suite}')
+        print(f'{"case":<26}{"tickets/s":>12}{"p50 ms":>10}'
+              f'{"p99 ms":>10}{"peak kb":>10}')
+        for name, res in cases_.items():
+            print(f'{name:<26}{res["tickets_per_sec"]:>12.1f}'
+                  f'{res["p50_ms"]:>10.3f}{res["p99_ms"]:>10.3f}'
+                  f'{res["peak_kb"]:>10.1f}')
+    if args.out is not None:
+        with open(args.out, 'w') as fp:
+            json.dump({'sample': args.sample, 'seed': args.seed,
+                       'results': results}, fp, indent=2)
+
+    if args.baseline is not None and check_file_exists(args.baseline):
+        with open(args.baseline, 'r') as fp:
+            baseline = json.load(fp)['results']
+        failed = regressions(results, baseline, args.threshold)
+        for suite, name, metric, base, value in failed:
+            print(f'REGRESSION {suite}/{name} {metric}: {base} -> {value}')
+        if failed:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,164 @@
+import random
+
+import numpy as np
+
+
+class BucketBatcher:
+    '''
+    Batches the token sequences sorted by their length and pads each
+    batch only to its longest sequence (capped at max_len), instead of
+    padding every ticket to the global max_len. The predictions are
+    returned in the input order.
+    The models flattening the sequence axis (Flatten after Embedding)
+    need the global max_len, the Conv1D/LSTM/pooling stacks and BERT
+    take any batch length
+    eg: batcher = BucketBatcher(batch_size=64, max_len=100)
+        probs = batcher.predict(model.predict, sequences)
+        print(batcher.padding_report([len(seq) for seq in sequences]))
+    '''
+
+    def __init__(self, batch_size=64, max_len=None, shuffle=False,
+                 seed=7, pad_value=0):
+        self.batch_size = batch_size
+        self.max_len = max_len
+        self.shuffle = shuffle
+        self.pad_value = pad_value
+        self.rng = random.Random(seed)
+
+    def clip(self, length):
+        return length if self.max_len is None else min(length, self.max_len)
+
+    def index_batches(self, lengths):
+        '''
+        Given the sequence lengths, returns the lists of index of each
+        batch, the sequences of a batch having neighbouring lengths.
+        When shuffle, the batches are shuffled and so are the sequences
+        of the same length, for training
+        eg: Input = [5, 1, 3, 2], batch_size = 2
+            Output = [[1, 3], [2, 0]]
+        '''
+        keys = [self.clip(length) for length in lengths]
+        order = list(range(len(keys)))
+        if self.shuffle:
+            self.rng.shuffle(order)
+        # a stable sort keeps the shuffled order within a length
+        order.sort(key=lambda idx: keys[idx])
+        batches = [order[start:start+self.batch_size]
+                   for start in range(0, len(order), self.batch_size)]
+        if self.shuffle:
+            self.rng.shuffle(batches)
+        return batches
+
+    def pad(self, sequences):
+        '''
+        Pads and truncates the sequences at the end to the longest one,
+        same as pad_sequences(padding='post', truncating='post')
+        eg: Input = [[1, 2, 3], [4]]
+            Output = [[1, 2, 3], [4, 0, 0]]
+        '''
+        width = self.clip(max((len(seq) for seq in sequences), default=0))
+        padded = np.full((len(sequences), width), self.pad_value,
+                         dtype=np.int32)
+        for row, seq in enumerate(sequences):
+            seq = seq[:width]
+            padded[row, :len(seq)] = seq
+        return padded
+
+    def batches(self, sequences):
+        '''Yields the (index, padded batch) of the bucketed sequences'''
+        for indices in self.index_batches([len(seq) for seq in sequences]):
+            yield indices, self.pad([sequences[idx] for idx in indices])
+
+    def predict(self, predict_fn, sequences):
+        '''
+        Runs predict_fn on each padded batch and returns the stacked
+        outputs in the order of the sequences
+        '''
+        outputs = [None]*len(sequences)
+        for indices, padded in self.batches(sequences):
+            for idx, output in zip(indices, predict_fn(padded)):
+                outputs[idx] = output
+        return np.asarray(outputs)
+
+    def keras_sequence(self, sequences, y):
+        '''
+        Returns a keras Sequence of the bucketed (padded, y) batches to
+        pass to model.fit, reshuffled every epoch when shuffle
+        '''
+        from tensorflow.keras.utils import Sequence
+
+        batcher = self
+        y = np.asarray(y)
+        lengths = [len(seq) for seq in sequences]
+
+        class BucketSequence(Sequence):
+            def __init__(self):
+                super().__init__()
+                self.index = batcher.index_batches(lengths)
+
+            def __len__(self):
+                return len(self.index)
+
+            def __getitem__(self, idx):
+                indices = self.index[idx]
+                return (batcher.pad([sequences[i] for i in indices]),
+                        y[indices])
+
+            def on_epoch_end(self):
+                if batcher.shuffle:
+                    self.index = batcher.index_batches(lengths)
+
+        return BucketSequence()
+
+    def collate(self, items):
+        '''
+        The collate_fn of a torch DataLoader over the bucketed batches of
+        the BERT encodings, given the items as dicts of input_ids,
+        attention_mask and labels lists, returns the dict of the padded
+        tensors
+        eg: encodings = tokenizer.batch_encode_plus(texts, truncation=True,
+                                                    max_length=256)
+            items = [{'input_ids': ids, 'attention_mask': mask, 'labels': y}
+                     for ids, mask, y in zip(encodings['input_ids'],
+                                             encodings['attention_mask'],
+                                             labels)]
+            lengths = [len(ids) for ids in encodings['input_ids']]
+            DataLoader(items, batch_sampler=batcher.index_batches(lengths),
+                       collate_fn=batcher.collate)
+        '''
+        import torch
+
+        batch = {}
+        for key in items[0]:
+            values = [item[key] for item in items]
+            if isinstance(values[0], (list, tuple, np.ndarray)):
+                batch[key] = torch.tensor(self.pad(values), dtype=torch.long)
+            else:
+                batch[key] = torch.tensor(values)
+        return batch
+
+    def padding_report(self, lengths):
+        '''
+        Returns the share of padding tokens when padding to the global
+        max_len and when bucketing, and the padding tokens saved
+        eg: Input = [2, 100, 3, 98], batch_size = 2, max_len = 100
+            Output = {'global_pad_ratio': 0.4925, ...}
+        '''
+        lengths = sorted(self.clip(length) for length in lengths)
+        tokens = sum(lengths)
+        width = self.max_len or max(lengths, default=0)
+        global_slots = width*len(lengths)
+        # the batches of index_batches, the shuffling changes neither their
+        # lengths nor their padding, so the rng of the training is left as is
+        bucket_slots = sum(len(batch)*batch[-1] for batch in
+                           (lengths[start:start+self.batch_size]
+                            for start in range(0, len(lengths),
+                                               self.batch_size)))
+        return {'tokens': tokens,
+                'global_slots': global_slots,
+                'bucket_slots': bucket_slots,
+                'global_pad_ratio': round(1-tokens/global_slots, 4)
+                if global_slots else 0.0,
+                'bucket_pad_ratio': round(1-tokens/bucket_slots, 4)
+                if bucket_slots else 0.0,
+                'padding_saved': global_slots-bucket_slots}
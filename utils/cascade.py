@@ -0,0 +1,142 @@
+import time
+
+import numpy as np
+
+
+class LinearGate:
+    '''
+    The cheap first stage of the cascade, a tf-idf logistic regression
+    scoring the probability of a ticket being GRP_0
+    '''
+
+    def __init__(self, positive='GRP_0', max_features=50000):
+        from sklearn.linear_model import LogisticRegression
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        self.positive = positive
+        self.vectorizer = TfidfVectorizer(ngram_range=(1, 2), min_df=2,
+                                          max_features=max_features,
+                                          sublinear_tf=True)
+        self.model = LogisticRegression(max_iter=1000)
+
+    def fit(self, texts, labels):
+        y = np.asarray([str(label) == self.positive for label in labels])
+        self.model.fit(self.vectorizer.fit_transform(texts), y)
+        return self
+
+    def __call__(self, texts):
+        '''Returns the probability of each text being the positive group'''
+        return self.model.predict_proba(self.vectorizer.transform(texts))[:, 1]
+
+
+def binary_gate(model, features):
+    '''
+    Returns the gate of the "Binary Classifier DL Models" keras model,
+    its sigmoid is the probability of the LabelEncoder class 1 ('Other'
+    sorts after 'Group 0'), features turns the texts into its input
+    eg: binary_gate(load_model('model_1.h5'), TicketClassifier(...).features)
+    '''
+    def gate(texts):
+        return 1 - np.asarray(model.predict(features(texts))).ravel()
+    return gate
+
+
+def calibrate_threshold(probs, labels, positive='GRP_0', precision=0.97):
+    '''
+    Given the gate probabilities and the true groups of a held-out set,
+    returns the lowest threshold whose early exits are positive with at
+    least the given precision, and the share of tickets it exits
+    eg: Input = probs = [0.99, 0.95, 0.9, 0.4], labels = [GRP_0, GRP_0,
+                GRP_8, GRP_0], precision = 0.95
+        Output = (0.95, 0.5)
+    '''
+    probs = np.asarray(probs)
+    hits = np.asarray([str(label) == positive for label in labels])
+    order = np.argsort(-probs, kind='stable')
+    precisions = np.cumsum(hits[order]) / np.arange(1, len(order)+1)
+    # the exits of a threshold are the tickets scored at least as high
+    best = None
+    for idx in range(len(order)):
+        last_of_tie = idx == len(order)-1 or \
+            probs[order[idx+1]] < probs[order[idx]]
+        if last_of_tie and precisions[idx] >= precision:
+            best = idx
+    if best is None:
+        return 1.0 + 1e-9, 0.0
+    return float(probs[order[best]]), (best+1)/len(order)
+
+
+class CascadeClassifier:
+    '''
+    Returns the positive group (GRP_0) for the tickets the cheap gate
+    scores at or above threshold, and runs the expensive all-classes
+    predict_fn only on the rest
+    eg: gate = LinearGate().fit(train_texts, train_groups)
+        threshold, _ = calibrate_threshold(gate(val_texts), val_groups)
+        full = TicketClassifier()
+        cascade = CascadeClassifier(
+            gate, lambda texts: [group for group, _ in full.predict(texts)],
+            threshold)
+        groups = cascade.predict(texts)
+    '''
+
+    def __init__(self, gate, predict_fn, threshold, positive='GRP_0'):
+        self.gate = gate
+        self.predict_fn = predict_fn
+        self.threshold = threshold
+        self.positive = positive
+        self.tickets = 0
+        self.exits = 0
+        self.seconds = [0.0, 0.0]
+
+    def predict(self, texts, return_stage=False):
+        '''
+        Returns the group of each text, and the stage (1 for the early
+        exits, 2 for the full model) when return_stage
+        '''
+        texts = list(texts)
+        began = time.perf_counter()
+        exits = np.asarray(self.gate(texts)) >= self.threshold
+        self.seconds[0] += time.perf_counter() - began
+
+        groups = np.empty(len(texts), dtype=object)
+        groups[exits] = self.positive
+        rest = np.flatnonzero(~exits)
+        if len(rest):
+            began = time.perf_counter()
+            groups[rest] = list(self.predict_fn([texts[idx]
+                                                 for idx in rest]))
+            self.seconds[1] += time.perf_counter() - began
+        self.tickets += len(texts)
+        self.exits += int(exits.sum())
+        stages = np.where(exits, 1, 2)
+        return (groups, stages) if return_stage else groups
+
+    def evaluate(self, texts, labels):
+        '''
+        Returns the early exit rate, the accuracy of each stage and of
+        the cascade, and the time of each stage for the labeled texts
+        '''
+        labels = np.asarray([str(label) for label in labels], dtype=object)
+        seconds = list(self.seconds)
+        groups, stages = self.predict(texts, return_stage=True)
+        correct = groups == labels
+        report = {'tickets': len(labels),
+                  'early_exit_rate': round(float(np.mean(stages == 1)), 4),
+                  'accuracy': round(float(np.mean(correct)), 4)}
+        for stage in (1, 2):
+            mask = stages == stage
+            report[f'stage_{stage}_tickets'] = int(mask.sum())
+            report[f'stage_{stage}_accuracy'] = \
+                round(float(np.mean(correct[mask])), 4) if mask.any() else None
+            report[f'stage_{stage}_seconds'] = \
+                round(self.seconds[stage-1] - seconds[stage-1], 4)
+        return report
+
+    def stats(self):
+        return {'tickets': self.tickets,
+                'exits': self.exits,
+                'early_exit_rate': self.exits/self.tickets
+                if self.tickets else 0.0,
+                'gate_seconds': self.seconds[0],
+                'full_seconds': self.seconds[1]}
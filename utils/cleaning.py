@@ -0,0 +1,259 @@
+import re
+from string import ascii_letters, digits
+from functools import lru_cache
+
+from utils import fold_chars
+from log_template import LogTemplates, TEMPLATES_PATH
+from vocab_index import load_vocab
+
+EMAIL = re.compile(r'\S+@\S+')
+# the "sent:" lines only hold the date of the forwarded mail
+SENT_LINE = re.compile(r'(?im)^[ \t]*sent[ \t]*:.*$')
+MAIL_HEADER = re.compile(r'(?im)\b(?:received from|from|to|cc|bcc|subject)'
+                         r'[ \t]*:')
+LINE_BREAK = re.compile(r'_x000D_|\r')
+IRRELEVANT = re.compile(r'(?i)\b(?:hello|hi|dear|greetings|good (?:morning|'
+                        r'afternoon|evening))\b(?:[ \t]+team)?[ \t]*[,!.]?|'
+                        r'\b(?:(?:kind|best|warm)[ \t]+regards|regards|'
+                        r'thanks(?: and regards)?|thank you)\b[ \t]*[,!.]?')
+ANCHOR = re.compile(r'(?i)\b(?:https?://|ftp://|www\.)\S+')
+HTML_TAG = re.compile(r'<[^<>]+>')
+SPECIAL = re.compile(r'[^A-Za-z0-9\s]')
+NUMBER = re.compile(r'\b\d+\b')
+NON_ASCII = re.compile(r'[^\x00-\x7f]+')
+# the leftovers of the mojibake once its non-ascii chars are blanked
+MOJIBAKE_LEFTOVER = re.compile(r'(?i)xd')
+
+SECURITY_LOG_WORDS = re.compile(r'\b(?:source|ip|hostname|mac|events|'
+                                r'yes / no)\b')
+
+CLEAN, SUSPECT, NON_LATIN = 'clean', 'suspect', 'non_latin'
+# a utf-8 lead byte followed by a continuation byte, both decoded as
+# cp1252 (latin-1 for the bytes cp1252 leaves undefined), is mojibake
+CONTINUATION = ''.join(bytes([byte]).decode('cp1252', errors='ignore') or
+                       chr(byte) for byte in range(0x80, 0xc0))
+TEXT_PATH = re.compile('([\u00c2-\u00f4][{}]|\ufffd)|'
+                       '([^\u0000-\u024f\u1e00-\u1eff\u2000-\u214f])'
+                       .format(re.escape(CONTINUATION)))
+
+
+class GibberishTable(dict):
+    '''
+    The translation table of clean_gibberish, keeping the ascii letters
+    and digits and the non-ascii chars (left to strip_mojibake), spelling
+    out '&' and blanking the rest
+    '''
+
+    def __missing__(self, code):
+        return ' ' if code < 128 else code
+
+
+GIBBERISH_TABLE = GibberishTable({ord(char): char
+                                  for char in ascii_letters + digits})
+GIBBERISH_TABLE[ord('&')] = 'and'
+
+
+def fix_encoding(text: str) -> str:
+    '''Fixes the mojibake of the text with ftfy'''
+    import ftfy
+
+    return ftfy.fix_text(text)
+
+
+@lru_cache(maxsize=None)
+def security_log_templates(path=TEMPLATES_PATH) -> LogTemplates:
+    '''The alert skeletons fit and saved by log_template.py'''
+    return LogTemplates.load(path)
+
+
+def security_log_template(text) -> str:
+    '''Returns the template id of a security log alert, None otherwise'''
+    if not isinstance(text, str):
+        return None
+    return security_log_templates().compress(text)[0]
+
+
+def remov_duplicates(text: str) -> str:
+    '''
+    Removes the repeated words of the text, keeping the first occurrence
+    eg: remov_duplicates("deny udp deny tcp") -> "deny udp tcp"
+    '''
+    output = []
+    seen = set()
+    for word in text.split():
+        if word not in seen:
+            output.append(word)
+            seen.add(word)
+    return ' '.join(output)
+
+
+def clean_security_fields(text: str) -> str:
+    '''
+    Strips the numbers, separators and field names of a security log
+    alert, the rest is kept
+    '''
+    text = text.replace('\n', ' ').replace('\r', '')
+    text = re.sub(r'((:)?\s?\d+(.|:)?)+', '', text)
+    text = re.sub('(_x000D_|_x_|_x|x_)', '', text)
+    text = re.sub(r'(\[|\]|(\-)+|(\=)+|\%|\,|\"|\:|\(|\))?', '', text)
+    text = SECURITY_LOG_WORDS.sub('', text)
+    return remov_duplicates(text)
+
+
+def clean_security_logs(text: str) -> str:
+    '''
+    Replaces the security log alerts (the tickets starting with "source
+    ip") with their canonical event summary, protocol and action followed
+    by their free text, the alerts without any of the three fields are
+    stripped of their numbers, separators and field names instead. The
+    other tickets are kept
+    eg: Input = "source ip: 10.16.90.249 ... event summary: internal "
+                "outbreak for 137/udp ... protocol: udp ... action: blocked"
+        Output = "internal outbreak for 137/udp udp blocked"
+    '''
+    template, canonical = security_log_templates().compress(text)
+    if template is not None and not canonical:
+        return clean_security_fields(text)
+    return canonical
+
+
+def clean_emails(text: str) -> str:
+    '''
+    Removes the email addresses and the headers of the forwarded mails,
+    the subject text is kept
+    eg: Input = "received from: john.doe@gmail.com subject: vpn issue"
+        Output = "  vpn issue"
+    '''
+    text = SENT_LINE.sub('', text)
+    text = MAIL_HEADER.sub('', text)
+    return EMAIL.sub('', text)
+
+
+def strip_irrelevant(text: str) -> str:
+    '''Removes the _x000D_ line breaks, the greetings and the sign offs'''
+    return IRRELEVANT.sub('', LINE_BREAK.sub(' ', text))
+
+
+def strip_anchors(text: str) -> str:
+    '''Removes the urls'''
+    return ANCHOR.sub(' ', text)
+
+
+def strip_callers(text: str, caller: str = '') -> str:
+    '''
+    Removes the words of the caller name from the text
+    eg: Input = "hmjdrvpb komuaywn cannot login", "hmjdrvpb komuaywn"
+        Output = "  cannot login"
+    '''
+    if not isinstance(caller, str) or not caller.strip():
+        return text
+    return caller_pattern(caller).sub('', text)
+
+
+@lru_cache(maxsize=4096)
+def caller_pattern(caller: str):
+    # the callers raise several tickets each, their pattern is reused
+    return re.compile(r'(?i)\b(?:{})\b'.format(
+        '|'.join(map(re.escape, caller.split()))))
+
+
+def clean_html_tags(text: str) -> str:
+    '''Removes the html tags and unescapes the html entities'''
+    from html import unescape
+
+    return unescape(HTML_TAG.sub(' ', text))
+
+
+def replace_accented(text: str) -> str:
+    '''Replaces the accented and sub/superscript chars, drops non-ascii'''
+    return fold_chars(text)
+
+
+def clean_contractions(text: str) -> str:
+    '''Expands the contractions, eg: "can't login" -> "cannot login"'''
+    import contractions
+
+    return contractions.fix(text)
+
+
+def remove_special(text: str) -> str:
+    return SPECIAL.sub(' ', text)
+
+
+def text_path(text: str) -> str:
+    '''
+    Returns the cleaning path of the text in a single scan: SUSPECT when
+    it holds mojibake (or replacement chars) for ftfy and strip_mojibake,
+    NON_LATIN when it holds chars outside the Latin scripts and
+    CLEAN otherwise
+    eg: text_path("unable to login") -> 'clean'
+        text_path("password reset å½“å‰") -> 'suspect'
+        text_path("密码重置") -> 'non_latin'
+    '''
+    if text.isascii():
+        return CLEAN
+    path = CLEAN
+    for match in TEXT_PATH.finditer(text):
+        if match.group(1):
+            return SUSPECT
+        path = NON_LATIN
+    return path
+
+
+def clean_gibberish(text: str) -> str:
+    '''
+    Lowercases the text, drops the '#', spells out '&', blanks the ascii
+    chars other than letters and digits and removes the isolated single
+    letters, the sequential re.sub calls of the data cleaning notebook
+    fused in a translate and a pass over the words. The non-ascii chars
+    and the 'xd' leftovers of the mojibake are stripped before it, on the
+    suspects only, by strip_mojibake
+    eg: clean_gibberish("Outlook #crash & a b c-d") -> "outlook crash and b d"
+    '''
+    words = text.lower().replace('#', '').replace('&;', '&') \
+        .translate(GIBBERISH_TABLE).split()
+    kept = []
+    removed = False
+    last = len(words) - 1
+    for idx, word in enumerate(words):
+        # re.sub(r"\s+[a-zA-Z]\s+", ' ') consumes the space after a
+        # removed letter, the next word is always kept
+        if not removed and 0 < idx < last and len(word) == 1 and \
+                word.isalpha():
+            removed = True
+            continue
+        removed = False
+        kept.append(word)
+    return ' '.join(kept)
+
+
+def strip_mojibake(text: str) -> str:
+    '''
+    Blanks the non-ascii chars and removes the 'xd' leftovers of the
+    mojibake, run on the text_path suspects only, before replace_accented
+    would fold the mojibake into ascii letters
+    eg: strip_mojibake("Outlook fÃ¼r ÃxdÃ©") -> "Outlook f r"
+    '''
+    return ' '.join(MOJIBAKE_LEFTOVER.sub('', NON_ASCII.sub(' ', text))
+                    .split())
+
+
+def strip_stopwords(text: str) -> str:
+    return load_vocab('stopwords').filter(text, keep=False)
+
+
+def clean_oov(text: str) -> str:
+    '''strips out words that are outside the given vocabulary'''
+    return load_vocab('words').filter(text, keep=True)
+
+
+def clean_whitespace(text: str) -> str:
+    return ' '.join(text.split())
+
+
+def lower(text: str) -> str:
+    return text.lower()
+
+
+def strip_numbers(text: str) -> str:
+    return NUMBER.sub(' ', text)
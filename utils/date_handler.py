@@ -1,10 +1,15 @@
 import re
+import time
 from pathlib import Path
 
+from token_index import TokenIndex, tagged_index
+from pattern_profiler import PatternProfiler
+from deadline_scan import scan
+
 exceptions = {}
 
 class DateHandler:
-    def __init__(self):
+    def __init__(self, profile=False):
         self.patterns = []
         short = 'jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec|0ct|n0v'
         long = 'january|february|march|april|may|june|july|august|september' \
@@ -81,6 +86,34 @@ class DateHandler:
 
         patterns = [re.compile(pattern) for pattern in patterns]
         self.patterns = patterns
+        self.pattern_names = ['day_mon_year', 'mon_day_year',
+                              'day_mm_year', 'mm_day_year', 'year_mm_day',
+                              'day_sep_mon_year', 'day_day_mon_year',
+                              'daymonyear', 'day_th_mon_year', 'day_mm',
+                              'mm_day']
+        # records the time, matches and tags of each pattern if profiling
+        self.profiler = PatternProfiler(self.pattern_names) \
+            if profile else None
+        # the perf_counter time after which the scan stops, the matches
+        # found before it are kept and timed_out is set
+        self.deadline = None
+        self.timed_out = False
+
+        # the chars the matches of each pattern can start with, so the
+        # positions where a pattern can't match are skipped upfront
+        day_start = r'(?=(?:\s|^)(?:\d|o[1-9]))'
+        mon_start = f'(?=(?:\\s|^)(?:{short}))'
+        self.guards = [day_start, mon_start, day_start,
+                       r'(?=(?:\s|^)\d)', r'(?=(?:\s|^)[12])',
+                       day_start, day_start, day_start, day_start,
+                       day_start, f'(?=(?:\\s|^)(?:{short}|\\d))']
+
+        # the literals every match holds: a digit, and a day, month or
+        # month name after a whitespace, the tickets missing any skip
+        # the patterns
+        self.prefilters = [re.compile(r'\d'),
+                           re.compile(f'(?:\\s|^)(?:\\d|o[1-9]|{short})')]
+        self.skipped = 0
 
     def get_tok_indexlist(self, token_list):
         '''
@@ -115,62 +148,77 @@ class DateHandler:
 
     def find_date_regex(self, text):
         dates = list()
-        for _, pattern in enumerate(self.patterns):
-            matches = re.finditer(pattern, text)
+        self.timed_out = False
+        for idx, pattern in enumerate(self.patterns):
+            began = time.perf_counter()
+            matches = []
+            try:
+                matches.extend(scan(pattern, text, self.deadline))
+            except TimeoutError:
+                self.timed_out = True
+            if self.profiler is not None:
+                self.profiler.record(idx, time.perf_counter()-began,
+                                     [(match.start(), match.end()-1)
+                                      for match in matches])
             for match in matches:
                 dates.extend([(match.start(),
                               match.end()-1,
                               match.group(0).strip())])
+            if self.timed_out:
+                break
         return dates
 
-    def return_date_index(self, matches, tags_list, char_map):
+    def return_date_index(self, matches, tags_list, tok_index):
         '''
-        Given the matched groups,token_list,token_tags,char_mapping,
+        Given the matched groups,token_list,token_tags,tok_index,
         extract the index of the tags_list to be qualified as DATE for SPV
         '''
         words_include = []
-        existing_tags_index = []
         for match in matches:
-            start = match[0]
-            end = match[1]
-            include = list(range(start, end, 1))
-            words = list(set(
-                [value for key, value in char_map.items() if key in include]))
-            words_include.extend(words)
-        existing_tags_index = [idx for idx,
-                               tag in enumerate(tags_list) if tag != "O"]
-        words_include_filtered = [
-            i for i in words_include if i not in existing_tags_index]
+            words_include.extend(
+                tok_index.span_tokens(match[0], match[1]))
+        existing_tags_index = tagged_index(tags_list)
+        words_include_filtered = [i for i in words_include
+                                  if i not in existing_tags_index]
         return words_include_filtered
 
+    def index_matches(self, matches, tok_index, token_list, tags_list):
+        '''
+        Given the matches from find_date_regex, return the sorted unique
+        index of the tags_list to be qualified as DATE
+        '''
+        date_indices = self.return_date_index(matches, tags_list,
+                                              tok_index)
+        return sorted(list(set(date_indices)))
+
     def match_ref(self, text, token_list, tags_list, entity='', verbose=False):
         date_indices = []
+        tok_index = None
         text = text.strip().lower()
         if any(exp in text for exp in exceptions):
-            return date_indices
-        if text and not text.isspace():
+            pass
+        elif not all(p.search(text) for p in self.prefilters):
+            self.skipped += 1
+        elif text and not text.isspace():
             matches = self.find_date_regex(text)
             if len(matches) > 0:
-                char_map = self.char_mapping(token_list)
-                date_indices = self.return_date_index(
-                    matches, tags_list, char_map)
-                date_indices = sorted(list(set(date_indices)))
+                tok_index = TokenIndex(token_list)
+                date_indices = self.index_matches(matches, tok_index,
+                                                  token_list, tags_list)
             if verbose and len(date_indices) > 0:  # pragma: no cover <--
                 print(f'\nFinal Matches {entity}: '
                       f'{[token_list[idx] for idx in date_indices]}\n')
+        if self.profiler is not None:
+            # every ticket counts, the skipped ones included
+            self.profiler.credit(tok_index, date_indices)
         return date_indices
 
 
 if __name__ == '__main__':
-    import spacy
-    nlp = spacy.load('en_core_web_sm')
+    from tokenize_stage import tokenize_records
 
     test = "501,002MT"
-    doc = nlp(test)
-    toks = [t.text for t in doc]
-    toks = [t.strip() for t in toks]
-    text = " ".join(toks)
-    tags = ['O']*len(doc)
+    text, toks, tags = next(tokenize_records([test]))
     tag = "DATE"
     date_hdlr = DateHandler()
     date_indices = date_hdlr.match_ref(text, toks, tags,
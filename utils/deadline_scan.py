@@ -0,0 +1,46 @@
+import time
+
+# the chars scanned between two checks of the deadline
+WINDOW = 1024
+# the chars past its end the scan of a window sees, longer than any match
+# of the handlers once SafeHandler masked the runs over max_token_len
+OVERLAP = 1024
+
+
+def scan(pattern, text, deadline=None, window=WINDOW, overlap=OVERLAP):
+    '''
+    Yields the matches of pattern.finditer(text). Given a deadline, the
+    text is scanned window by window, each scan seeing overlap chars past
+    the end of its window so the matches starting in it are whole, and
+    TimeoutError is raised before the first window starting past the
+    deadline. Python's re can't be interrupted inside a scan, so the time
+    spent past the deadline is bounded by the scan of one window, even
+    when the pattern backtracks without matching. $ and \\b also match at
+    the end of the chars a scan sees, so a match ending there is taken
+    again from its start on the whole text
+    eg: Input = re.compile(r'\\d+'), "call 273 7924", window = 6
+        Output = [<re.Match span=(5, 8) '273'>,
+                  <re.Match span=(9, 13) '7924'>]
+    '''
+    if deadline is None:
+        yield from pattern.finditer(text)
+        return
+    pos = 0
+    for start in range(0, max(len(text), 1), window):
+        if time.perf_counter() > deadline:
+            raise TimeoutError('The scan ran past the deadline')
+        end = start + window
+        pos = max(pos, start)
+        limit = end + overlap
+        while pos <= len(text):
+            match = pattern.search(text, pos, limit)
+            if match is None or match.start() >= end:
+                break
+            if match.end() == limit < len(text):
+                match = pattern.search(text, match.start())
+                if match is None or match.start() >= end:
+                    break
+            yield match
+            # the next search resumes after the end of this match
+            pos = match.end() if match.end() > match.start() else \
+                match.start() + 1
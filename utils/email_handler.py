@@ -5,6 +5,9 @@ Almost perfect email regex: https://emailregex.com
 '''
 import re
 
+from token_index import TokenIndex, tagged_index
+from deadline_scan import scan
+
 email_regex = r'(?:[a-z0-9!#$%&\'*+/=?^_`{|}~-]+' \
               r'(?:\.[a-z0-9!#$%&\'*+/=?^_`{|}~-]+)*|' \
               r'"(?:[\x01-\x08\x0b\x0c\x0e-\x1f\x21\x23-\x5b\x5d-\x7f]|' \
@@ -22,6 +25,17 @@ class EmailHandler:
 
     def __init__(self):
         self.pattern = re.compile(email_regex)
+        # the matches start with a quoted name or the chars of the name
+        # followed by the @
+        self.guard = r'(?=[a-z0-9!#$%&\'*+/=?^_`{|}~.-]*@|")'
+        # the literals every match holds, the tickets missing any skip
+        # the pattern
+        self.prefilters = [re.compile(r'@')]
+        self.skipped = 0
+        # the perf_counter time after which the scan stops, the matches
+        # found before it are kept and timed_out is set
+        self.deadline = None
+        self.timed_out = False
 
     def get_tok_indexlist(self, token_list):
         '''
@@ -56,43 +70,52 @@ class EmailHandler:
 
     def find_email_regex(self, text):
         emails = list()
-        matches = re.finditer(self.pattern, text.lower())
-        for match in matches:
-            emails.extend([(match.end()-1,
-                            100,
-                            match.start()-1,
-                            match.group(0).strip())])
+        self.timed_out = False
+        matches = scan(self.pattern, text.lower(), self.deadline)
+        try:
+            for match in matches:
+                emails.extend([(match.end()-1,
+                                100,
+                                match.start()-1,
+                                match.group(0).strip())])
+        except TimeoutError:
+            self.timed_out = True
         return emails
 
-    def return_email_index(self, matches, char_map, tags_list):
+    def return_email_index(self, matches, tok_index, tags_list):
         '''
-        Given the matched groups,token_list,token_tags,char_mapping, extract
+        Given the matched groups,token_list,token_tags,tok_index, extract
         index of the tags_list to be qualified as MAIL for SPV
         '''
         words_include = []
         for match in matches:
-            start = match[2]
-            end = match[0]
-            include = list(range(start, end, 1))
-            words = list(
-                set([value for key, value in char_map.items()
-                     if key in include]))
-            words_include.extend(words)
-        existing_tags_index = [idx for idx, tag in
-                               enumerate(tags_list) if tag != "O"]
+            words_include.extend(
+                tok_index.span_tokens(match[2], match[0]))
+        existing_tags_index = tagged_index(tags_list)
         words_include_filtered = [i for i in words_include
                                   if i not in existing_tags_index]
         return words_include_filtered
 
+    def index_matches(self, matches, tok_index, token_list, tags_list):
+        '''
+        Given the matches from find_email_regex, return the index of the
+        tags_list to be qualified as MAIL
+        '''
+        return self.return_email_index(matches, tok_index, tags_list)
+
     def match_ref(self, text, token_list, tags_list,
                   entity='MAIL', verbose=False):
         email_indices = []
         text = text.strip().lower()
+        if not all(p.search(text) for p in self.prefilters):
+            self.skipped += 1
+            return email_indices
 
         matches = self.find_email_regex(text)
         if len(matches) > 0:
-            char_map = self.char_mapping(token_list)
-            email_indices = self.return_email_index(matches, char_map, tags_list)
+            tok_index = TokenIndex(token_list)
+            email_indices = self.index_matches(matches, tok_index,
+                                               token_list, tags_list)
             if verbose and len(email_indices) > 0:  # pragma: no cover <--
                 print(f'\nFinal Matches {entity}: '
                       f'{[token_list[idx] for idx in email_indices]}\n')
@@ -100,16 +123,11 @@ class EmailHandler:
 
 
 if __name__ == '__main__':
-    import spacy
     from pprint import pprint
-    nlp = spacy.load('en_core_web_sm')
+    from tokenize_stage import tokenize_records
 
     test = "mailto: john.doe@gmail.com from: jane.doe@outlook.com"
-    doc = nlp(test)
-    toks = [t.text for t in doc]
-    toks = [t.strip() for t in toks]
-    text = " ".join(toks)
-    tags = ['O']*len(doc)
+    text, toks, tags = next(tokenize_records([test]))
     tag = "MAIL"
     email_hdlr = EmailHandler()
     email_indices = email_hdlr.match_ref(text, toks, tags,
@@ -0,0 +1,182 @@
+import json
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+from utils import check_file_exists, check_folder_exists, load_json
+
+
+def read_vectors(path: Path):
+    '''
+    Yields the (word, vector string fields) of a glove or word2vec text
+    file, the words of glove.840B holding spaces are kept whole
+    '''
+    with open(path, 'r', encoding='utf-8', errors='replace') as fp:
+        first = fp.readline().rstrip('\n').split(' ')
+        # the word2vec files start with a "count dim" header
+        if len(first) == 2 and all(field.isdigit() for field in first):
+            dim = int(first[1])
+        else:
+            dim = len(first) - 1
+            yield ' '.join(first[:-dim]), first[-dim:]
+        for line in fp:
+            fields = line.rstrip('\n').rstrip(' ').split(' ')
+            if len(fields) <= dim:
+                continue
+            yield ' '.join(fields[:-dim]), fields[-dim:]
+
+
+def slot_of(word: bytes, mask: int) -> int:
+    return zlib.crc32(word) & mask
+
+
+def convert_embeddings(path: Path, out_dir=None, dtype='float32'):
+    '''
+    Converts a word vectors text file once into out_dir (default: the
+    file name without suffix next to it) holding the vectors as a .npy
+    matrix to memory map, the utf-8 words concatenated with their
+    offsets, and an open addressing hash table of the rows, so a lookup
+    reads a few bytes of the mapped files instead of a dict of the whole
+    vocabulary. Returns out_dir
+    '''
+    path = Path(path)
+    if check_file_exists(path):
+        out_dir = Path(out_dir) if out_dir else path.with_suffix('')
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    rows, dim = 0, None
+    for _, vector in read_vectors(path):
+        rows += 1
+        dim = dim or len(vector)
+    vectors = np.lib.format.open_memmap(out_dir / 'vectors.npy', mode='w+',
+                                        dtype=dtype, shape=(rows, dim))
+    offsets = np.zeros(rows+1, dtype=np.int64)
+    size = 1 << max(1, (2*rows-1).bit_length())
+    table = np.full(size, -1, dtype=np.int32)
+    mask = size - 1
+    # the words are only held in memory during the conversion, to skip
+    # the duplicated words, the first occurrence wins
+    seen = set()
+    with open(out_dir / 'words.bin', 'wb') as words:
+        for row, (word, vector) in enumerate(read_vectors(path)):
+            if row == rows:
+                break
+            encoded = word.encode('utf-8')
+            words.write(encoded)
+            offsets[row+1] = offsets[row] + len(encoded)
+            vectors[row] = np.asarray(vector, dtype=dtype)
+            if encoded in seen:
+                continue
+            seen.add(encoded)
+            slot = slot_of(encoded, mask)
+            while table[slot] != -1:
+                slot = (slot + 1) & mask
+            table[slot] = row
+    vectors.flush()
+    del vectors
+    np.save(out_dir / 'offsets.npy', offsets)
+    np.save(out_dir / 'table.npy', table)
+    stat = path.stat()
+    with open(out_dir / 'meta.json', 'w') as fp:
+        json.dump({'source': path.name, 'size': stat.st_size,
+                   'mtime': stat.st_mtime, 'rows': rows, 'dim': dim,
+                   'dtype': dtype}, fp, indent=2)
+    return out_dir
+
+
+class EmbeddingStore:
+    '''
+    Memory mapped word vectors converted by convert_embeddings, only the
+    pages of the looked up rows are read from disk
+    eg: store = EmbeddingStore.open(Path('data/glove.6B.200d.txt'))
+        matrix, stats = store.embedding_matrix(tokenizer.word_index,
+                                               num_words=20000)
+    '''
+
+    def __init__(self, out_dir: Path):
+        out_dir = Path(out_dir)
+        if check_folder_exists(out_dir):
+            self.meta = load_json(out_dir / 'meta.json')
+        self.vectors = np.load(out_dir / 'vectors.npy', mmap_mode='r')
+        self.offsets = np.load(out_dir / 'offsets.npy', mmap_mode='r')
+        self.table = np.load(out_dir / 'table.npy', mmap_mode='r')
+        self.words = np.memmap(out_dir / 'words.bin', dtype=np.uint8,
+                               mode='r') if self.offsets[-1] else b''
+        self.mask = len(self.table) - 1
+        self.dim = self.meta['dim']
+
+    @classmethod
+    def open(cls, path: Path, out_dir=None):
+        '''
+        Returns the store of the word vectors text file, converting it
+        when its size or modification time changed since the conversion
+        '''
+        path = Path(path)
+        out_dir = Path(out_dir) if out_dir else path.with_suffix('')
+        stat = path.stat()
+        meta_path = out_dir / 'meta.json'
+        meta = load_json(meta_path) if meta_path.is_file() else {}
+        if meta.get('size') != stat.st_size or \
+                meta.get('mtime') != stat.st_mtime:
+            convert_embeddings(path, out_dir)
+        return cls(out_dir)
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def row(self, word: str) -> int:
+        '''Returns the row of the word, -1 when out of the vocabulary'''
+        encoded = word.encode('utf-8')
+        slot = slot_of(encoded, self.mask)
+        while True:
+            row = int(self.table[slot])
+            if row == -1:
+                return -1
+            start, end = self.offsets[row], self.offsets[row+1]
+            if end - start == len(encoded) and \
+                    bytes(self.words[start:end]) == encoded:
+                return row
+            slot = (slot + 1) & self.mask
+
+    def __contains__(self, word):
+        return self.row(word) != -1
+
+    def get(self, word, default=None):
+        row = self.row(word)
+        return default if row == -1 else np.asarray(self.vectors[row])
+
+    def embedding_matrix(self, word_index, num_words=None, lower=True,
+                         top_oov=20):
+        '''
+        Given the Tokenizer.word_index, returns the (num_words, dim)
+        matrix with the vector of each word at its index (zeros for the
+        out of vocabulary words and index 0) and the OOV statistics, the
+        words not found are looked up lowercased when lower
+        eg: Input = {'password': 1, 'reset': 2, 'erp': 3}, num_words = 4
+            Output = (array of shape (4, 200),
+                      {'words': 3, 'found': 2, 'oov': 1, 'oov_rate': 0.3333,
+                       'oov_words': ['erp']})
+        '''
+        if num_words is None:
+            num_words = max(word_index.values(), default=0) + 1
+        matrix = np.zeros((num_words, self.dim), dtype=self.vectors.dtype)
+        found, oov = 0, []
+        for word, idx in sorted(word_index.items(), key=lambda kv: kv[1]):
+            if idx >= num_words:
+                continue
+            row = self.row(word)
+            if row == -1 and lower and word != word.lower():
+                row = self.row(word.lower())
+            if row == -1:
+                oov.append(word)
+                continue
+            matrix[idx] = self.vectors[row]
+            found += 1
+        words = found + len(oov)
+        return matrix, {'words': words,
+                        'found': found,
+                        'oov': len(oov),
+                        'oov_rate': round(len(oov)/words, 4)
+                        if words else 0.0,
+                        'oov_words': oov[:top_oov]}
@@ -0,0 +1,248 @@
+import re
+
+from tel_handler import TelHandler
+from date_handler import DateHandler, exceptions
+from link_handler import LinkHandler
+from email_handler import EmailHandler
+from token_index import TokenIndex
+from deadline_scan import scan
+
+
+class EntityHandler:
+    '''
+    Matches telephone numbers, dates, website links and email addresses
+    in a single scan of the text, with the results of calling the
+    TEL, DATE, LINK and MAIL handlers match_ref in sequence
+    '''
+
+    def __init__(self, order=('TEL', 'DATE', 'LINK', 'MAIL'), safe=False):
+        self.handlers = {'TEL': TelHandler(),
+                         'DATE': DateHandler(),
+                         'LINK': LinkHandler(safe=safe),
+                         'MAIL': EmailHandler()}
+        self.order = list(order)
+
+        # every pattern is wrapped in an optional lookahead with a named
+        # group, so one scan tells which patterns match at each position.
+        # The patterns sharing a guard are only tried at the positions
+        # where the guard holds
+        self.groups = []
+        self.lookaheads = {label: [] for label in self.handlers}
+        for label, handler in self.handlers.items():
+            patterns = getattr(handler, 'patterns', None) or \
+                [handler.pattern]
+            guards = getattr(handler, 'guards', None) or [handler.guard]
+            for idx, (pattern, guard) in enumerate(zip(patterns, guards)):
+                name = f'{label}_{idx}'
+                self.lookaheads[label].append(
+                    (guard, name,
+                     f'(?:(?=(?P<{name}>{self.scoped(pattern)}))|)'))
+                self.groups.append((name, label))
+
+        # the fused patterns by the labels passing the prefilters
+        self.patterns = {}
+        self.skip_counts = dict.fromkeys(self.handlers, 0)
+        self.ticket_count = 0
+        # the perf_counter time after which the scan stops, the spans
+        # found before it are kept and timed_out is set
+        self.deadline = None
+        self.timed_out = False
+
+    def fused_pattern(self, labels):
+        '''
+        Returns the compiled pattern fusing the patterns of the labels,
+        the guards of the patterns starting after a whitespace are only
+        tried at the whitespaces
+        '''
+        labels = tuple(labels)
+        if labels in self.patterns:
+            return self.patterns[labels]
+        blocks = {'ws': {}, 'any': {}}
+        names = {'ws': [], 'any': []}
+        for label in labels:
+            for guard, name, lookahead in self.lookaheads[label]:
+                gate = 'ws' if guard == '^' or \
+                    guard.startswith(r'(?=(?:\s|^)') else 'any'
+                blocks[gate].setdefault(guard, []).append(lookahead)
+                names[gate].append(name)
+        ws_blocks = ''.join(f'(?:{guard}{"".join(group)}|)'
+                            for guard, group in blocks['ws'].items())
+        any_blocks = ''.join(f'(?:{guard}{"".join(group)}|)'
+                             for guard, group in blocks['any'].items())
+
+        # fail the positions where none of the patterns matched, so the
+        # scan only yields the positions holding an entity. The whitespace
+        # block is checked on its own as most positions never enter it
+        pattern = re.compile(
+            r'(?:(?:(?=\s)|^)' + ws_blocks +
+            self.any_matched(names['ws']) + '(?P<ws_hit>)|)' +
+            any_blocks +
+            '(?(ws_hit)|' + self.any_matched(names['any']) + ')')
+        self.patterns[labels] = pattern
+        return pattern
+
+    def prefilter(self, text):
+        '''
+        Returns the labels of the handlers whose prefilters pass on the
+        text, counting the skipped ones in skip_counts
+        '''
+        self.ticket_count += 1
+        labels = []
+        for label, handler in self.handlers.items():
+            if all(p.search(text) for p in handler.prefilters):
+                labels.append(label)
+            else:
+                self.skip_counts[label] += 1
+        return labels
+
+    @staticmethod
+    def any_matched(names):
+        '''
+        Returns a pattern failing when none of the named groups matched
+        eg: Input = ['a', 'b']
+            Output = (?(a)|(?(b)|(?!)))
+        '''
+        check = '(?!)'
+        for name in reversed(names):
+            check = f'(?({name})|{check})'
+        return check
+
+    @staticmethod
+    def non_capturing(pattern):
+        '''
+        Returns the pattern string with its capturing groups turned into
+        non-capturing ones, the regex engine saves every group of the
+        fused pattern at each branch so keeping them is costly
+        eg: (a|b)(?:c) -> (?:a|b)(?:c)
+        '''
+        chars = []
+        escaped = in_class = False
+        for idx, char in enumerate(pattern):
+            chars.append(char)
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif in_class:
+                # a ] right after the opening [ or [^ is a literal
+                in_class = char != ']' or pattern[idx-1] in '[^' and \
+                    pattern[idx-2:idx] != '\\['
+            elif char == '[':
+                in_class = True
+            elif char == '(' and pattern[idx+1:idx+2] != '?':
+                chars.append('?:')
+        return ''.join(chars)
+
+    @staticmethod
+    def scoped(pattern):
+        '''
+        Returns the pattern string with the leading global inline flags
+        turned into a scoped group, eg: (?i)abc -> (?i:abc)
+        '''
+        flags = re.match(r'\(\?([aiLmsux]+)\)', pattern.pattern)
+        if flags is None:
+            return EntityHandler.non_capturing(pattern.pattern)
+        pattern = EntityHandler.non_capturing(pattern.pattern[flags.end():])
+        return f'(?{flags.group(1)}:{pattern})'
+
+    def find_entity_regex(self, text, labels=None):
+        '''
+        Given a text, returns the list of labeled spans
+        (label, start, end, match) in the order of the handler patterns,
+        same as running re.finditer for each of the patterns of the labels
+        eg: Input = "call 273 7924"
+            Output = [('TEL', 4, 13, ' 273 7924'), ...]
+        '''
+        self.timed_out = False
+        if labels is None:
+            labels = list(self.handlers)
+        if len(labels) == 0:
+            return []
+        groups = [(name, label) for name, label in self.groups
+                  if label in labels]
+        found = {name: [] for name, _ in groups}
+        next_pos = dict.fromkeys(found, 0)
+        try:
+            for match in scan(self.fused_pattern(labels), text,
+                              self.deadline):
+                for name, _ in groups:
+                    start, end = match.span(name)
+                    # finditer resumes after the end of the previous match
+                    if start < 0 or start < next_pos[name]:
+                        continue
+                    next_pos[name] = end
+                    found[name].append((start, end, match.group(name)))
+        except TimeoutError:
+            # the spans found before the deadline are kept
+            self.timed_out = True
+        return [(label, start, end, group)
+                for name, label in groups
+                for start, end, group in found[name]]
+
+    def native_matches(self, label, spans):
+        '''
+        Given the spans of a label, returns the matches in the format of
+        the find_*_regex method of the label handler
+        '''
+        if label == 'LINK':
+            return [(start-1, end-1, group.strip())
+                    for start, end, group in spans]
+        if label == 'MAIL':
+            return [(end-1, 100, start-1, group.strip())
+                    for start, end, group in spans]
+        return [(start, end-1, group.strip()) for start, end, group in spans]
+
+    def match_ref(self, text, token_list, tags_list, verbose=False):
+        '''
+        Returns a dict of label to the index of the tags_list qualified as
+        that label, the labels are tagged in order so the tokens already
+        tagged by a label are skipped by the next ones
+        '''
+        entity_indices = {label: [] for label in self.order}
+        text = text.strip().lower()
+        if not text or text.isspace():
+            return entity_indices
+
+        labels = [label for label in self.prefilter(text)
+                  if label in self.order]
+        spans = {label: [] for label in self.order}
+        for label, start, end, group in self.find_entity_regex(text, labels):
+            if label in spans:
+                spans[label].append((start, end, group))
+
+        tags = list(tags_list)
+        tok_index = TokenIndex(token_list)
+        for label in self.order:
+            if len(spans[label]) == 0:
+                continue
+            if label == 'DATE' and any(exp in text for exp in exceptions):
+                continue
+            handler = self.handlers[label]
+            matches = self.native_matches(label, spans[label])
+            indices = handler.index_matches(matches, tok_index,
+                                            token_list, tags)
+            entity_indices[label] = indices
+            tags = [label if idx in indices else tag
+                    for idx, tag in enumerate(tags)]
+            if verbose and len(indices) > 0:  # pragma: no cover <--
+                print(f'\nFinal Matches {label}: '
+                      f'{[token_list[idx] for idx in indices]}\n')
+        return entity_indices
+
+
+if __name__ == '__main__':
+    from pprint import pprint
+    from tokenize_stage import tokenize_records
+
+    test = "call 273 7924 on 12/03 or mail john.doe@gmail.com, " \
+           "see www.google.com/?search"
+    text, toks, tags = next(tokenize_records([test]))
+    entity_hdlr = EntityHandler()
+    entity_indices = entity_hdlr.match_ref(text, toks, tags, verbose=True)
+    for tag, indices in entity_indices.items():
+        tags = [tag if idx in indices else t for idx, t in enumerate(tags)]
+    print(text)
+    print(toks)
+    print(tags)
+    pprint(list(zip(toks, tags)), compact=True)
+    print(f"Skipped by the prefilters: {entity_hdlr.skip_counts}")
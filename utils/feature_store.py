@@ -0,0 +1,249 @@
+import re
+import json
+import time
+import types
+import shutil
+import hashlib
+import tempfile
+from pathlib import Path
+
+import joblib
+import numpy as np
+import scipy.sparse as sp
+
+from utils import load_hjson
+
+ADDRESS = re.compile(r' at 0x[0-9a-fA-F]+')
+# next to the repo, whatever the cwd of the notebook
+FEATURES_DIR = Path(__file__).resolve().parents[1] / 'cache' / 'features'
+
+
+def param_repr(value, seen=None):
+    '''
+    Returns a stable representation of a vectorizer parameter, the
+    functions (tokenizer, preprocessor) by their name and function_hash
+    so an edit of a notebook function changes the key
+    '''
+    seen = set() if seen is None else seen
+    if isinstance(value, types.MethodType):
+        value = value.__func__
+    if isinstance(value, types.FunctionType):
+        if id(value) in seen:
+            return f'{value.__module__}.{value.__qualname__}'
+        return f'{value.__module__}.{value.__qualname__}:' \
+            f'{function_hash(value, seen)}'
+    if isinstance(value, types.ModuleType):
+        return f'module {value.__name__}'
+    if isinstance(value, type):
+        return f'class {value.__module__}.{value.__qualname__}'
+    if isinstance(value, (list, tuple)):
+        return [param_repr(item, seen) for item in value]
+    if isinstance(value, (set, frozenset)):
+        # the iteration order of the str sets changes between runs
+        return sorted(map(str, (param_repr(item, seen) for item in value)))
+    if isinstance(value, dict):
+        return {str(key): param_repr(item, seen)
+                for key, item in value.items()}
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    # the default repr of the objects holds their address
+    return ADDRESS.sub('', repr(value))
+
+
+def function_hash(func, seen=None):
+    '''
+    Returns the hash of a function: the bytecode, constants and names of
+    its code and nested code, its defaults, and the values of its closure
+    and of the globals it reads, so editing a regex literal or a global
+    the function reads changes the hash
+    eg: function_hash(lambda text: re.findall(r'\\w+', text))
+        != function_hash(lambda text: re.findall(r'\\w{3,}', text))
+    '''
+    seen = set() if seen is None else seen
+    seen.add(id(func))
+    digest = hashlib.blake2b(digest_size=8)
+    names = []
+    codes = [func.__code__]
+    while codes:
+        code = codes.pop()
+        digest.update(code.co_code)
+        names.extend(code.co_names)
+        for const in code.co_consts:
+            if isinstance(const, types.CodeType):
+                codes.append(const)
+            else:
+                digest.update(repr(const).encode())
+    cells = []
+    for cell in func.__closure__ or ():
+        try:
+            cells.append(cell.cell_contents)
+        except ValueError:
+            # an empty cell, a closure variable assigned later
+            cells.append(None)
+    state = {'names': names,
+             'defaults': func.__defaults__,
+             'kwdefaults': func.__kwdefaults__,
+             'closure': cells,
+             'globals': {name: func.__globals__[name] for name in names
+                         if name in func.__globals__}}
+    digest.update(json.dumps(param_repr(state, seen), sort_keys=True,
+                             default=str).encode())
+    return digest.hexdigest()
+
+
+def config_flags(config):
+    '''
+    Returns the preprocessing flags (the boolean values) of the
+    config.hjson path or dict, the text depends on these
+    '''
+    if isinstance(config, (str, Path)):
+        config = load_hjson(Path(config))
+    return {key: value for key, value in sorted((config or {}).items())
+            if isinstance(value, bool)}
+
+
+class FeatureStore:
+    '''
+    Persists the fitted vectorizers and selectors with joblib and the
+    sparse feature matrices as .npz under root, keyed by the hash of the
+    texts, the labels, the vectorizer and selector parameters and the
+    config.hjson flags, evicting the least recently used entries beyond
+    max_bytes
+    eg: store = FeatureStore()
+        X_train, X_test, vectorizer, selector = store.tfidf(
+            X_train_text, y_train, X_test_text,
+            params={'ngram_range': (1, 2), 'min_df': 2}, k=20000,
+            config=preprocess_pipeline.CONFIG_PATH)
+    '''
+
+    def __init__(self, root=FEATURES_DIR, max_bytes=2 << 30):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(texts, y=None, test_texts=None, params=None, k=None,
+            config=None):
+        '''Returns the content hash of everything the features depend on'''
+        digest = hashlib.blake2b(digest_size=16)
+        for part in (texts, test_texts):
+            if part is None:
+                digest.update(b'\x01')
+                continue
+            for text in part:
+                digest.update(str(text).encode('utf-8', 'replace'))
+                digest.update(b'\x00')
+            digest.update(b'\x02')
+        if y is not None:
+            digest.update(np.asarray(y).astype(str).tobytes())
+        import sklearn
+
+        digest.update(json.dumps({'params': param_repr(params or {}),
+                                  'k': k,
+                                  'config': config_flags(config),
+                                  'sklearn': sklearn.__version__},
+                                 sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def entry(self, key):
+        return self.root / key
+
+    def load(self, key):
+        '''Returns the cached (X_train, X_test, vectorizer, selector)'''
+        path = self.entry(key)
+        X_test = sp.load_npz(path / 'test.npz') \
+            if (path / 'test.npz').is_file() else None
+        vectorizer, selector = joblib.load(path / 'fitted.joblib')
+        X_train = sp.load_npz(path / 'train.npz')
+        # the modification time of the meta file tracks the last use
+        (path / 'meta.json').touch()
+        return X_train, X_test, vectorizer, selector
+
+    def save(self, key, X_train, X_test, vectorizer, selector):
+        path = self.entry(key)
+        # a directory of its own for each writer, the hidden ones are not
+        # entries
+        tmp = Path(tempfile.mkdtemp(prefix='.tmp', dir=self.root))
+        try:
+            sp.save_npz(tmp / 'train.npz', sp.csr_matrix(X_train))
+            if X_test is not None:
+                sp.save_npz(tmp / 'test.npz', sp.csr_matrix(X_test))
+            joblib.dump((vectorizer, selector), tmp / 'fitted.joblib')
+            with open(tmp / 'meta.json', 'w') as fp:
+                json.dump({'created': time.time(),
+                           'shape': list(X_train.shape)}, fp)
+            # the entry appears complete or not at all, a concurrent
+            # writer of the same key may have renamed the same features
+            if not (path / 'meta.json').is_file():
+                shutil.rmtree(path, ignore_errors=True)
+            try:
+                tmp.rename(path)
+            except OSError:
+                pass
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+        self.evict()
+
+    def tfidf(self, texts, y=None, test_texts=None, params=None, k=None,
+              config=None):
+        '''
+        Returns the tf-idf features of the texts and test_texts and the
+        fitted TfidfVectorizer and SelectKBest(f_classif, k) (None when
+        k is None), fitting them only on a cache miss
+        '''
+        key = self.key(texts, y, test_texts, params, k, config)
+        if (self.entry(key) / 'meta.json').is_file():
+            self.hits += 1
+            return self.load(key)
+        self.misses += 1
+
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        from sklearn.feature_selection import SelectKBest, f_classif
+
+        vectorizer = TfidfVectorizer(**(params or {}))
+        X_train = vectorizer.fit_transform(texts)
+        X_test = vectorizer.transform(test_texts) \
+            if test_texts is not None else None
+        selector = None
+        if k is not None:
+            selector = SelectKBest(f_classif, k=min(k, X_train.shape[1]))
+            X_train = selector.fit_transform(X_train, y)
+            if X_test is not None:
+                X_test = selector.transform(X_test)
+        self.save(key, X_train, X_test, vectorizer, selector)
+        return X_train, X_test, vectorizer, selector
+
+    def entries(self):
+        '''Returns (last use, bytes, path) of the entries, oldest first'''
+        entries = []
+        for path in self.root.iterdir():
+            meta = path / 'meta.json'
+            if path.name.startswith('.') or not meta.is_file():
+                continue
+            size = sum(file.stat().st_size for file in path.iterdir())
+            entries.append((meta.stat().st_mtime, size, path))
+        return sorted(entries)
+
+    def evict(self, max_bytes=None):
+        '''Removes the least recently used entries beyond max_bytes'''
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+        return total
+
+    def stats(self):
+        entries = self.entries()
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(entries),
+                'bytes': sum(size for _, size, _ in entries)}
+
+    def clear(self):
+        return self.evict(max_bytes=0)
@@ -0,0 +1,321 @@
+'''
+Long-lived local inference server for the merged description model.
+The model and its features are loaded once, the tickets go through the
+preprocessing steps of config.hjson the model was trained on, and the
+concurrent requests are grouped in micro-batches before calling predict.
+The protocol is a json object per line over a unix socket or tcp
+eg: python inference_server.py --socket /tmp/tickets.sock
+    request:  {"id": 1, "text": "unable to login to erp, call 273 7924"}
+    response: {"id": 1, "group": "GRP_0", "score": 0.93}
+'''
+import sys
+import json
+import time
+import asyncio
+import argparse
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+import joblib
+import numpy as np
+
+from utils import check_file_exists, clean_text, load_json
+from entity_handler import EntityHandler
+from safe_handler import SafeHandler
+from preprocess_pipeline import CONFIG_PATH, PreprocessPipeline
+
+# next to the repo, whatever the cwd of the server
+MODEL_DIR = Path(__file__).resolve().parents[1] / 'models' / \
+    'all_classes_classfiier' / 'dl' / 'merged_descr'
+MAX_LEN = 100
+
+
+def save_artifacts(label_encoder, tokenizer=None, vectorizer=None,
+                   selector=None, model_dir=MODEL_DIR):
+    '''
+    Saves the LabelEncoder classes and the fitted features of the model
+    next to it, to be run at the end of the training notebook: the keras
+    Tokenizer of the sequence models, or the TfidfVectorizer and
+    SelectKBest of the dense models such as model_1.h5
+    '''
+    model_dir = Path(model_dir)
+    with open(model_dir / 'classes.json', 'w') as fp:
+        json.dump([str(cls) for cls in label_encoder.classes_], fp)
+    if tokenizer is not None:
+        with open(model_dir / 'tokenizer.json', 'w') as fp:
+            fp.write(tokenizer.to_json())
+    if vectorizer is not None:
+        joblib.dump((vectorizer, selector), model_dir / 'features.joblib')
+
+
+class TicketClassifier:
+    '''
+    Loads the model, its features and the classes once and predicts the
+    assignment group of a batch of raw ticket texts, the model is either
+    the keras .h5 or its .tflite export. The tickets go through the
+    PreprocessPipeline steps of config (the cleaned_* columns the models
+    were trained on), then the persisted features: the tf-idf vectorizer
+    and selector in features.joblib (model_1.h5 takes the 10000 selected
+    tf-idf features) or else the keras tokenizer.json. The training
+    columns hold no entity tags, mask_entities is opt-in
+    '''
+
+    def __init__(self, model_dir=MODEL_DIR, model_name='model_1.h5',
+                 max_len=MAX_LEN, mask_entities=False, config=CONFIG_PATH):
+        model_dir = Path(model_dir)
+        model_path = model_dir / model_name
+        if check_file_exists(model_path):
+            if model_path.suffix == '.tflite':
+                from model_export import TFLiteModel
+                self.model = TFLiteModel(model_path)
+            else:
+                from tensorflow.keras.models import load_model
+                self.model = load_model(model_path)
+        self.vectorizer = self.selector = self.tokenizer = None
+        if (model_dir / 'features.joblib').is_file():
+            self.vectorizer, self.selector = joblib.load(
+                model_dir / 'features.joblib')
+        elif check_file_exists(model_dir / 'tokenizer.json'):
+            from tensorflow.keras.preprocessing.text import \
+                tokenizer_from_json
+            with open(model_dir / 'tokenizer.json', 'r') as fp:
+                self.tokenizer = tokenizer_from_json(fp.read())
+        self.classes = load_json(model_dir / 'classes.json')
+        self.max_len = max_len
+        self.pipeline = PreprocessPipeline(config)
+        self.entities = SafeHandler(EntityHandler(safe=True)) \
+            if mask_entities else None
+
+    def features(self, texts):
+        '''
+        Given the preprocessed texts, returns the model input: the dense
+        selected tf-idf features or the padded token sequences
+        '''
+        if self.vectorizer is not None:
+            features = self.vectorizer.transform(texts)
+            if self.selector is not None:
+                features = self.selector.transform(features)
+            return features.astype('float32').toarray()
+        from tensorflow.keras.preprocessing.sequence import pad_sequences
+
+        return pad_sequences(self.tokenizer.texts_to_sequences(texts),
+                             padding='post', truncating='post',
+                             maxlen=self.max_len)
+
+    def mask(self, text):
+        '''
+        Given a raw ticket, returns it cleaned with the telephone numbers,
+        dates, links and emails replaced by their tag
+        eg: Input = "Call me on phone 273 7924 from 12/03/2020"
+            Output = "Call me on TEL TEL TEL from DATE"
+        '''
+        toks = clean_text(text).split()
+        if toks:
+            tags = ['O']*len(toks)
+            for tag, indices in self.entities.match_ref(
+                    " ".join(toks), toks, tags).items():
+                for idx in indices:
+                    toks[idx] = tag
+        return " ".join(toks)
+
+    def preprocess(self, texts):
+        '''
+        Given a batch of raw tickets, returns them through the steps of
+        the training preprocessing, masked first when mask_entities
+        '''
+        if self.entities is not None:
+            texts = [self.mask(text) for text in texts]
+        return self.pipeline.clean_many(list(texts))
+
+    def predict(self, texts):
+        '''
+        Given a batch of raw tickets, returns (group, score) of each
+        '''
+        inputs = self.features(self.preprocess(texts))
+        probs = self.model.predict(inputs, batch_size=len(texts))
+        best = np.argmax(probs, axis=1)
+        return [(self.classes[idx], float(probs[row, idx]))
+                for row, idx in enumerate(best)]
+
+
+class MicroBatcher:
+    '''
+    Groups the texts submitted concurrently into batches of at most
+    max_batch_size, waiting at most max_wait_ms after the first text of
+    a batch, and runs predict_fn on each batch in a worker thread so the
+    event loop keeps accepting requests
+    '''
+
+    def __init__(self, predict_fn, max_batch_size=64, max_wait_ms=10):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms/1000
+        self.queue = None
+        self.worker = None
+        # a single thread, the batches are predicted one after the other
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.batches = 0
+        self.texts = 0
+
+    async def start(self):
+        self.queue = asyncio.Queue()
+        self.worker = asyncio.ensure_future(self.run())
+
+    async def stop(self):
+        if self.worker is not None:
+            self.worker.cancel()
+            try:
+                await self.worker
+            except asyncio.CancelledError:
+                pass
+        self.executor.shutdown(wait=True)
+
+    async def submit(self, text):
+        '''Returns the prediction of the text once its batch is run'''
+        future = asyncio.get_event_loop().create_future()
+        await self.queue.put((text, future))
+        return await future
+
+    async def next_batch(self):
+        batch = [await self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self.queue.get(),
+                                                    timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def run(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            batch = await self.next_batch()
+            texts = [text for text, _ in batch]
+            try:
+                results = await loop.run_in_executor(
+                    self.executor, self.predict_fn, texts)
+            except Exception as exc:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+            if len(results) != len(batch):
+                # the results can't be told apart, the whole batch fails
+                exc = RuntimeError(f'predict_fn returned {len(results)} '
+                                   f'results for {len(batch)} texts')
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+                continue
+            self.batches += 1
+            self.texts += len(texts)
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def stats(self):
+        return {'batches': self.batches,
+                'texts': self.texts,
+                'mean_batch': self.texts/self.batches
+                if self.batches else 0.0}
+
+
+async def answer(batcher, line):
+    '''
+    Returns the json response line to a json request line, the failures
+    of the request or of its batch are answered by an error line with
+    the request id, null when the request can't be parsed
+    '''
+    request = None
+    try:
+        request = json.loads(line)
+        group, score = await batcher.submit(str(request['text']))
+        response = {'id': request.get('id'), 'group': group,
+                    'score': round(score, 4)}
+    except Exception as exc:
+        response = {'id': request.get('id')
+                    if isinstance(request, dict) else None,
+                    'error': f'{type(exc).__name__}: {exc}'}
+    return json.dumps(response) + '\n'
+
+
+def connection_handler(batcher):
+    async def handle(reader, writer):
+        # the lines of a connection are answered as their batches complete
+        pending = set()
+        lock = asyncio.Lock()
+
+        async def reply(line):
+            response = await answer(batcher, line)
+            async with lock:
+                writer.write(response.encode())
+                await writer.drain()
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.strip():
+                    task = asyncio.ensure_future(reply(line))
+                    pending.add(task)
+                    task.add_done_callback(pending.discard)
+        finally:
+            # a client gone mid reply fails its writes, the other replies
+            # still complete and the writer is closed either way
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+            writer.close()
+    return handle
+
+
+async def serve(batcher, socket_path=None, host='127.0.0.1', port=8765):
+    await batcher.start()
+    handle = connection_handler(batcher)
+    if socket_path is not None:
+        server = await asyncio.start_unix_server(handle, path=socket_path)
+    else:
+        server = await asyncio.start_server(handle, host, port)
+    print(f'Serving on {socket_path or f"{host}:{port}"}')
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await batcher.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--model-dir', type=Path, default=MODEL_DIR)
+    parser.add_argument('--model-name', default='model_1.h5',
+                        help='the .h5 model or its .tflite export')
+    parser.add_argument('--socket', default=None,
+                        help='the unix socket path, tcp when not given')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--max-batch-size', type=int, default=64)
+    parser.add_argument('--max-wait-ms', type=float, default=10)
+    parser.add_argument('--config', type=Path, default=CONFIG_PATH,
+                        help='the preprocessing config of the model')
+    parser.add_argument('--mask-entities', action='store_true',
+                        help='tag the entities before the preprocessing')
+    args = parser.parse_args(argv)
+
+    classifier = TicketClassifier(args.model_dir, args.model_name,
+                                  mask_entities=args.mask_entities,
+                                  config=args.config)
+    batcher = MicroBatcher(classifier.predict, args.max_batch_size,
+                           args.max_wait_ms)
+    try:
+        asyncio.run(serve(batcher, args.socket, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,138 @@
+'''
+Adds the YAKE keywords column of the dataset, extracting the keywords
+of the rows not seen before in parallel chunks and caching them by the
+hash of the text and the extractor parameters
+eg: python keyword_features.py --data ../data/preprocessed_data.xlsx
+        --n-jobs 4
+'''
+import os
+import sys
+import time
+import argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from utils import load_dataset, text_hash, feature_path
+from batch_handler import chunked
+from result_cache import ResultCache
+
+# the parameters of keyword_extraction.ipynb
+YAKE_PARAMS = {'lan': 'en', 'n': 5, 'dedupLim': 0.9, 'top': 1,
+               'features': None}
+
+# the extractor of the worker process, built once by init_worker
+_extractor = None
+
+
+def init_worker(params):
+    global _extractor
+    import yake
+
+    _extractor = yake.KeywordExtractor(**params)
+
+
+def get_keywords(text) -> str:
+    '''
+    Returns the keywords of the text found by the worker extractor joined
+    by spaces, '' for the texts without keywords
+    '''
+    if not isinstance(text, str) or not text.strip():
+        return ''
+    return ' '.join(keyword for keyword, _ in
+                    _extractor.extract_keywords(text))
+
+
+def extract_chunk(texts):
+    return [get_keywords(text) for text in texts]
+
+
+def extract_keywords(texts, params=None, n_jobs=None, chunksize=256):
+    '''
+    Returns the keywords of each text in the input order, the texts are
+    sharded in chunks across n_jobs worker processes, n_jobs=1 runs in
+    this process
+    '''
+    params = dict(params or YAKE_PARAMS)
+    texts = list(texts)
+    n_jobs = n_jobs or os.cpu_count() or 1
+    if n_jobs == 1 or len(texts) <= chunksize:
+        init_worker(params)
+        return extract_chunk(texts)
+    keywords = []
+    with ProcessPoolExecutor(max_workers=n_jobs, initializer=init_worker,
+                             initargs=(params,)) as executor:
+        for chunk in executor.map(extract_chunk, chunked(texts, chunksize)):
+            keywords.extend(chunk)
+    return keywords
+
+
+def add_keywords(path: Path, text_col='translated_description',
+                 out_col='keywords', params=None, n_jobs=None, chunksize=256,
+                 cache_path=None):
+    '''
+    Given an xlsx, csv or parquet dataset, returns it with the out_col
+    keywords of its text_col, written to its out_col sidecar keyed by
+    the hash of the text so load_dataset(path, columns=[..., out_col])
+    merges them, and the extraction stats. Only the distinct texts
+    missing from the cache (default: keywords.db in the .cache dir of
+    the dataset) are extracted
+    eg: add_keywords(Path('../data/preprocessed_data.xlsx'), n_jobs=4)
+    '''
+    path = Path(path)
+    params = dict(params or YAKE_PARAMS)
+    data = load_dataset(path)
+    store = feature_path(path, out_col)
+    cache_path = cache_path or path.parent / '.cache' / 'keywords.db'
+
+    with ResultCache(maxsize=0, path=cache_path) as cache:
+        texts = data[text_col].tolist()
+        keys = [cache.key(sorted(params.items()), text) for text in texts]
+        keywords = [cache.get(key) for key in keys]
+        missing = {}
+        for idx, keyword in enumerate(keywords):
+            if keyword is None:
+                missing.setdefault(keys[idx], texts[idx])
+        began = time.perf_counter()
+        extracted = extract_keywords(list(missing.values()), params, n_jobs,
+                                     chunksize)
+        extracted = dict(zip(missing, extracted))
+        for key, keyword in extracted.items():
+            cache.put(key, keyword)
+        keywords = [keyword if keyword is not None else extracted[key]
+                    for key, keyword in zip(keys, keywords)]
+        stats = {'rows': len(texts), 'extracted': len(missing),
+                 'seconds': round(time.perf_counter() - began, 3)}
+
+    data[out_col] = pd.Series(keywords, index=data.index, dtype=object)
+    sidecar = pd.DataFrame({text_col: [text_hash(text) for text in texts],
+                            out_col: keywords}) \
+        .dropna(subset=[text_col]).drop_duplicates(text_col)
+    store.parent.mkdir(parents=True, exist_ok=True)
+    # the sidecar is rewritten whole, then swapped in
+    tmp = store.with_name(f'{store.name}.tmp')
+    sidecar.to_parquet(tmp, index=False)
+    os.replace(tmp, store)
+    return data, stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--data', type=Path,
+                        default=Path('../data/preprocessed_data.xlsx'))
+    parser.add_argument('--text-col', default='translated_description')
+    parser.add_argument('--out-col', default='keywords')
+    parser.add_argument('--n-jobs', type=int, default=None)
+    parser.add_argument('--chunksize', type=int, default=256)
+    args = parser.parse_args(argv)
+
+    _, stats = add_keywords(args.data, args.text_col, args.out_col,
+                            n_jobs=args.n_jobs, chunksize=args.chunksize)
+    print(f'{stats["rows"]} rows, keywords extracted for '
+          f'{stats["extracted"]} new texts in {stats["seconds"]}s')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
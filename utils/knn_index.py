@@ -0,0 +1,374 @@
+import json
+import re
+import shutil
+from pathlib import Path
+from collections import defaultdict
+
+import joblib
+import numpy as np
+
+from utils import check_folder_exists, clean_texts, load_json
+
+
+def normalize_rows(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class SvdEncoder:
+    '''
+    Encodes the tickets as the l2 normalized TruncatedSVD of their tf-idf
+    eg: encoder = SvdEncoder(dim=256).fit(train_texts)
+        encoder.transform(["unable to login to erp"]) -> (1, 256) float32
+    '''
+
+    def __init__(self, dim=256, max_features=50000, seed=7):
+        from sklearn.decomposition import TruncatedSVD
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        self.vectorizer = TfidfVectorizer(ngram_range=(1, 2), min_df=2,
+                                          max_features=max_features,
+                                          sublinear_tf=True)
+        self.svd = TruncatedSVD(n_components=dim, random_state=seed)
+
+    def prepare(self, texts):
+        return [text.lower() for text in clean_texts(list(texts))]
+
+    def fit(self, texts):
+        self.svd.fit(self.vectorizer.fit_transform(self.prepare(texts)))
+        return self
+
+    def transform(self, texts):
+        return normalize_rows(self.svd.transform(
+            self.vectorizer.transform(self.prepare(texts))))
+
+    def save(self, path: Path):
+        joblib.dump(self, path)
+
+    @staticmethod
+    def load(path: Path):
+        return joblib.load(path)
+
+
+class MeanVectorEncoder:
+    '''
+    Encodes the tickets as the l2 normalized mean of the word vectors of
+    their tokens, looked up in an EmbeddingStore
+    eg: encoder = MeanVectorEncoder(EmbeddingStore.open(glove_path))
+    '''
+
+    def __init__(self, store):
+        self.store = store
+
+    def fit(self, texts):
+        return self
+
+    def transform(self, texts):
+        vectors = np.zeros((len(texts), self.store.dim), dtype=np.float32)
+        for idx, text in enumerate(clean_texts(list(texts))):
+            rows = [row for row in map(self.store.row,
+                                       re.findall(r'\w+', text.lower()))
+                    if row != -1]
+            if rows:
+                vectors[idx] = self.store.vectors[sorted(rows)].mean(axis=0)
+        return normalize_rows(vectors)
+
+
+def train_centroids(vectors, nlist, iterations=10, sample=50000, seed=7):
+    '''
+    Returns nlist l2 normalized centroids of the vectors by spherical
+    k-means on a sample of them
+    '''
+    rng = np.random.RandomState(seed)
+    if len(vectors) > sample:
+        vectors = vectors[np.sort(rng.choice(len(vectors), sample,
+                                             replace=False))]
+    vectors = np.asarray(vectors, dtype=np.float32)
+    nlist = min(nlist, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), nlist, replace=False)]
+    for _ in range(iterations):
+        assigned = np.argmax(vectors @ centroids.T, axis=1)
+        for cluster in range(nlist):
+            members = vectors[assigned == cluster]
+            # the empty clusters keep their centroid
+            if len(members):
+                centroids[cluster] = members.sum(axis=0)
+        centroids = normalize_rows(centroids)
+    return centroids
+
+
+class Shard:
+    '''
+    A read only memory mapped part of the index, its rows sorted by
+    cluster so a probed cluster is the contiguous rows
+    offsets[cluster]:offsets[cluster+1]
+    '''
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.vectors = np.load(path / 'vectors.npy', mmap_mode='r')
+        self.ids = np.load(path / 'ids.npy', mmap_mode='r')
+        self.labels = np.load(path / 'labels.npy', mmap_mode='r')
+        self.seqs = np.load(path / 'seqs.npy', mmap_mode='r')
+        self.offsets = np.load(path / 'offsets.npy')
+
+    def __len__(self):
+        return len(self.ids)
+
+    @staticmethod
+    def write(path: Path, vectors, ids, labels, seqs, clusters, nlist):
+        order = np.argsort(clusters, kind='stable')
+        tmp = path.with_name(f'{path.name}.tmp')
+        tmp.mkdir(parents=True, exist_ok=True)
+        np.save(tmp / 'vectors.npy', vectors[order].astype(np.float32))
+        np.save(tmp / 'ids.npy', ids[order].astype(np.int64))
+        np.save(tmp / 'labels.npy', labels[order].astype(np.int32))
+        np.save(tmp / 'seqs.npy', seqs[order].astype(np.int64))
+        np.save(tmp / 'offsets.npy', np.searchsorted(
+            clusters[order], np.arange(nlist+1)).astype(np.int64))
+        # a shard flushed but never saved is not in meta.json, its name
+        # is taken again by the next flush
+        if path.exists():
+            shutil.rmtree(path)
+        tmp.rename(path)
+        return Shard(path)
+
+    def candidates(self, probes):
+        '''Returns the row slices of the probed clusters'''
+        return [slice(self.offsets[cluster], self.offsets[cluster+1])
+                for cluster in probes
+                if self.offsets[cluster+1] > self.offsets[cluster]]
+
+
+class AnnIndex:
+    '''
+    Inverted file index of l2 normalized ticket vectors, the vectors are
+    assigned to the nearest of nlist k-means centroids and a query scans
+    only the nprobe clusters nearest to it. The vectors are stored in
+    memory mapped shards of up to shard_size rows under root, the added
+    vectors are buffered in memory and written as a new shard by flush.
+    Each row takes the next sequence number, deleting an id or adding it
+    again supersedes its older rows, which are skipped at query time
+    eg: index = AnnIndex.build(Path('../models/knn'), vectors, ids, groups)
+        index.add(new_vectors, new_ids, new_groups)
+        index.delete([1042])
+        index.save()
+        ids, scores, groups = AnnIndex.open(Path('../models/knn')).search(
+            query_vectors, k=10)
+    '''
+
+    def __init__(self, root: Path, centroids, classes=(), nprobe=8,
+                 shard_size=100000):
+        self.root = Path(root)
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.classes = [str(cls) for cls in classes]
+        self.class_index = {cls: idx for idx, cls in enumerate(self.classes)}
+        self.nprobe = nprobe
+        self.shard_size = shard_size
+        self.shards = []
+        # the rows of an id with a sequence number below its entry are
+        # superseded
+        self.superseded = {}
+        self.next_seq = 0
+        self.buffer = []
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    @property
+    def dim(self):
+        return self.centroids.shape[1]
+
+    @classmethod
+    def build(cls, root: Path, vectors, ids, groups, nlist=256, nprobe=8,
+              shard_size=100000):
+        '''Trains the centroids on the vectors and writes their shards'''
+        root = Path(root)
+        root.mkdir(parents=True, exist_ok=True)
+        vectors = normalize_rows(vectors)
+        index = cls(root, train_centroids(vectors, nlist),
+                    sorted(set(map(str, groups))), nprobe, shard_size)
+        index.add(vectors, ids, groups)
+        index.save()
+        return index
+
+    @classmethod
+    def open(cls, root: Path, nprobe=None):
+        '''Memory maps the saved index of root'''
+        root = Path(root)
+        if check_folder_exists(root):
+            meta = load_json(root / 'meta.json')
+        index = cls(root, np.load(root / 'centroids.npy'), meta['classes'],
+                    nprobe or meta['nprobe'], meta['shard_size'])
+        index.shards = [Shard(root / name) for name in meta['shards']]
+        index.superseded = dict(np.load(root / 'superseded.npy').tolist())
+        index.next_seq = meta['next_seq']
+        return index
+
+    def __len__(self):
+        '''Returns the number of live rows, one per id'''
+        ids, seqs = self.rows()
+        return int(len(ids) - self.dead(ids, seqs).sum())
+
+    def rows(self):
+        '''Returns the ids and sequence numbers of the stored rows'''
+        parts = [(shard.ids, shard.seqs) for shard in self.shards] + \
+            [(ids, seqs) for _, ids, _, seqs in self.buffer]
+        if not parts:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return tuple(np.concatenate(part) for part in zip(*parts))
+
+    def dead(self, ids, seqs, superseded=None):
+        '''
+        Returns the mask of the rows superseded by a later add or a delete
+        of their id, superseded is the sorted (ids, seqs) of the entries
+        '''
+        if superseded is None:
+            superseded = self.superseded_arrays()
+        sup_ids, sup_seqs = superseded
+        if not len(sup_ids):
+            return np.zeros(len(ids), dtype=bool)
+        pos = np.minimum(np.searchsorted(sup_ids, ids), len(sup_ids)-1)
+        return (sup_ids[pos] == ids) & (seqs < sup_seqs[pos])
+
+    def superseded_arrays(self):
+        sup_ids = np.array(sorted(self.superseded), dtype=np.int64)
+        sup_seqs = np.array([self.superseded[idx]
+                             for idx in sup_ids.tolist()], dtype=np.int64)
+        return sup_ids, sup_seqs
+
+    def label_codes(self, groups):
+        for group in map(str, groups):
+            if group not in self.class_index:
+                self.class_index[group] = len(self.classes)
+                self.classes.append(group)
+        return np.array([self.class_index[str(group)] for group in groups],
+                        dtype=np.int32)
+
+    def assign(self, vectors):
+        return np.argmax(vectors @ self.centroids.T, axis=1)
+
+    def add(self, vectors, ids, groups):
+        '''Adds the vectors, written to disk by the next flush or save'''
+        vectors = normalize_rows(vectors)
+        ids = np.asarray(ids, dtype=np.int64)
+        if vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected vectors of dim {self.dim}, "
+                             f"got {vectors.shape[1]}")
+        seqs = self.next_seq + np.arange(len(ids), dtype=np.int64)
+        self.next_seq += len(ids)
+        # an id stored already or repeated in ids keeps only its last row
+        stored, _ = self.rows()
+        unique, first, counts = np.unique(ids[::-1], return_index=True,
+                                          return_counts=True)
+        again = (counts > 1) | np.isin(unique, stored)
+        for idx, seq in zip(unique[again].tolist(),
+                            seqs[len(ids)-1-first[again]].tolist()):
+            self.superseded[idx] = seq
+        self.buffer.append((vectors, ids, self.label_codes(groups), seqs))
+        if sum(len(ids) for _, ids, _, _ in self.buffer) >= self.shard_size:
+            self.flush()
+
+    def delete(self, ids):
+        '''Supersedes every row of the ids, an add brings them back'''
+        for idx in ids:
+            self.superseded[int(idx)] = self.next_seq
+
+    def flush(self):
+        '''Writes the buffered vectors as shards of up to shard_size'''
+        if not self.buffer:
+            return
+        vectors, ids, labels, seqs = (np.concatenate(part)
+                                      for part in zip(*self.buffer))
+        self.buffer = []
+        for start in range(0, len(ids), self.shard_size):
+            part = slice(start, start+self.shard_size)
+            path = self.root / f'shard_{len(self.shards):05d}'
+            self.shards.append(Shard.write(
+                path, vectors[part], ids[part], labels[part], seqs[part],
+                self.assign(vectors[part]), self.nlist))
+
+    def save(self):
+        self.flush()
+        np.save(self.root / 'centroids.npy', self.centroids)
+        np.save(self.root / 'superseded.npy',
+                np.array(sorted(self.superseded.items()),
+                         dtype=np.int64).reshape(-1, 2))
+        with open(self.root / 'meta.json', 'w') as fp:
+            json.dump({'classes': self.classes, 'nprobe': self.nprobe,
+                       'shard_size': self.shard_size, 'dim': self.dim,
+                       'next_seq': self.next_seq,
+                       'shards': [shard.path.name for shard in self.shards]},
+                      fp, indent=2)
+
+    def search(self, queries, k=10):
+        '''
+        Returns the ids, cosine similarities and groups of the k nearest
+        vectors of each query, -1, -inf and None pad the missing ones
+        '''
+        queries = normalize_rows(np.atleast_2d(queries))
+        probes = np.argsort(-(queries @ self.centroids.T),
+                            axis=1)[:, :self.nprobe]
+        superseded = self.superseded_arrays()
+        found_ids = np.full((len(queries), k), -1, dtype=np.int64)
+        found_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        found_groups = np.full((len(queries), k), None, dtype=object)
+        for row, (query, probe) in enumerate(zip(queries, probes)):
+            parts = [(shard.vectors[rows], shard.ids[rows],
+                      shard.labels[rows], shard.seqs[rows])
+                     for shard in self.shards
+                     for rows in shard.candidates(probe)]
+            # the buffered vectors are few, they are scanned whole
+            parts += self.buffer
+            if not parts:
+                continue
+            vectors, ids, labels, seqs = (np.concatenate(part)
+                                          for part in zip(*parts))
+            scores = vectors @ query
+            scores[self.dead(ids, seqs, superseded)] = -np.inf
+            top = np.argsort(-scores, kind='stable')[:k]
+            top = top[np.isfinite(scores[top])]
+            found_ids[row, :len(top)] = ids[top]
+            found_scores[row, :len(top)] = scores[top]
+            found_groups[row, :len(top)] = [self.classes[label]
+                                            for label in labels[top]]
+        return found_ids, found_scores, found_groups
+
+
+class KnnClassifier:
+    '''
+    Returns the group of the tickets by the similarity weighted vote of
+    their k nearest labeled tickets in the AnnIndex
+    eg: encoder = SvdEncoder().fit(train_texts)
+        index = AnnIndex.build(Path('../models/knn'),
+                               encoder.transform(train_texts),
+                               np.arange(len(train_texts)), train_groups)
+        KnnClassifier(encoder, index).predict(["unable to login to erp"])
+        -> [('GRP_0', 0.83)]
+    '''
+
+    def __init__(self, encoder, index, k=10):
+        self.encoder = encoder
+        self.index = index
+        self.k = k
+
+    def predict(self, texts):
+        '''Returns the (group, share of the vote) of each text'''
+        _, scores, groups = self.index.search(
+            self.encoder.transform(list(texts)), self.k)
+        predictions = []
+        for row_scores, row_groups in zip(scores, groups):
+            votes = defaultdict(float)
+            for score, group in zip(row_scores, row_groups):
+                if group is not None:
+                    votes[group] += max(float(score), 0.0)
+            total = sum(votes.values())
+            if not votes:
+                predictions.append((None, 0.0))
+                continue
+            group = max(votes, key=votes.get)
+            predictions.append((group, round(votes[group]/total, 4)
+                                if total else 0.0))
+        return predictions
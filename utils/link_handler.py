@@ -1,10 +1,13 @@
 import re
 
+from token_index import TokenIndex, tagged_index
+from deadline_scan import scan
+
 
 class LinkHandler:
     '''Matches any website links in the text'''
 
-    def __init__(self):
+    def __init__(self, safe=False):
 
         http_protocol = r"""h[it]tps?:"""
         # generic_protocol = r"""[a-z][\w-]+"""
@@ -26,16 +29,59 @@ class LinkHandler:
             r"""tv|tw|tz|ua|ug|uk|us|uy|uz|va|vc|ve|vg|vi|vn|vu|wf|ws|""" + \
             r"""ye|yt|yu|za|zm|zw)"""
 
-        pattern = r"""(?i)\b((?:""" + http_protocol + \
-            r"""(?:/{1,3}|[a-z0-9%])|[a-z0-9.\-]+[.]""" + \
+        # the safe pattern consumes the path one char at a time, the
+        # nested quantifiers backtrack exponentially on the paths ending
+        # in punctuation eg: http://!!!!!!!!!!!!!!!!!!!!!!!!
+        path_chars = r"""[^\s()<>{}\[\]]""" if safe else \
+            r"""[^\s()<>{}\[\]]+"""
+        # and only tries the domains on the 2 to 6 letter words, instead
+        # of the whole list after each dot eg: a.a.a.a.a.a.a.a.a.a.a.a@
+        tld_slash = r"""(?=[a-z]{2,6}/)""" if safe else ''
+        tld_word = r"""(?=[a-z]{2,6}\b)""" if safe else ''
+        # a scan starting inside a dotted run reaches the same ends as the
+        # one started at its first label, so the safe pattern starts the
+        # domains at the first label of their run only, each run is then
+        # scanned once instead of once per label eg: a.a.a.a.a.a.a.a.a.a@
+        run_start = r"""(?<!\b[a-z0-9.\-])""" if safe else ''
+        label_start = r"""(?<![a-z0-9][.\-])""" if safe else ''
+
+        link = r"""(?:""" + http_protocol + \
+            r"""(?:/{1,3}|[a-z0-9%])|""" + run_start + \
+            r"""[a-z0-9.\-]+[.]""" + tld_slash + \
             top_level_domain + \
-            r"""/)(?:[^\s()<>{}\[\]]+|\([^\s()]*?\([^\s()]+\)""" + \
+            r"""/)(?:""" + path_chars + \
+            r"""|\([^\s()]*?\([^\s()]+\)""" + \
             r"""[^\s()]*?\)|\([^\s]+?\))+(?:\([^\s()]*?\([^\s()]+\)""" + \
-            r"""[^\s()]*?\)|\([^\s]+?\)|[^\s`!()\[\]{};:'".,<>?«»“”‘’])""" + \
-            r"""|(?:(?<!@)[a-z0-9]+(?:[.\-][a-z0-9]+)*[.]""" + \
+            r"""[^\s()]*?\)|\([^\s]+?\)|[^\s`!()\[\]{};:'".,<>?«»“”‘’])"""
+        domain = r"""[a-z0-9]+(?:[.\-][a-z0-9]+)*[.]""" + tld_word + \
             top_level_domain + \
-            r"""\b/?(?!@)))"""
+            r"""\b/?(?!@)"""
+        if safe:
+            # the first label of a run can't start a domain after an @ or
+            # a word char, the second one does eg: john@mail.company.com,
+            # host_01.company.com. The match then starts at the first label,
+            # in the same token
+            pattern = r"""(?i)(\b""" + link + \
+                r"""|\b(?<!@)""" + label_start + domain + \
+                r"""|(?<=@|[^\W0-9a-z])[a-z0-9]+[.\-]""" + domain + r""")"""
+        else:
+            pattern = r"""(?i)\b(""" + link + r"""|(?:(?<!@)""" + domain + \
+                r"""))"""
         self.pattern = re.compile(pattern)
+        # the matches start at a word boundary, or after a word char in
+        # the safe pattern, and hold a protocol or a dot before the top
+        # level domain
+        self.guard = r'(?i:' + (r'(?:\b|(?<=[^\W0-9a-z]))' if safe
+                                else r'\b') + \
+            r'(?=h[it]tps?:|[a-z0-9\-]*\.))'
+        # the literals every match holds: the protocol or the dot before
+        # the domain, the tickets missing any skip the pattern
+        self.prefilters = [re.compile(r'(?i:h[it]tps?:|\.[a-z])')]
+        self.skipped = 0
+        # the perf_counter time after which the scan stops, the matches
+        # found before it are kept and timed_out is set
+        self.deadline = None
+        self.timed_out = False
 
     def get_tok_indexlist(self, token_list):
         '''
@@ -70,53 +116,62 @@ class LinkHandler:
 
     def find_link_regex(self, text):
         links = list()
-        matches = re.finditer(self.pattern, text.lower())
-        for match in matches:
-            links.extend([(match.start()-1,
-                           match.end()-1,
-                           match.group(0).strip())])
+        self.timed_out = False
+        matches = scan(self.pattern, text.lower(), self.deadline)
+        try:
+            for match in matches:
+                links.extend([(match.start()-1,
+                               match.end()-1,
+                               match.group(0).strip())])
+        except TimeoutError:
+            self.timed_out = True
         return links
 
-    def return_link_index(self, matches, char_map, tags_list):
+    def return_link_index(self, matches, tok_index, tags_list):
         '''
-        Given the matched groups,token_list,token_tags,char_mapping, extract
+        Given the matched groups,token_list,token_tags,tok_index, extract
         index of the tags_list to be qualified as LINK for SPV
         '''
         words_include = []
         for match in matches:
-            start = match[0]
-            end = match[1]
-            include = list(range(start, end, 1))
-            words = list(
-                set([value for key, value in char_map.items()
-                     if key in include]))
-            words_include.extend(words)
-        existing_tags_index = [idx for idx, tag in
-                               enumerate(tags_list) if tag != "O"]
+            words_include.extend(
+                tok_index.span_tokens(match[0], match[1]))
+        existing_tags_index = tagged_index(tags_list)
         words_include_filtered = [i for i in words_include
                                   if i not in existing_tags_index]
         return words_include_filtered
 
+    def index_matches(self, matches, tok_index, token_list, tags_list):
+        '''
+        Given the matches from find_link_regex, return the index of the
+        tags_list to be qualified as LINK, skipping the tokens with less
+        than 6 letters or with mixed case letters
+        '''
+        link_indices = []
+        match_indices = self.return_link_index(matches, tok_index,
+                                               tags_list)
+        for idx in match_indices:
+            tok = token_list[idx]
+            alpha_tok = re.sub('[^a-zA-Z]', '', tok)
+            if len(alpha_tok) < 6:
+                continue
+            if alpha_tok.islower() or alpha_tok.isupper():
+                link_indices.append(idx)
+        return link_indices
+
     def match_ref(self, text, token_list, tags_list,
                   entity='LINK', verbose=False):
         link_indices = []
         text = text.strip().lower()
+        if not all(p.search(text) for p in self.prefilters):
+            self.skipped += 1
+            return link_indices
 
         matches = self.find_link_regex(text)
         if len(matches) > 0:
-            char_map = self.char_mapping(token_list)
-            match_indices = self.return_link_index(matches,
-                                                   char_map,
-                                                   tags_list)
-
-            if len(match_indices) > 0:
-                for idx in match_indices:
-                    tok = token_list[idx]
-                    alpha_tok = re.sub('[^a-zA-Z]', '', tok)
-                    if len(alpha_tok) < 6:
-                        continue
-                    if alpha_tok.islower() or alpha_tok.isupper():
-                        link_indices.append(idx)
+            tok_index = TokenIndex(token_list)
+            link_indices = self.index_matches(matches, tok_index,
+                                              token_list, tags_list)
 
             if verbose and len(link_indices) > 0:  # pragma: no cover <--
                 print(f'\nFinal Matches {entity}: '
@@ -125,16 +180,11 @@ class LinkHandler:
 
 
 if __name__ == '__main__':
-    import spacy
     from pprint import pprint
-    nlp = spacy.load('en_core_web_sm')
+    from tokenize_stage import tokenize_records
 
     test = "www.google.com/?search Search Results: ..."
-    doc = nlp(test)
-    toks = [t.text for t in doc]
-    toks = [t.strip() for t in toks]
-    text = " ".join(toks)
-    tags = ['O']*len(doc)
+    text, toks, tags = next(tokenize_records([test]))
     tag = "LINK"
     link_hdlr = LinkHandler()
     link_indices = link_hdlr.match_ref(text, toks, tags,
@@ -0,0 +1,260 @@
+'''
+Fits the field skeletons of the security log alerts on the Description
+column of a dataset once, and saves them for the preprocessing pipeline
+eg: python log_template.py --data ../data/input_data.xlsx
+        --out ../models/log_templates.json
+'''
+import re
+import sys
+import json
+import argparse
+from pathlib import Path
+from collections import Counter
+
+from utils import check_file_exists, load_dataset
+
+# the skeletons fit on input_data.xlsx, loaded by cleaning.py from any cwd
+TEMPLATES_PATH = Path(__file__).resolve().parents[1] / 'models' / \
+    'log_templates.json'
+# the "key: value" line of the alerts, the keys hold no digits so the
+# syslog lines of the event detail ("sep 27 04:07:44 ...") are skipped
+FIELD = re.compile(r'[a-z][a-z /(),_-]{0,39}')
+LINE_BREAK = re.compile(r'(?i)_x000d_|\r')
+# the name of the alert in the free text of the alerts without summary
+ALERT_NAME = re.compile(r"\[\*\*\] (?:\[[\d:]+\] )?(.+?) \[\*\*\]|"
+                        r"'([^'\n]{8,160})' alerts")
+# the keys of each canonical field, the later alert formats spell the
+# summary with an underscore
+CANONICAL_FIELDS = (('event summary', 'event_summary'), ('protocol',),
+                    ('action',))
+# the id of the alerts sharing no fit skeleton
+UNSEEN = 'T?'
+
+
+def is_alert(text: str) -> bool:
+    '''
+    Returns True for the security log alerts, the tickets starting with
+    their "source ip" field
+    '''
+    return text.startswith('source ip')
+
+
+def parse_fields(text: str) -> dict:
+    '''
+    Returns the key/value fields of an alert in a single pass over its
+    lines, the first value of a repeated key wins
+    eg: Input = "event summary: internal outbreak for 7/udp_x000D_\\n"
+                "protocol: udp_x000D_\\naction: blocked"
+        Output = {'event summary': 'internal outbreak for 7/udp',
+                  'protocol': 'udp', 'action': 'blocked'}
+    '''
+    fields = {}
+    for line in LINE_BREAK.sub('', text.lower()).split('\n'):
+        key, sep, value = line.partition(':')
+        if not sep:
+            continue
+        key = ' '.join(key.split())
+        if key not in fields and FIELD.fullmatch(key):
+            fields[key] = value.strip()
+    return fields
+
+
+def is_prose(line: str) -> bool:
+    # 5 words or more, mostly letters: the analyst notes, not the section
+    # titles, syslog, hex dump or separator lines
+    words = line.split()
+    return len(words) >= 5 and \
+        sum(word.strip('.,;:()\'"').isalpha() for word in words) >= \
+        0.8*len(words)
+
+
+def prose_lines(text: str) -> list:
+    '''
+    Returns the lines of an alert outside its key/value fields that read
+    as prose, each distinct line once
+    eg: Input = "action: blocked\\nsep 26 08:23:55 80.71.06.702 deny udp\\n"
+                "we are escalating this incident to you"
+        Output = ["we are escalating this incident to you"]
+    '''
+    lines = {}
+    for line in LINE_BREAK.sub('', text.lower()).split('\n'):
+        key, sep, _ = line.partition(':')
+        if sep and FIELD.fullmatch(' '.join(key.split())):
+            continue
+        line = ' '.join(line.split())
+        if is_prose(line):
+            lines.setdefault(line)
+    return list(lines)
+
+
+class LogTemplates:
+    '''
+    The field skeletons of the security log alerts: the keys found in at
+    least min_share of the alerts fit on make up the skeletons, an alert
+    takes the template of the skeleton sharing at least similarity
+    (Jaccard) of its keys. The prose lines found in several of the alerts
+    fit on (the escalation and advisory text of the SOC) make up the
+    boilerplate. compress turns an alert into its template id and
+    canonical "event summary protocol action" followed by its notes: its
+    prose lines sharing less than line_similarity (Jaccard) of their
+    words with every boilerplate line, up to max_words words. The alerts
+    without any of the three fields get no canonical text
+    eg: templates = LogTemplates().fit(alert_texts)
+        templates.compress(alert)
+        -> ('T0', 'internal outbreak for 7/udp udp blocked')
+    '''
+
+    def __init__(self, min_share=0.5, similarity=0.8, min_alerts=2,
+                 line_similarity=0.5, max_words=24):
+        self.min_share = min_share
+        self.similarity = similarity
+        self.min_alerts = min_alerts
+        self.line_similarity = line_similarity
+        self.max_words = max_words
+        self.keys = []
+        self.templates = []
+        self.boilerplate = []
+        self.boilerplate_words = []
+        self.counts = Counter()
+
+    def fit(self, texts):
+        '''
+        Learns the skeleton keys and the boilerplate lines from the
+        alerts among the texts
+        '''
+        texts = [text for text in texts if is_alert(text)]
+        alerts = [parse_fields(text) for text in texts]
+        seen = Counter(key for fields in alerts for key in fields)
+        self.keys = sorted(key for key, count in seen.items()
+                           if count >= self.min_share*len(alerts))
+        self.templates = []
+        # the most complete skeletons first, the partial ones join them
+        for fields in sorted(alerts, key=len, reverse=True):
+            self.template_id(fields, add=True)
+        # the SOC writes the same text in the alerts of every template,
+        # the lines are counted across all of them
+        lines = Counter(line for text in texts for line in prose_lines(text))
+        self.set_boilerplate(sorted(line for line, count in lines.items()
+                                    if count >= self.min_alerts))
+        return self
+
+    def set_boilerplate(self, lines):
+        self.boilerplate = list(lines)
+        self.boilerplate_words = [frozenset(line.split())
+                                  for line in self.boilerplate]
+
+    def is_boilerplate(self, line: str) -> bool:
+        words = set(line.split())
+        return any(len(words & other) >=
+                   self.line_similarity*len(words | other)
+                   for other in self.boilerplate_words)
+
+    def notes(self, text: str) -> str:
+        '''
+        Returns the prose lines of the alert outside the boilerplate, cut
+        to max_words words
+        '''
+        words = ' '.join(line for line in prose_lines(text)
+                         if not self.is_boilerplate(line)).split()
+        return ' '.join(words[:self.max_words])
+
+    def template_id(self, fields, add=False) -> str:
+        '''
+        Returns the id of the skeleton of the fields, UNSEEN when none is
+        similar enough, or a new skeleton when add (while fitting, so the
+        ids don't depend on the order the workers see the alerts in)
+        '''
+        keys = set(self.keys).intersection(fields)
+        best, best_score = None, -1.0
+        for idx, skeleton in enumerate(self.templates):
+            union = len(keys | skeleton)
+            score = len(keys & skeleton)/union if union else 1.0
+            if score > best_score:
+                best, best_score = idx, score
+        if best is None or best_score < self.similarity:
+            if not add:
+                return UNSEEN
+            self.templates.append(frozenset(keys))
+            best = len(self.templates) - 1
+        return f'T{best}'
+
+    def canonical(self, fields, text='') -> str:
+        '''
+        Returns the event summary (or the alert name of the free text),
+        protocol and action of the alert followed by its notes, '' when
+        it has none of the three fields
+        '''
+        values = [next((fields[key] for key in keys if fields.get(key)), '')
+                  for keys in CANONICAL_FIELDS]
+        if not any(values):
+            return ''
+        if not values[0]:
+            name = ALERT_NAME.search(text)
+            values[0] = (name.group(1) or name.group(2)) if name else ''
+        values.append(self.notes(text))
+        return ' '.join(value for value in values if value)
+
+    def compress(self, text: str):
+        '''
+        Returns the (template id, canonical text) of an alert, (None,
+        text) for the other tickets and (template id, '') for the alerts
+        without summary, protocol or action
+        '''
+        if not is_alert(text):
+            return None, text
+        fields = parse_fields(text)
+        template = self.template_id(fields)
+        self.counts[template] += 1
+        return template, self.canonical(fields, text)
+
+    def save(self, path: Path):
+        with open(path, 'w') as fp:
+            json.dump({'min_share': self.min_share,
+                       'similarity': self.similarity,
+                       'min_alerts': self.min_alerts,
+                       'line_similarity': self.line_similarity,
+                       'max_words': self.max_words, 'keys': self.keys,
+                       'templates': [sorted(skeleton)
+                                     for skeleton in self.templates],
+                       'boilerplate': self.boilerplate},
+                      fp, indent=2)
+
+    @classmethod
+    def load(cls, path: Path):
+        if check_file_exists(Path(path)):
+            with open(path, 'r') as fp:
+                meta = json.load(fp)
+        templates = cls(meta['min_share'], meta['similarity'],
+                        meta['min_alerts'], meta['line_similarity'],
+                        meta['max_words'])
+        templates.keys = meta['keys']
+        templates.templates = [frozenset(skeleton)
+                               for skeleton in meta['templates']]
+        templates.set_boilerplate(meta['boilerplate'])
+        return templates
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--data', type=Path,
+                        default=Path('../data/input_data.xlsx'))
+    parser.add_argument('--text-col', default='Description')
+    parser.add_argument('--out', type=Path, default=TEMPLATES_PATH)
+    parser.add_argument('--min-share', type=float, default=0.5)
+    parser.add_argument('--similarity', type=float, default=0.8)
+    args = parser.parse_args(argv)
+
+    texts = [text for text in load_dataset(args.data,
+                                           columns=[args.text_col])
+             [args.text_col].tolist() if isinstance(text, str)]
+    templates = LogTemplates(args.min_share, args.similarity).fit(texts)
+    args.out.parent.mkdir(parents=True, exist_ok=True)
+    templates.save(args.out)
+    print(f'{sum(map(is_alert, texts))} alerts, {len(templates.keys)} '
+          f'skeleton keys, {len(templates.templates)} templates '
+          f'-> {args.out}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
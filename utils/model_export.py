@@ -0,0 +1,224 @@
+'''
+Exports the keras ticket classifiers (.h5) to TensorFlow Lite, optionally
+int8 quantized, and reports the accuracy parity and the latency and
+memory of the exported model against the original on the held-out split
+eg: python model_export.py --quantize dynamic --out export_report.json
+'''
+import sys
+import json
+import time
+import argparse
+import resource
+from pathlib import Path
+
+import numpy as np
+
+from utils import check_file_exists, load_dataset
+from inference_server import MODEL_DIR, TicketClassifier
+
+QUANTIZATIONS = (None, 'dynamic', 'int8')
+
+
+def load_interpreter(path: Path):
+    '''
+    Returns the tflite Interpreter of the lightweight tflite_runtime
+    package when installed, of tensorflow otherwise
+    '''
+    try:
+        from tflite_runtime.interpreter import Interpreter
+    except ImportError:
+        from tensorflow.lite import Interpreter
+    return Interpreter(model_path=str(path))
+
+
+class TFLiteModel:
+    '''Runs a tflite model with the predict interface of a keras model'''
+
+    def __init__(self, path: Path):
+        if check_file_exists(Path(path)):
+            self.interpreter = load_interpreter(path)
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        self.batch_size = None
+
+    def predict(self, x, batch_size=None):
+        x = np.asarray(x, dtype=self.input['dtype'])
+        if self.batch_size != len(x):
+            self.interpreter.resize_tensor_input(self.input['index'],
+                                                 x.shape)
+            self.interpreter.allocate_tensors()
+            self.batch_size = len(x)
+        self.interpreter.set_tensor(self.input['index'], x)
+        self.interpreter.invoke()
+        return self.interpreter.get_tensor(self.output['index'])
+
+
+def export_tflite(h5_path: Path, out_path=None, quantize=None,
+                  representative=None):
+    '''
+    Converts the keras model to tflite and returns the tflite path.
+    quantize='dynamic' stores the weights as int8, quantize='int8' also
+    quantizes the activations calibrated on the representative inputs,
+    the token ids of the embedding models are kept as is either way
+    '''
+    import tensorflow as tf
+
+    if quantize not in QUANTIZATIONS:
+        raise ValueError(f"Unknown quantization: {quantize}, "
+                         f"expected one of {QUANTIZATIONS}")
+    h5_path = Path(h5_path)
+    check_file_exists(h5_path)
+    suffix = f'_{quantize}' if quantize else ''
+    out_path = Path(out_path) if out_path else \
+        h5_path.with_name(f'{h5_path.stem}{suffix}.tflite')
+
+    model = tf.keras.models.load_model(h5_path)
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    # the LSTM layers not fused by the converter run as select tf ops
+    converter.target_spec.supported_ops = [
+        tf.lite.OpsSet.TFLITE_BUILTINS, tf.lite.OpsSet.SELECT_TF_OPS]
+    if quantize:
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantize == 'int8':
+        if representative is None:
+            raise ValueError('int8 quantization needs representative data')
+        samples = np.asarray(representative, dtype=np.float32)
+
+        def representative_dataset():
+            for sample in samples[:500]:
+                yield [sample[None, :]]
+        converter.representative_dataset = representative_dataset
+    with open(out_path, 'wb') as fp:
+        fp.write(converter.convert())
+    return out_path
+
+
+def held_out_split(classifier, data_path: Path, seed=7, calibration=500):
+    '''
+    Returns the model input features of a sample of calibration train
+    tickets (for the int8 calibration), and the features and class ids of
+    the 20% held-out split of the merged description notebook (for the
+    parity), featurized by the TicketClassifier of the model
+    '''
+    from sklearn.model_selection import train_test_split
+
+    data = load_dataset(data_path, columns=['description',
+                                            'cleaned_short_description',
+                                            'cleaned_description', 'group'])
+    same = (data.cleaned_short_description == data.cleaned_description) | \
+        np.array([str(descr).startswith(str(short)) for descr, short in
+                  zip(data.description, data.cleaned_short_description)])
+    merged = np.where(same, data.cleaned_description.astype(str),
+                      data.cleaned_short_description.astype(str) + ' ' +
+                      data.cleaned_description.astype(str))
+    index = {cls: idx for idx, cls in enumerate(classifier.classes)}
+    y = np.array([index[str(group)] for group in data.group])
+    X_train, X_test, _, y_test = train_test_split(merged, y, test_size=.2,
+                                                  random_state=seed)
+    sample = np.random.default_rng(seed).permutation(len(X_train))
+    return (classifier.features(list(X_train[sample[:calibration]])),
+            classifier.features(list(X_test)), y_test)
+
+
+def parity(reference, candidate, X, y, batch_size=256):
+    '''
+    Returns the accuracy of both models on X, y, the share of the
+    predictions they agree on and the max difference of the probabilities
+    '''
+    ref = np.concatenate([reference.predict(X[idx:idx+batch_size])
+                          for idx in range(0, len(X), batch_size)])
+    cand = np.concatenate([candidate.predict(X[idx:idx+batch_size])
+                           for idx in range(0, len(X), batch_size)])
+    return {'accuracy': float(np.mean(ref.argmax(1) == y)),
+            'exported_accuracy': float(np.mean(cand.argmax(1) == y)),
+            'agreement': float(np.mean(ref.argmax(1) == cand.argmax(1))),
+            'max_prob_diff': float(np.max(np.abs(ref - cand)))}
+
+
+def latency(model, X, batch_sizes=(1, 64), rounds=50):
+    '''Returns the p50/p99 milliseconds of predict for each batch size'''
+    report = {}
+    for batch_size in batch_sizes:
+        batch = X[:batch_size]
+        model.predict(batch)
+        times = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            model.predict(batch)
+            times.append(time.perf_counter()-start)
+        times.sort()
+        report[f'batch_{batch_size}'] = {
+            'p50_ms': round(times[len(times)//2]*1000, 3),
+            'p99_ms': round(times[min(len(times)-1,
+                                      int(.99*len(times)))]*1000, 3)}
+    return report
+
+
+def max_rss_mb():
+    '''Returns the peak resident memory of the process in MB'''
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024
+
+
+def compare(h5_path: Path, tflite_path: Path, X, y):
+    '''
+    Returns the parity, latency, file size and the peak resident memory
+    added by loading and running each model. tensorflow is already
+    imported by then, the memory of its runtime is not counted, which a
+    tflite_runtime only host does not load at all
+    '''
+    from tensorflow.keras.models import load_model
+
+    before = max_rss_mb()
+    exported = TFLiteModel(tflite_path)
+    exported.predict(X[:64])
+    tflite_mb = max_rss_mb() - before
+    before = max_rss_mb()
+    original = load_model(h5_path)
+    original.predict(X[:64])
+    keras_mb = max_rss_mb() - before
+    return {'model': h5_path.name,
+            'exported': tflite_path.name,
+            'parity': parity(original, exported, X, y),
+            'latency': {'keras': latency(original, X),
+                        'tflite': latency(exported, X)},
+            'size_mb': {'keras': round(h5_path.stat().st_size/2**20, 3),
+                        'tflite': round(tflite_path.stat().st_size/2**20,
+                                        3)},
+            'rss_mb': {'keras': round(keras_mb, 1),
+                       'tflite': round(tflite_mb, 1)}}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--model-dir', type=Path, default=MODEL_DIR)
+    parser.add_argument('--data', type=Path,
+                        default=Path('../data/preprocessed_data.xlsx'))
+    parser.add_argument('--quantize', choices=['dynamic', 'int8'],
+                        default=None)
+    parser.add_argument('--min-agreement', type=float, default=0.99,
+                        help='the exit status is 1 below this agreement')
+    parser.add_argument('--out', type=Path, default=None)
+    args = parser.parse_args(argv)
+
+    reports = []
+    for h5_path in sorted(args.model_dir.glob('*.h5')):
+        classifier = TicketClassifier(args.model_dir, h5_path.name,
+                                      mask_entities=False)
+        # calibrated on the train split, X is kept for the parity only
+        X_cal, X, y = held_out_split(classifier, args.data)
+        tflite_path = export_tflite(h5_path, quantize=args.quantize,
+                                    representative=X_cal)
+        reports.append(compare(h5_path, tflite_path, X, y))
+    for report in reports:
+        print(json.dumps(report, indent=2))
+    if args.out is not None:
+        with open(args.out, 'w') as fp:
+            json.dump(reports, fp, indent=2)
+    if any(report['parity']['agreement'] < args.min_agreement
+           for report in reports):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
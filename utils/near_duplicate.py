@@ -0,0 +1,174 @@
+import re
+import json
+import zlib
+from pathlib import Path
+from collections import defaultdict
+
+import numpy as np
+
+from utils import check_file_exists, clean_text
+
+# a mersenne prime above the 32 bit shingle hashes, the coefficients
+# stay below 2**31 so a*x+b fits in 64 bits
+PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+
+
+def normalize(text: str) -> str:
+    '''
+    Returns the cleaned lowercased text with the numbers replaced, so
+    the alerts differing only in their IPs, ports or ids match
+    eg: Input = "Job Job_1424 failed in job_scheduler at: 10/31/2016 10:21:00"
+        Output = "job job_0 failed in job_scheduler at: 0/0/0 0:0:0"
+    '''
+    return re.sub(r'\d+', '0', clean_text(text).lower())
+
+
+def shingles(text: str, k=3):
+    '''
+    Returns the crc32 hashes of the k word shingles of the normalized
+    text, the texts shorter than k words are a single shingle and the
+    texts without words have none
+    eg: Input = "password reset for user", k = 3
+        Output = [crc32("password reset for"), crc32("reset for user")]
+    '''
+    words = normalize(text).split()
+    if not words:
+        return np.empty(0, dtype=np.uint64)
+    grams = [' '.join(words[idx:idx+k])
+             for idx in range(max(1, len(words)-k+1))]
+    return np.unique(np.array([zlib.crc32(gram.encode()) for gram in grams],
+                              dtype=np.uint64))
+
+
+class NearDuplicateIndex:
+    '''
+    MinHash signatures of the word shingles of the labeled tickets, in
+    LSH buckets of bands x rows hashes, to find the previously labeled
+    ticket most similar to a new one in constant time
+    eg: index = NearDuplicateIndex(threshold=0.8)
+        index.insert("Job Job_1424 failed in job_scheduler", "GRP_8")
+        index.lookup("Job Job_1480 failed in job_scheduler")
+        -> {'key': 0, 'group': 'GRP_8', 'similarity': 1.0}
+    '''
+
+    def __init__(self, threshold=0.8, bands=16, rows=8, k=3, seed=7):
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = rows
+        self.k = k
+        self.seed = seed
+        rng = np.random.RandomState(seed)
+        num_perm = bands*rows
+        self.a = rng.randint(1, 1 << 31, size=num_perm).astype(np.uint64)
+        self.b = rng.randint(0, 1 << 31, size=num_perm).astype(np.uint64)
+        self.signatures = np.empty((0, num_perm), dtype=np.uint32)
+        self.pending = []
+        self.groups = []
+        self.keys = []
+        self.buckets = [defaultdict(list) for _ in range(bands)]
+        self.lookups = 0
+        self.hits = 0
+
+    def signature(self, text: str):
+        '''Returns the MinHash signature of the text, None without words'''
+        hashes = shingles(text, self.k)
+        if not len(hashes):
+            return None
+        permuted = (np.outer(hashes, self.a) + self.b) % PRIME & MAX_HASH
+        return permuted.min(axis=0).astype(np.uint32)
+
+    def band_keys(self, signature):
+        return [signature[band*self.rows:(band+1)*self.rows].tobytes()
+                for band in range(self.bands)]
+
+    def matrix(self):
+        '''Returns the signatures, stacking the pending inserts'''
+        if self.pending:
+            self.signatures = np.vstack([self.signatures,
+                                         np.array(self.pending)])
+            self.pending = []
+        return self.signatures
+
+    def insert(self, text: str, group, key=None):
+        '''
+        Adds a labeled ticket, key defaults to its position in the index.
+        The blank tickets are skipped, they would all match each other
+        '''
+        signature = self.signature(text)
+        if signature is not None:
+            self.add_signature(signature, group, key)
+
+    def add_signature(self, signature, group, key=None):
+        idx = len(self.groups)
+        self.pending.append(signature)
+        self.groups.append(str(group))
+        self.keys.append(idx if key is None else key)
+        for band, band_key in enumerate(self.band_keys(signature)):
+            self.buckets[band][band_key].append(idx)
+
+    def candidates(self, signature):
+        found = set()
+        for band, band_key in enumerate(self.band_keys(signature)):
+            found.update(self.buckets[band].get(band_key, ()))
+        return sorted(found)
+
+    def lookup(self, text: str, threshold=None):
+        '''
+        Returns the key, group and estimated Jaccard similarity of the
+        most similar labeled ticket sharing an LSH bucket with the text,
+        None when below the threshold or when the text has no words
+        '''
+        threshold = self.threshold if threshold is None else threshold
+        self.lookups += 1
+        signature = self.signature(text)
+        if signature is None:
+            return None
+        candidates = self.candidates(signature)
+        if not candidates:
+            return None
+        similarity = (self.matrix()[candidates] == signature).mean(axis=1)
+        best = int(np.argmax(similarity))
+        if similarity[best] < threshold:
+            return None
+        self.hits += 1
+        idx = candidates[best]
+        return {'key': self.keys[idx],
+                'group': self.groups[idx],
+                'similarity': round(float(similarity[best]), 4)}
+
+    def __len__(self):
+        return len(self.groups)
+
+    def stats(self):
+        return {'tickets': len(self),
+                'lookups': self.lookups,
+                'hits': self.hits,
+                'hit_rate': self.hits/self.lookups if self.lookups else 0.0}
+
+    def save(self, path: Path):
+        '''Snapshots the index as <path>.npz signatures and <path>.json'''
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        np.savez_compressed(path.with_suffix('.npz'),
+                            signatures=self.matrix())
+        with open(path.with_suffix('.json'), 'w') as fp:
+            json.dump({'threshold': self.threshold, 'bands': self.bands,
+                       'rows': self.rows, 'k': self.k, 'seed': self.seed,
+                       'groups': self.groups, 'keys': self.keys}, fp)
+
+    @classmethod
+    def load(cls, path: Path):
+        '''Loads a snapshot, rebuilding the LSH buckets'''
+        path = Path(path)
+        if check_file_exists(path.with_suffix('.json')):
+            with open(path.with_suffix('.json'), 'r') as fp:
+                meta = json.load(fp)
+        index = cls(meta['threshold'], meta['bands'], meta['rows'],
+                    meta['k'], meta['seed'])
+        signatures = np.load(path.with_suffix('.npz'))['signatures']
+        for signature, group, key in zip(signatures, meta['groups'],
+                                         meta['keys']):
+            index.add_signature(signature, group, key)
+        index.matrix()
+        return index
@@ -0,0 +1,130 @@
+import os
+import json
+import tempfile
+from pathlib import Path
+
+import joblib
+import numpy as np
+
+from utils import clean_texts, iter_chunks, load_json
+
+# next to the repo, whatever the cwd of the notebook
+CHECKPOINT_DIR = Path(__file__).resolve().parents[1] / 'models' / 'online'
+
+
+def stream_rows(path: Path, text_col='merged_description', label_col='group',
+                chunksize=1000):
+    '''
+    Yields (texts, labels) chunks of the dataset without loading all of
+    it, the csv and parquet files are read chunk by chunk, the xlsx files
+    through their parquet conversion by load_dataset
+    '''
+    columns = [text_col, label_col]
+    for chunk in iter_chunks(path, columns, chunksize):
+        chunk = chunk.dropna(subset=columns)
+        yield chunk[text_col].astype(str).tolist(), \
+            chunk[label_col].astype(str).tolist()
+
+
+class OnlineClassifier:
+    '''
+    Incrementally trained ticket classifier, a HashingVectorizer (no
+    vocabulary to refit) feeding an SGDClassifier updated by partial_fit
+    on each chunk of new labeled tickets, checkpointed with joblib.
+    Its memory is the fixed n_features x classes weights, whatever the
+    number of tickets seen
+    eg: clf = OnlineClassifier.load()
+        clf.partial_fit(new_texts, new_groups)
+        clf.checkpoint()
+        clf.predict(["unable to login to erp"])
+    '''
+
+    def __init__(self, classes, n_features=2**18, ngram_range=(1, 2),
+                 alpha=1e-5, checkpoint_dir=CHECKPOINT_DIR,
+                 keep=3):
+        from sklearn.linear_model import SGDClassifier
+        from sklearn.feature_extraction.text import HashingVectorizer
+
+        self.classes = np.array(sorted(set(map(str, classes))))
+        self.vectorizer = HashingVectorizer(n_features=n_features,
+                                            ngram_range=ngram_range,
+                                            alternate_sign=False,
+                                            norm='l2')
+        # modified_huber gives predict_proba and partial_fit
+        self.model = SGDClassifier(loss='modified_huber', alpha=alpha,
+                                   random_state=7)
+        self.checkpoint_dir = Path(checkpoint_dir)
+        self.keep = keep
+        self.seen = 0
+
+    def features(self, texts):
+        return self.vectorizer.transform(
+            [text.lower() for text in clean_texts(list(texts))])
+
+    def partial_fit(self, texts, labels):
+        '''Updates the model with a chunk of labeled tickets'''
+        labels = [str(label) for label in labels]
+        unknown = set(labels) - set(self.classes.tolist())
+        if unknown:
+            raise ValueError(f"Unknown groups: {sorted(unknown)}, "
+                             f"the classes are fixed at creation")
+        self.model.partial_fit(self.features(texts), np.asarray(labels),
+                               classes=self.classes)
+        self.seen += len(labels)
+        return self
+
+    def fit_stream(self, chunks, checkpoint_every=None):
+        '''
+        Given an iterable of (texts, labels) chunks such as stream_rows,
+        updates the model chunk by chunk, checkpointing every
+        checkpoint_every chunks and at the end
+        '''
+        for idx, (texts, labels) in enumerate(chunks, 1):
+            self.partial_fit(texts, labels)
+            if checkpoint_every and idx % checkpoint_every == 0:
+                self.checkpoint()
+        return self.checkpoint()
+
+    def predict(self, texts):
+        return self.model.predict(self.features(texts))
+
+    def predict_proba(self, texts):
+        return self.model.predict_proba(self.features(texts))
+
+    def checkpoint(self):
+        '''
+        Saves the model state as online_<tickets seen>.joblib, points
+        latest.json to it and removes all but the keep last ones
+        '''
+        self.checkpoint_dir.mkdir(parents=True, exist_ok=True)
+        name = f'online_{self.seen:09d}.joblib'
+        # the weights of the hashed features never seen are zeros
+        joblib.dump(self, self.checkpoint_dir / name, compress=3)
+        # a load never sees a partly written latest.json
+        fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=self.checkpoint_dir)
+        with os.fdopen(fd, 'w') as fp:
+            json.dump({'checkpoint': name, 'seen': self.seen}, fp)
+        os.replace(tmp, self.checkpoint_dir / 'latest.json')
+        for old in sorted(self.checkpoint_dir.glob('online_*.joblib'))[
+                :-self.keep]:
+            old.unlink()
+        return self.checkpoint_dir / name
+
+    @classmethod
+    def load(cls, checkpoint_dir=CHECKPOINT_DIR, classes=None,
+             **kwargs):
+        '''
+        Warm starts from the latest checkpoint of checkpoint_dir, or
+        creates a new classifier of the classes when there is none
+        '''
+        checkpoint_dir = Path(checkpoint_dir)
+        latest = checkpoint_dir / 'latest.json'
+        if latest.is_file():
+            clf = joblib.load(checkpoint_dir /
+                              load_json(latest)['checkpoint'])
+            clf.checkpoint_dir = checkpoint_dir
+            return clf
+        if classes is None:
+            raise FileNotFoundError(f"No checkpoint in: {checkpoint_dir}, "
+                                    f"the classes are needed to start")
+        return cls(classes, checkpoint_dir=checkpoint_dir, **kwargs)
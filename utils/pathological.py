@@ -0,0 +1,30 @@
+import random
+import string
+
+
+def pathological_tickets(size=5000, seed=0):
+    '''
+    Returns (name, text) pairs of the adversarial tickets the handlers
+    regexes backtrack on, to time the handlers against
+    eg: Input = size=5000
+        Output = [('base64_blob', 'please find the attachment ...'), ...]
+    '''
+    rng = random.Random(seed)
+    b64 = string.ascii_letters + string.digits + '+/'
+    blob = ''.join(rng.choice(b64) for _ in range(size))
+    frames = ' '.join(f'at com.acme.service.Handler{idx}.run'
+                      f'(Handler{idx}.java:{idx*7})'
+                      for idx in range(size//40))
+    digits = ' '.join(str(rng.randint(0, 99)) for _ in range(size//3))
+    return [('base64_blob', f'please find the attachment {blob}=='),
+            ('stack_trace', f'exception in thread main {frames}'),
+            ('link_punct', 'http://' + '!'*size),
+            ('link_parens', 'http://a.com/' + '('*size),
+            ('email_hyphens', 'a@' + 'a-'*(size//2) + '!'),
+            ('email_dots', 'a' + '.a'*(size//2) + '@'),
+            ('letter_run', 'a'*size),
+            ('digit_run', '1'*size),
+            ('digit_tokens', f'tel {digits}'),
+            ('space_run', 'tel' + ' '*size + '1'),
+            ('dot_run', 'a' + '.'*size + 'com')]
+
@@ -0,0 +1,74 @@
+import json
+from pathlib import Path
+
+
+class PatternProfiler:
+    '''
+    Records for each compiled pattern of a handler the cumulative scan
+    time, the match count and the final token tags its matches cover
+    '''
+
+    def __init__(self, names):
+        self.names = list(names)
+        self.seconds = [0.0]*len(self.names)
+        self.matches = [0]*len(self.names)
+        self.tags = [0]*len(self.names)
+        self.total_tags = 0
+        self.tickets = 0
+        # the spans of each pattern in the ticket being tagged
+        self.spans = [[] for _ in self.names]
+
+    def record(self, idx, seconds, spans):
+        '''Adds the scan time and the (start, end) spans of a pattern'''
+        self.seconds[idx] += seconds
+        self.matches[idx] += len(spans)
+        self.spans[idx] = spans
+
+    def credit(self, tok_index, indices):
+        '''
+        Given the TokenIndex and the final tagged indices of the ticket,
+        credits each pattern with the tagged tokens its spans cover,
+        a token covered by several patterns is credited to each of them.
+        Called for every ticket, tok_index is None when no pattern matched
+        or the ticket was skipped before the scan
+        '''
+        self.tickets += 1
+        self.total_tags += len(indices)
+        tagged = set(indices)
+        for idx, spans in enumerate(self.spans):
+            if tok_index is None:
+                break
+            covered = set()
+            for start, end in spans:
+                covered.update(tok_index.span_tokens(start, end))
+            self.tags[idx] += len(covered & tagged)
+        self.spans = [[] for _ in self.names]
+
+    def report(self):
+        '''Returns a row per pattern sorted by the cumulative scan time'''
+        rows = []
+        for idx, name in enumerate(self.names):
+            rows.append({'pattern': idx,
+                         'name': name,
+                         'seconds': round(self.seconds[idx], 6),
+                         'matches': self.matches[idx],
+                         'tags': self.tags[idx],
+                         'tag_share': round(self.tags[idx]/self.total_tags, 4)
+                         if self.total_tags else 0.0})
+        return sorted(rows, key=lambda row: row['seconds'], reverse=True)
+
+    def dump(self, path=None):
+        '''Writes the report as json to path, or prints it as a table'''
+        rows = self.report()
+        if path is not None:
+            with open(Path(path), 'w') as fp:
+                json.dump({'tickets': self.tickets,
+                           'total_tags': self.total_tags,
+                           'patterns': rows}, fp, indent=2)
+            return
+        print(f'{"pattern":<20}{"seconds":>10}{"matches":>10}'
+              f'{"tags":>8}{"share":>8}')
+        for row in rows:
+            print(f'{row["name"]:<20}{row["seconds"]:>10.4f}'
+                  f'{row["matches"]:>10}{row["tags"]:>8}'
+                  f'{row["tag_share"]:>8.1%}')
@@ -0,0 +1,340 @@
+'''
+Streams the raw tickets chunk by chunk from the input file to the output
+file through the preprocessing steps enabled in config.hjson, fused in
+a single function per ticket, with the time spent in each step
+eg: python preprocess_pipeline.py --input ../data/input_data.xlsx
+        --output ../data/cleaned_data.csv --n-jobs 4 --profile
+'''
+import sys
+import time
+import argparse
+from pathlib import Path
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from utils import load_hjson, iter_chunks
+import cleaning
+
+# the config of the repo, whatever the cwd of the process loading it
+CONFIG_PATH = Path(__file__).resolve().parents[1] / 'config' / 'config.hjson'
+TEXT_COLS = {'Short description': 'cleaned_short_description',
+             'Description': 'cleaned_description'}
+CALLER_COL = 'Caller'
+# the template id of the security log alerts of the Description, when
+# clean_security_logs is enabled
+TEMPLATE_COLS = {'Description': 'log_template'}
+
+# the text steps of each config flag, in the order they run
+STEPS = {'fix_encoding': cleaning.fix_encoding,
+         'clean_security_logs': cleaning.clean_security_logs,
+         'clean_html_tags': cleaning.clean_html_tags,
+         'strip_anchors': cleaning.strip_anchors,
+         'clean_emails': cleaning.clean_emails,
+         'strip_callers': cleaning.strip_callers,
+         'strip_irrelevant': cleaning.strip_irrelevant,
+         # before replace_accented folds the mojibake into ascii letters
+         'strip_mojibake': cleaning.strip_mojibake,
+         'replace_accented': cleaning.replace_accented,
+         'clean_contractions': cleaning.clean_contractions,
+         'remove_gibberish': cleaning.clean_gibberish,
+         'remove_special': cleaning.remove_special,
+         'lower': cleaning.lower,
+         'strip_numbers': cleaning.strip_numbers}
+# the spaCy steps, run on the whole chunk by nlp.pipe between the text
+# steps and the word steps
+NLP_STEPS = ('tokenize_text', 'get_lemmas')
+WORD_STEPS = {'strip_stopwords': cleaning.strip_stopwords,
+              'remove_oov': cleaning.clean_oov,
+              'clean_whitespace': cleaning.clean_whitespace}
+# the steps taking the caller name of the ticket
+CALLER_STEPS = ('strip_callers',)
+# the steps only the mojibake suspects go through, see cleaning.text_path,
+# the general normalization of remove_gibberish runs on every path
+SUSPECT_STEPS = ('fix_encoding', 'strip_mojibake')
+
+
+def fuse(steps, seconds=None, paths=None):
+    '''
+    Given the (name, step) pairs, returns a single function running the
+    steps in order on a text, adding the time of each step to the
+    seconds Counter when given. When there are SUSPECT_STEPS, the text is
+    classified once by cleaning.text_path, counted in the paths Counter,
+    and only the suspects go through them
+    '''
+    steps = tuple((name, step, name in CALLER_STEPS, name in SUSPECT_STEPS)
+                  for name, step in steps)
+    gated = any(suspect_only for *_, suspect_only in steps)
+    paths = Counter() if paths is None else paths
+
+    if seconds is None:
+        def fused(text, caller=''):
+            suspect = False
+            if gated:
+                path = cleaning.text_path(text)
+                paths[path] += 1
+                suspect = path == cleaning.SUSPECT
+            for _, step, with_caller, suspect_only in steps:
+                if suspect_only and not suspect:
+                    continue
+                text = step(text, caller) if with_caller else step(text)
+            return text
+        return fused
+
+    def timed(text, caller=''):
+        suspect = False
+        if gated:
+            began = time.perf_counter()
+            path = cleaning.text_path(text)
+            paths[path] += 1
+            suspect = path == cleaning.SUSPECT
+            seconds['text_path'] += time.perf_counter() - began
+        for name, step, with_caller, suspect_only in steps:
+            if suspect_only and not suspect:
+                continue
+            began = time.perf_counter()
+            text = step(text, caller) if with_caller else step(text)
+            seconds[name] += time.perf_counter() - began
+        return text
+    return timed
+
+
+class PreprocessPipeline:
+    '''
+    The preprocessing steps of the flags enabled in config.hjson (a path
+    or the loaded dict), compiled once into the fused text and word
+    functions, applied to the text_cols of each chunk into their cleaned
+    columns
+    eg: pipeline = PreprocessPipeline({'clean_emails': True,
+                                       'strip_callers': True,
+                                       'lower': True,
+                                       'clean_whitespace': True})
+        pipeline.clean("received from: John.Doe@gmail.com John VPN down",
+                       caller="john doe")
+        -> "vpn down"
+    '''
+
+    def __init__(self, config=CONFIG_PATH, text_cols=None,
+                 caller_col=CALLER_COL, profile=False, batch_size=256):
+        if isinstance(config, (str, Path)):
+            config = load_hjson(Path(config))
+        self.config = dict(config)
+        self.text_cols = dict(text_cols or TEXT_COLS)
+        self.caller_col = caller_col
+        self.profile = profile
+        self.batch_size = batch_size
+        self.seconds = Counter()
+        self.paths = Counter()
+        self.tickets = 0
+
+        enabled = {name for name, value in self.config.items()
+                   if value is True}
+        self.steps = [name for name in list(STEPS) + list(NLP_STEPS) +
+                      list(WORD_STEPS) if name in enabled]
+        seconds = self.seconds if profile else None
+        self.text_fn = fuse([(name, STEPS[name]) for name in STEPS
+                             if name in enabled], seconds, self.paths)
+        self.word_fn = fuse([(name, WORD_STEPS[name]) for name in WORD_STEPS
+                             if name in enabled], seconds)
+        self.template_cols = dict(TEMPLATE_COLS) \
+            if 'clean_security_logs' in enabled else {}
+        self.lemmas = 'get_lemmas' in enabled
+        self.nlp = None
+        if self.lemmas or 'tokenize_text' in enabled:
+            from tokenize_stage import load_nlp
+
+            self.nlp = load_nlp(config=self.config)
+
+    def tokenize(self, texts):
+        '''Returns the texts joined back from their tokens or lemmas'''
+        from tokenize_stage import tokenize_records
+
+        began = time.perf_counter()
+        tokenized = [' '.join(record[3] if self.lemmas else record[1])
+                     for record in tokenize_records(
+                         texts, self.nlp, self.batch_size,
+                         with_lemmas=self.lemmas)]
+        if self.profile:
+            self.seconds['get_lemmas' if self.lemmas else 'tokenize_text'] \
+                += time.perf_counter() - began
+        return tokenized
+
+    def clean_many(self, texts, callers=None):
+        '''Returns the cleaned texts, the values other than str are kept'''
+        callers = callers if callers is not None else [''] * len(texts)
+        cleaned = [self.text_fn(text, caller if isinstance(caller, str)
+                                else '') if isinstance(text, str) else text
+                   for text, caller in zip(texts, callers)]
+        if self.nlp is not None:
+            idx = [i for i, text in enumerate(cleaned)
+                   if isinstance(text, str)]
+            for i, text in zip(idx, self.tokenize([cleaned[i]
+                                                   for i in idx])):
+                cleaned[i] = text
+        return [self.word_fn(text) if isinstance(text, str) else text
+                for text in cleaned]
+
+    def clean(self, text: str, caller=''):
+        return self.clean_many([text], [caller])[0]
+
+    def process_chunk(self, chunk):
+        '''
+        Returns the DataFrame chunk with the cleaned text columns and the
+        template id columns of the alerts
+        '''
+        chunk = chunk.copy()
+        for col, template_col in self.template_cols.items():
+            if col in chunk.columns:
+                # string dtype, the chunks without alerts keep the schema
+                chunk[template_col] = pd.Series(
+                    [cleaning.security_log_template(text)
+                     for text in chunk[col].tolist()],
+                    index=chunk.index, dtype='string')
+        callers = chunk[self.caller_col].tolist() \
+            if self.caller_col in chunk.columns else None
+        for col, cleaned_col in self.text_cols.items():
+            if col in chunk.columns:
+                chunk[cleaned_col] = self.clean_many(chunk[col].tolist(),
+                                                     callers)
+        self.tickets += len(chunk)
+        return chunk
+
+    def run(self, input_path: Path, output_path: Path, chunksize=1000,
+            n_jobs=1):
+        '''
+        Streams the input file to the output file (csv or parquet) chunk
+        by chunk, holding at most 2 x n_jobs chunks in memory, the chunks
+        are cleaned by n_jobs worker processes when n_jobs > 1. Returns
+        the number of tickets written
+        '''
+        writer = ChunkWriter(output_path)
+        chunks = iter_chunks(input_path, chunksize=chunksize)
+        try:
+            if n_jobs == 1:
+                for chunk in chunks:
+                    writer.write(self.process_chunk(chunk))
+                return writer.rows
+            with ProcessPoolExecutor(max_workers=n_jobs,
+                                     initializer=init_worker,
+                                     initargs=(self.config, self.text_cols,
+                                               self.caller_col,
+                                               self.profile,
+                                               self.batch_size)) as executor:
+                pending = deque()
+                for chunk in chunks:
+                    pending.append(executor.submit(process_chunk, chunk))
+                    if len(pending) >= 2*n_jobs:
+                        self.collect(pending.popleft().result(), writer)
+                while pending:
+                    self.collect(pending.popleft().result(), writer)
+            return writer.rows
+        finally:
+            writer.close()
+
+    def collect(self, result, writer):
+        chunk, seconds, paths = result
+        self.seconds.update(seconds)
+        self.paths.update(paths)
+        self.tickets += len(chunk)
+        writer.write(chunk)
+
+    def report(self):
+        '''Returns the seconds and share of the time of each step'''
+        total = sum(self.seconds.values())
+        names = (['text_path'] if 'text_path' in self.seconds else []) + \
+            self.steps
+        return {name: {'seconds': round(self.seconds[name], 4),
+                       'share': round(self.seconds[name]/total, 4)
+                       if total else 0.0}
+                for name in names}
+
+
+class ChunkWriter:
+    '''Appends DataFrame chunks to a csv or parquet file'''
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        if self.path.suffix not in ('.csv', '.parquet'):
+            raise ValueError(f"Unsupported output format: {self.path.suffix}"
+                             f", expected .csv or .parquet")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.writer = None
+        self.rows = 0
+
+    def write(self, chunk):
+        if self.path.suffix == '.csv':
+            chunk.to_csv(self.path, mode='a' if self.rows else 'w',
+                         header=not self.rows, index=False)
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            if self.writer is None:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                self.writer = pq.ParquetWriter(self.path, table.schema)
+            else:
+                # the columns all null in a chunk take the first schema
+                table = pa.Table.from_pandas(chunk, preserve_index=False,
+                                             schema=self.writer.schema)
+            self.writer.write_table(table)
+        self.rows += len(chunk)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+# the pipeline of the worker process, compiled once by init_worker
+_pipeline = None
+
+
+def init_worker(config, text_cols, caller_col, profile, batch_size):
+    global _pipeline
+    _pipeline = PreprocessPipeline(config, text_cols, caller_col, profile,
+                                   batch_size)
+
+
+def process_chunk(chunk):
+    '''
+    Cleans a chunk in the worker, returning the time of its steps and the
+    cleaning paths of its texts
+    '''
+    _pipeline.seconds.clear()
+    _pipeline.paths.clear()
+    return _pipeline.process_chunk(chunk), Counter(_pipeline.seconds), \
+        Counter(_pipeline.paths)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--config', type=Path, default=CONFIG_PATH)
+    parser.add_argument('--input', type=Path,
+                        default=Path('../data/input_data.xlsx'))
+    parser.add_argument('--output', type=Path,
+                        default=Path('../data/cleaned_data.csv'))
+    parser.add_argument('--chunksize', type=int, default=1000)
+    parser.add_argument('--n-jobs', type=int, default=1)
+    parser.add_argument('--profile', action='store_true',
+                        help='report the time spent in each step')
+    args = parser.parse_args(argv)
+
+    pipeline = PreprocessPipeline(args.config, profile=args.profile)
+    began = time.perf_counter()
+    rows = pipeline.run(args.input, args.output, args.chunksize, args.n_jobs)
+    elapsed = time.perf_counter() - began
+    print(f'{rows} tickets in {elapsed:.2f}s -> {args.output}')
+    print(f'steps: {", ".join(pipeline.steps)}')
+    if pipeline.paths:
+        print('paths: ' + ', '.join(f'{path} {count}' for path, count
+                                    in pipeline.paths.most_common()))
+    if args.profile:
+        print(f'{"step":<22}{"seconds":>10}{"share":>8}')
+        for name, res in pipeline.report().items():
+            print(f'{name:<22}{res["seconds"]:>10.3f}{res["share"]:>8.1%}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
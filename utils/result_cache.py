@@ -0,0 +1,158 @@
+import re
+import copy
+import pickle
+import shelve
+import hashlib
+from pathlib import Path
+from functools import wraps
+from collections import OrderedDict
+
+_missing = object()
+# part of every memoized key, bumped when the results change format so
+# the persistent tier written by the previous code is not read back
+FORMAT_VERSION = 1
+
+
+def strip_lower(text):
+    '''The normalization the handlers apply before matching'''
+    return text.strip().lower() if isinstance(text, str) else text
+
+
+def pattern_sources(obj, seen=None):
+    '''
+    Returns the sorted (source, flags) of the compiled patterns held by
+    obj, its attributes and their containers, the config of a handler
+    eg: Input = handler with handler.pattern = re.compile(r'\\d+')
+        Output = [('\\d+', 32)]
+    '''
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return []
+    seen.add(id(obj))
+    if isinstance(obj, re.Pattern):
+        return [(obj.pattern, obj.flags)]
+    if isinstance(obj, dict):
+        items = obj.values()
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        items = obj
+    elif hasattr(obj, '__dict__') and not isinstance(obj, type):
+        items = vars(obj).values()
+    else:
+        return []
+    return sorted({source for item in items
+                   for source in pattern_sources(item, seen)})
+
+
+class ResultCache:
+    '''
+    Bounded LRU memo of the results of match_ref, clean_text or any
+    function of a ticket text, with an optional on-disk persistent tier
+    eg: cache = ResultCache(maxsize=50000, path=Path('cache/tags'))
+        match_ref = cache.memoize(EntityHandler().match_ref,
+                                  normalize=strip_lower)
+    '''
+
+    def __init__(self, maxsize=65536, path=None):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.store = None
+        if path is not None:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self.store = shelve.open(str(path))
+
+    @staticmethod
+    def key(*parts):
+        '''Returns the hash of the pickled parts'''
+        data = pickle.dumps(parts, protocol=pickle.HIGHEST_PROTOCOL)
+        return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+    def get(self, key, default=None):
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        if self.store is not None and key in self.store:
+            value = self.store[key]
+            self.disk_hits += 1
+            self.put(key, value, persist=False)
+            return value
+        self.misses += 1
+        return default
+
+    def put(self, key, value, persist=True):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+        if persist and self.store is not None:
+            self.store[key] = value
+
+    def memoize(self, func, normalize=None):
+        '''
+        Returns func caching its results, keyed on the hash of the
+        normalized first argument (the ticket text) and the remaining
+        arguments (the token list, tags list, ...). The key also holds
+        FORMAT_VERSION and, for a bound method, the patterns of its
+        instance as they are when memoized, so the handlers configured
+        differently don't share their persisted results
+        '''
+        name = (FORMAT_VERSION, f'{func.__module__}.{func.__qualname__}',
+                self.key(pattern_sources(getattr(func, '__self__', None))))
+
+        @wraps(func)
+        def wrapper(text, *args, **kwargs):
+            key_text = normalize(text) if normalize else text
+            key = self.key(name, key_text, args, sorted(kwargs.items()))
+            result = self.get(key, _missing)
+            if result is _missing:
+                result = func(text, *args, **kwargs)
+                self.put(key, result)
+            # the callers may mutate the returned lists
+            return copy.deepcopy(result)
+        return wrapper
+
+    def stats(self):
+        lookups = self.hits + self.disk_hits + self.misses
+        return {'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits+self.disk_hits)/lookups
+                if lookups else 0.0,
+                'size': len(self.entries),
+                'evictions': self.evictions}
+
+    def clear(self):
+        self.entries.clear()
+        if self.store is not None:
+            self.store.clear()
+
+    def close(self):
+        if self.store is not None:
+            self.store.close()
+            self.store = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+if __name__ == '__main__':
+    from pprint import pprint
+    from entity_handler import EntityHandler
+
+    cache = ResultCache(maxsize=1000)
+    match_ref = cache.memoize(EntityHandler().match_ref,
+                              normalize=strip_lower)
+    test = "source ip : 10.1.2.3 event id : 4625 on 12/03 mail a.b@c.com"
+    toks = test.split()
+    for _ in range(1000):
+        indices = match_ref(test, toks, ['O']*len(toks))
+    pprint(indices)
+    pprint(cache.stats())
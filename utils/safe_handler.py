@@ -0,0 +1,83 @@
+import re
+import time
+
+from entity_handler import EntityHandler
+from deadline_scan import OVERLAP
+
+
+class SafeHandler:
+    '''
+    Bounds the time the match_ref of a handler spends on a ticket.
+    The runs of non-whitespace chars longer than max_token_len (base64
+    blobs, hashes, minified stack traces) are masked before matching,
+    the text past max_chars is dropped, and the handler scan stops once
+    budget seconds plus char_budget seconds per char of the ticket are
+    spent on it, checked every deadline_scan.WINDOW chars. The ticket
+    keeps the tags of the matches found before the deadline
+    eg: handler = SafeHandler(EntityHandler(safe=True), budget=0.05)
+        indices = handler.match_ref(text, token_list, tags_list)
+    '''
+
+    def __init__(self, handler, max_token_len=256, max_chars=20000,
+                 budget=0.05, char_budget=1e-5):
+        if max_token_len > OVERLAP // 2:
+            raise ValueError(f"max_token_len must be at most {OVERLAP//2}"
+                             f" for the windows of the scan to hold the "
+                             f"whole matches, got {max_token_len}")
+        self.handler = handler
+        self.max_token_len = max_token_len
+        self.max_chars = max_chars
+        self.budget = budget
+        self.char_budget = char_budget
+        self.long_run = re.compile(r'\S{%d,}' % (max_token_len+1))
+        self.masked = 0
+        self.timeouts = 0
+
+    def mask(self, text):
+        '''
+        Given a text, returns it with the overlong runs replaced by the
+        same number of NUL chars, so the match offsets still map to the
+        tokens. A NUL is matched by \\W and the link path class, but the
+        runs are whole tokens between whitespace and no pattern matches a
+        token of NULs, the matches next to one are tagged as next to any
+        other token
+        eg: Input = "id " + "A"*300 + " on 12/03", max_token_len = 256
+            Output = "id " + "\\x00"*300 + " on 12/03"
+        '''
+        text = text[:self.max_chars]
+        masked = self.long_run.sub(lambda match: '\x00'*len(match.group(0)),
+                                   text)
+        if masked != text:
+            self.masked += 1
+        return masked
+
+    def match_ref(self, text, token_list, tags_list, **kwargs):
+        text = self.mask(text)
+        if self.budget is not None:
+            # the tickets twice as long get twice the char budget
+            self.handler.deadline = time.perf_counter() + self.budget + \
+                self.char_budget*len(text)
+        try:
+            return self.handler.match_ref(text, token_list, tags_list,
+                                          **kwargs)
+        finally:
+            if self.handler.timed_out:
+                self.timeouts += 1
+            self.handler.deadline = None
+
+    def stats(self):
+        return {'masked': self.masked, 'timeouts': self.timeouts}
+
+
+
+if __name__ == '__main__':
+    from pprint import pprint
+    from pathological import pathological_tickets
+
+    handler = SafeHandler(EntityHandler(safe=True))
+    for name, text in pathological_tickets():
+        toks = text.split()
+        began = time.perf_counter()
+        handler.match_ref(" ".join(toks), toks, ['O']*len(toks))
+        print(f'{name:<20}{time.perf_counter()-began:>10.4f}s')
+    pprint(handler.stats())
@@ -1,11 +1,16 @@
 import re
+import time
 # import phonenumbers as pn
 
+from token_index import TokenIndex, tagged_index
+from pattern_profiler import PatternProfiler
+from deadline_scan import scan
+
 
 class TelHandler:
     '''Matches telephone numbers in the text'''
 
-    def __init__(self):
+    def __init__(self, profile=False):
         beg = r'(?:\s|^)('
         end = r')(?:\s|$)'
         start = r'^('
@@ -133,6 +138,42 @@ class TelHandler:
                     russia_pattern, us_pattern, uk_pattern]
 
         self.patterns = [re.compile(p) for p in patterns]
+        self.pattern_names = ['generic_pattern', 'generic_pattern_2',
+                              'generic_pattern_3', 'generic_pattern_4',
+                              'generic_pattern_5', 'generic_pattern_6',
+                              'generic_pattern_7', 'generic_pattern_8',
+                              'generic_pattern_9', 'brazil_pattern',
+                              'canada_pattern', 'china_pattern_1',
+                              'china_pattern_2', 'germany_pattern',
+                              'india_pattern', 'indonesia_pattern',
+                              'japan_pattern', 'russia_pattern',
+                              'us_pattern', 'uk_pattern']
+        # records the time, matches and tags of each pattern if profiling
+        self.profiler = PatternProfiler(self.pattern_names) \
+            if profile else None
+        # the perf_counter time after which the scan stops, the matches
+        # found before it are kept and timed_out is set
+        self.deadline = None
+        self.timed_out = False
+
+        # the chars the matches of each pattern can start with, so the
+        # positions where a pattern can't match are skipped upfront.
+        # Every anchor is a word followed by a non-word char or digit
+        anchor_word = r'(?:telephone|tel|phone|cell|direct|mobile|' \
+            r'number|fax|facsimile|f|t)[\W\d]'
+        self.guards = [rf'(?=(?:\s|^){anchor_word})'] * len(patterns)
+        self.guards[5:9] = [r'^'] * 4
+        self.guards[patterns.index(china_pattern_2)] = \
+            rf'(?=(?:\s|^)(?:{anchor_word}| ))'
+        self.guards[patterns.index(india_pattern)] = \
+            rf'(?=(?:\s|^)(?:{anchor_word}|\d))'
+
+        # the literals every match holds: a digit, and an anchor word or
+        # a leading number, the tickets missing any skip the patterns
+        self.prefilters = [re.compile(r'\d'),
+                           re.compile(rf'(?:\s|^){anchor_word}|^[+\d]|'
+                                      r'\d{5}| 134')]
+        self.skipped = 0
 
     def get_tok_indexlist(self, token_list):
         '''
@@ -167,60 +208,76 @@ class TelHandler:
 
     def find_tel_regex(self, text):
         tels = list()
-        for _, pattern in enumerate(self.patterns):
-            matches = re.finditer(pattern, text.lower())
+        text = text.lower()
+        self.timed_out = False
+        for idx, pattern in enumerate(self.patterns):
+            began = time.perf_counter()
+            matches = []
+            try:
+                matches.extend(scan(pattern, text, self.deadline))
+            except TimeoutError:
+                self.timed_out = True
+            if self.profiler is not None:
+                self.profiler.record(idx, time.perf_counter()-began,
+                                     [(match.start(), match.end()-1)
+                                      for match in matches])
             for match in matches:
                 tels.extend([(match.start(),
                               match.end()-1,
                               match.group(0).strip())])
+            if self.timed_out:
+                break
         return tels
 
-    def return_tel_index(self, matches, char_map, tags_list):
+    def return_tel_index(self, matches, tok_index, tags_list):
         '''
-        Given the matched groups,token_list,token_tags,char_mapping, extract
+        Given the matched groups,token_list,token_tags,tok_index, extract
         index of the tags_list to be qualified as MAIL for SPV
         '''
         words_include = []
         for match in matches:
-            start = match[0]
-            end = match[1]
-            include = list(range(start, end, 1))
-            words = list(
-                set([value for key, value in char_map.items()
-                     if key in include]))
-            words_include.extend(words)
-        existing_tags_index = [idx for idx, tag in
-                               enumerate(tags_list) if tag != "O"]
+            words_include.extend(
+                tok_index.span_tokens(match[0], match[1]))
+        existing_tags_index = tagged_index(tags_list)
         words_include_filtered = [i for i in words_include
                                   if i not in existing_tags_index]
         return words_include_filtered
 
+    def index_matches(self, matches, tok_index, token_list, tags_list):
+        '''
+        Given the matches from find_tel_regex, return the sorted unique
+        index of the tags_list to be qualified as TEL
+        '''
+        tel_indices = self.return_tel_index(matches, tok_index, tags_list)
+        return sorted(list(set(tel_indices)))
+
     def match_ref(self, text, token_list, tags_list, entity='', verbose=False):
         tel_indices = []
+        tok_index = None
         text = text.strip().lower()
-
-        matches = self.find_tel_regex(text)
-        if len(matches) > 0:
-            char_map = self.char_mapping(token_list)
-            tel_indices = self.return_tel_index(matches, char_map, tags_list)
-            tel_indices = sorted(list(set(tel_indices)))
-            if verbose and len(tel_indices) > 0:  # pragma: no cover <--
-                print(f'\nFinal Matches {entity}: '
-                      f'{[token_list[idx] for idx in tel_indices]}\n')
+        if not all(p.search(text) for p in self.prefilters):
+            self.skipped += 1
+        else:
+            matches = self.find_tel_regex(text)
+            if len(matches) > 0:
+                tok_index = TokenIndex(token_list)
+                tel_indices = self.index_matches(matches, tok_index,
+                                                 token_list, tags_list)
+                if verbose and len(tel_indices) > 0:  # pragma: no cover <--
+                    print(f'\nFinal Matches {entity}: '
+                          f'{[token_list[idx] for idx in tel_indices]}\n')
+        if self.profiler is not None:
+            # every ticket counts, the skipped ones included
+            self.profiler.credit(tok_index, tel_indices)
         return tel_indices
 
 
 if __name__ == '__main__':
-    import spacy
     from pprint import pprint
-    nlp = spacy.load('en_core_web_sm')
+    from tokenize_stage import tokenize_records
 
     test = "COMPANY REGISTRATION NUMBER 273 7924"
-    doc = nlp(test)
-    toks = [t.text for t in doc]
-    toks = [t.strip() for t in toks]
-    text = " ".join(toks)
-    tags = ['O']*len(doc)
+    text, toks, tags = next(tokenize_records([test]))
     tag = "TEL"
     tel_hdlr = TelHandler()
     tel_indices = tel_hdlr.match_ref(text, toks, tags,
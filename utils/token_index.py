@@ -0,0 +1,41 @@
+from bisect import bisect_left, bisect_right
+
+
+class TokenIndex:
+    '''Maps the character spans of the space joined tokens to the tokens'''
+
+    def __init__(self, token_list):
+        '''
+        Keeps the sorted starting and ending point of each token
+        considering the spaces between the tokens
+        eg: Input = ["ab","cd","ef"]
+            starts = [0,3,6], ends = [2,5,8]
+        '''
+        self.starts = []
+        self.ends = []
+        start = 0
+        for token in token_list:
+            self.starts.append(start)
+            self.ends.append(start+len(token))
+            # +1 to consider space
+            start += len(token)+1
+
+    def span_tokens(self, start, end):
+        '''
+        Given a character span [start, end), it returns the index of the
+        tokens having characters in the span
+        eg: Input = ["ab","cd","ef"], start = 1, end = 4
+            Output = [0,1]
+        '''
+        # an empty span has no chars, as range(start, end) of the char map
+        if end <= start:
+            return []
+        first = bisect_right(self.ends, start)
+        last = bisect_left(self.starts, end)
+        return [idx for idx in range(first, last)
+                if self.starts[idx] < self.ends[idx]]
+
+
+def tagged_index(tags_list):
+    '''Returns the set of index of the tags_list already tagged'''
+    return {idx for idx, tag in enumerate(tags_list) if tag != "O"}
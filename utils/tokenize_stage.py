@@ -0,0 +1,62 @@
+from pathlib import Path
+
+from utils import load_hjson
+
+# the config of the repo, whatever the cwd of the process loading it
+CONFIG_PATH = Path(__file__).resolve().parents[1] / 'config' / 'config.hjson'
+# the components of en_core_web_sm, and those its lemmatizer depends on
+PIPES = ('tok2vec', 'tagger', 'parser', 'senter', 'attribute_ruler',
+         'lemmatizer', 'ner')
+LEMMA_PIPES = ('tok2vec', 'tagger', 'attribute_ruler', 'lemmatizer')
+
+
+def load_nlp(model='en_core_web_sm', config=CONFIG_PATH, lemmas=None):
+    '''
+    Loads the spaCy model with only the components the handlers need,
+    the tokenizer alone, or the lemmatizer and the components it depends
+    on when lemmas (default: the get_lemmas flag of config, the path of
+    config.hjson or its loaded dict)
+    eg: load_nlp(lemmas=False).pipe_names -> []
+        load_nlp(lemmas=True).pipe_names
+        -> ['tok2vec', 'tagger', 'attribute_ruler', 'lemmatizer']
+    '''
+    import spacy
+
+    if lemmas is None:
+        if isinstance(config, (str, Path)):
+            config = load_hjson(Path(config))
+        lemmas = bool(config.get('get_lemmas', False)) if config else False
+    keep = LEMMA_PIPES if lemmas else ()
+    # the excluded components are not even loaded
+    return spacy.load(model, exclude=[name for name in PIPES
+                                      if name not in keep])
+
+
+def doc_record(doc, with_lemmas=False):
+    '''
+    Returns the (text, token_list, tags_list) record of the handlers from
+    a spaCy doc, with the lemma_list appended when with_lemmas
+    eg: Input = nlp("tel 273 7924")
+        Output = ("tel 273 7924", ["tel", "273", "7924"], ["O", "O", "O"])
+    '''
+    token_list = [token.text.strip() for token in doc]
+    record = (" ".join(token_list), token_list, ['O']*len(token_list))
+    if with_lemmas:
+        record += ([token.lemma_ for token in doc],)
+    return record
+
+
+def tokenize_records(texts, nlp=None, batch_size=256, n_process=1,
+                     with_lemmas=False):
+    '''
+    Yields the (text, token_list, tags_list) record of each text, in the
+    input order, streaming them through nlp.pipe in batches of
+    batch_size over n_process processes, ready for match_ref_batch
+    eg: records = tokenize_records(df.cleaned_description, n_process=4)
+        results = match_ref_batch(records)
+    '''
+    if nlp is None:
+        nlp = load_nlp(lemmas=with_lemmas or None)
+    texts = (text if isinstance(text, str) else '' for text in texts)
+    for doc in nlp.pipe(texts, batch_size=batch_size, n_process=n_process):
+        yield doc_record(doc, with_lemmas)
@@ -1,14 +1,17 @@
 import re
 import pickle
+import hashlib
 import joblib
 import json
 import hjson
 import numpy as np
+import pandas as pd
 import unicodedata
 from pathlib import Path
 from typing import Tuple
 from pprint import pprint
 from string import punctuation
+from functools import lru_cache
 from collections import Counter
 
 
@@ -33,6 +36,40 @@ SUPERSCRIPT_MAP = str.maketrans(''.join(SUPERSCRIPT_MAP.keys()),
 SUPERSCRIPT_INV_MAP = str.maketrans(''.join(SUPERSCRIPT_INV_MAP.keys()),
                                     ''.join(SUPERSCRIPT_INV_MAP.values()))
 
+PUNCT_TABLE = str.maketrans('', '', punctuation)
+
+
+class CleanTable(dict):
+    '''
+    The translation table folding subscript_to_normal,
+    superscript_to_normal and replace_accented in a single str.translate,
+    a char maps to the ascii chars of its NFD decomposition after the
+    sub/superscripts are replaced. The Latin chars are mapped upfront,
+    the rest the first time they are seen
+    eg: "Café ₂ ³ 中".translate(CleanTable()) -> "Cafe 2 3 "
+    '''
+
+    def __init__(self, delete=''):
+        super().__init__()
+        self.delete = set(map(ord, delete))
+        for code in range(0x250):
+            self[code]
+        for code in list(SUBSCRIPT_INV_MAP) + list(SUPERSCRIPT_INV_MAP):
+            self[code]
+
+    def __missing__(self, code):
+        char = chr(code).translate(SUBSCRIPT_INV_MAP)
+        char = char.translate(SUPERSCRIPT_INV_MAP)
+        char = unicodedata.normalize('NFD', char)
+        char = char.encode('ascii', 'ignore').decode()
+        value = ''.join(c for c in char if ord(c) not in self.delete)
+        self[code] = value
+        return value
+
+
+CLEAN_TABLE = CleanTable()
+CLEAN_PUNCT_TABLE = CleanTable(delete=punctuation)
+
 
 def check_file_exists(path: Path):
     if path.is_file():
@@ -58,6 +95,161 @@ def load_hjson(path: Path):
             return hjson.load(fp)
 
 
+def file_hash(path: Path, chunk_size=1 << 20) -> str:
+    '''Returns the sha256 hex digest of the content of the file'''
+    digest = hashlib.sha256()
+    if check_file_exists(path):
+        with open(path, 'rb') as fp:
+            for chunk in iter(lambda: fp.read(chunk_size), b''):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def text_hash(text) -> str:
+    '''Returns the blake2b hex digest of the text, None for the non str'''
+    if not isinstance(text, str):
+        return None
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def kwargs_repr(value):
+    '''
+    Returns the value as it reads back from json: the dict keys as str,
+    the tuples and sorted sets as lists, the types by name and the other
+    objects by their repr without address
+    eg: kwargs_repr({'dtype': {0: str}, 'usecols': ('A', 'B')})
+        -> {'dtype': {'0': 'builtins.str'}, 'usecols': ['A', 'B']}
+    '''
+    if isinstance(value, dict):
+        return {str(key): kwargs_repr(item)
+                for key, item in sorted(value.items(), key=lambda kv:
+                                        str(kv[0]))}
+    if isinstance(value, (list, tuple)):
+        return [kwargs_repr(item) for item in value]
+    if isinstance(value, (set, frozenset)):
+        return sorted((kwargs_repr(item) for item in value), key=str)
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    if isinstance(value, type):
+        return f'{value.__module__}.{value.__qualname__}'
+    return re.sub(r' at 0x[0-9a-fA-F]+', '', repr(value))
+
+
+def feature_path(path: Path, name: str, cache_dir=None) -> Path:
+    '''
+    Returns the sidecar parquet of the name feature column of the
+    dataset, merged by load_dataset
+    eg: feature_path(Path('data/preprocessed_data.xlsx'), 'keywords')
+        -> Path('data/.cache/preprocessed_data.features/keywords.parquet')
+    '''
+    path = Path(path)
+    cache_dir = Path(cache_dir) if cache_dir else path.parent / '.cache'
+    return cache_dir / f'{path.stem}.features' / f'{name}.parquet'
+
+
+def read_table(path: Path, **kwargs) -> pd.DataFrame:
+    '''Reads the xlsx, csv or parquet dataset'''
+    if path.suffix in ('.xlsx', '.xls'):
+        return pd.read_excel(path, **kwargs)
+    if path.suffix == '.csv':
+        return pd.read_csv(path, **kwargs)
+    if path.suffix == '.parquet':
+        return pd.read_parquet(path, **kwargs)
+    raise ValueError(f"Unsupported dataset format: {path.suffix}")
+
+
+def load_dataset(path: Path, columns=None,
+                 categorical=('Assignment group', 'group'),
+                 cache_dir=None, **read_kwargs) -> pd.DataFrame:
+    '''
+    Given an xlsx or csv dataset, returns it as a DataFrame read from its
+    parquet conversion in cache_dir (default: a .cache dir next to it).
+    The conversion reruns only when the content hash of the source, the
+    categorical columns or the read_kwargs of read_table (sheet_name,
+    usecols, dtype, ...) change, only the columns asked are read. The
+    feature columns written by the later stages to their sidecars (see
+    feature_path) are merged by the hash of their text column, they
+    survive the reconversions and the rows added to the source lack them
+    eg: load_dataset(Path('data/input_data.xlsx'),
+                     columns=['Description', 'Assignment group'])
+    '''
+    path = Path(path)
+    cache_dir = Path(cache_dir) if cache_dir else path.parent / '.cache'
+    target = cache_dir / f'{path.stem}.parquet'
+    meta_path = cache_dir / f'{path.stem}.json'
+    meta = {'source': path.name,
+            'hash': file_hash(path),
+            'categorical': list(categorical),
+            'read_kwargs': kwargs_repr(read_kwargs)}
+
+    stale = not (target.is_file() and meta_path.is_file())
+    if not stale:
+        stored = load_json(meta_path)
+        stale = any(stored.get(key) != meta[key] for key in meta)
+    if stale:
+        data = read_table(path, **read_kwargs)
+        # the text columns of the excel sheets mix numbers in, which
+        # parquet can't store in a single column
+        for col in data.select_dtypes(include='object').columns:
+            data[col] = data[col].where(data[col].isna(),
+                                        data[col].astype(str))
+        for col in categorical:
+            if col in data.columns:
+                data[col] = data[col].astype('category')
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        data.to_parquet(target, index=False)
+        meta['rows'] = len(data)
+        meta['columns'] = [str(col) for col in data.columns]
+        with open(meta_path, 'w') as fp:
+            json.dump(meta, fp, indent=2)
+
+    # a sidecar holds the feature column and the hashes of its text
+    # column, under the name of the text column
+    features = cache_dir / f'{path.stem}.features'
+    sidecars = [pd.read_parquet(sidecar)
+                for sidecar in sorted(features.glob('*.parquet'))
+                if columns is None or sidecar.stem in columns]
+    if not sidecars:
+        return pd.read_parquet(target, columns=columns)
+    read = columns
+    if columns is not None:
+        names = [sidecar.columns[1] for sidecar in sidecars]
+        read = list(dict.fromkeys(
+            [col for col in columns if col not in names] +
+            [sidecar.columns[0] for sidecar in sidecars]))
+    data = pd.read_parquet(target, columns=read)
+    for sidecar in sidecars:
+        text_col, name = sidecar.columns
+        values = dict(zip(sidecar[text_col], sidecar[name]))
+        data[name] = pd.Series([values.get(text_hash(text))
+                                for text in data[text_col]],
+                               index=data.index, dtype=object)
+    return data if columns is None else data[list(columns)]
+
+
+def iter_chunks(path: Path, columns=None, chunksize=1000):
+    '''
+    Yields DataFrame chunks of chunksize rows of the dataset without
+    loading all of it, the csv and parquet files are read chunk by chunk,
+    the xlsx files through their parquet conversion by load_dataset
+    '''
+    path = Path(path)
+    if path.suffix in ('.xlsx', '.xls'):
+        load_dataset(path)
+        path = path.parent / '.cache' / f'{path.stem}.parquet'
+    if path.suffix == '.csv':
+        yield from pd.read_csv(path, usecols=columns, chunksize=chunksize)
+    elif path.suffix == '.parquet':
+        import pyarrow.parquet as pq
+
+        if check_file_exists(path):
+            for batch in pq.ParquetFile(path).iter_batches(
+                    batch_size=chunksize, columns=columns):
+                yield batch.to_pandas()
+    else:
+        raise ValueError(f"Unsupported dataset format: {path.suffix}")
+
+
 def is_blank(text: str) -> bool:
     if text is None:
         return True
@@ -74,6 +266,13 @@ def is_not_blank(text: str) -> bool:
     return bool(text and not text.isspace())
 
 
+@lru_cache(maxsize=None)
+def punct_table(skip: str = ''):
+    '''Returns the table deleting the punctuation except the skip chars'''
+    puncts = punctuation.translate(str.maketrans('', '', skip))
+    return str.maketrans('', '', puncts)
+
+
 def strip_puncts(text: str, lower=True, strip=True, skip='') -> str:
     '''
     :return text: lowercase, strip and remove
@@ -81,12 +280,10 @@ def strip_puncts(text: str, lower=True, strip=True, skip='') -> str:
     '''
     if lower:
         text = text.lower()
-    if isinstance(skip, str) and len(skip) > 0 and len(table) > 0:
-        puncts = punctuation.translate(str.maketrans('', '', skip))
-        table_ = str.maketrans('', '', puncts)
-        text = text.translate(table_)
+    if isinstance(skip, str) and len(skip) > 0:
+        text = text.translate(punct_table(skip))
     else:
-        text = text.translate(table)
+        text = text.translate(PUNCT_TABLE)
     if strip:
         text = text.strip()
     return str(text)
@@ -122,20 +319,52 @@ def replace_accented(text: str) -> str:
     return str(text)
 
 
-def clean_text(text: str) -> str:
+def fold_chars(text: str, puncts=False) -> str:
+    '''
+    :return text: the text with the sub/superscripts and accented chars
+    replaced, the non-ascii chars and, when puncts is True, the
+    punctuations removed in a single translate
+    '''
+    # the ascii texts have nothing to replace
+    if not text.isascii():
+        return text.translate(CLEAN_PUNCT_TABLE if puncts else CLEAN_TABLE)
+    if puncts:
+        return text.translate(PUNCT_TABLE)
+    return text
+
+
+def clean_text(text: str, puncts=False) -> str:
     '''
     :return text: clean text: replace accented chars,
-    strip non-ascii chars and punctuations
+    strip non-ascii chars, and punctuations when puncts is True
     '''
-    text = subscript_to_normal(text)
-    text = superscript_to_normal(text)
-    text = replace_accented(text.strip())
-    # text = text.encode('ascii', errors='ignore').decode()
+    text = fold_chars(str(text), puncts)
     # text = re.sub(r'[^a-zA-Z0-9#\s:$,.()-/@%]', '', text)
     text = ' '.join(text.split())
     return str(text)
 
 
+def clean_texts(texts, puncts=False):
+    '''
+    Given a list, numpy array or pandas Series of texts, returns the
+    clean_text of each text in the same container, the values other than
+    str are kept
+    eg: Input = pd.Series(["Café  ₂", None, " naïve"])
+        Output = pd.Series(["Cafe 2", None, "naive"])
+    '''
+    # most tickets are ascii, cleaning them one by one keeps them on the
+    # fast path of fold_chars, unlike translating them joined
+    values = [clean_text(value, puncts) if isinstance(value, str) else value
+              for value in texts]
+    if isinstance(texts, np.ndarray):
+        return np.array(values, dtype=None if texts.dtype.kind == 'U'
+                        else object)
+    if hasattr(texts, 'index') and hasattr(texts, 'name'):
+        # pandas Series
+        return type(texts)(values, index=texts.index, name=texts.name)
+    return values
+
+
 def strip_commas(text: str) -> str:
     '''remove , and . chars from the text
        e.g: strip_commas('4,693,687.446') -> '4693687446'
@@ -0,0 +1,127 @@
+'''
+Builds the vocabulary indexes of clean_oov and strip_stopwords from the
+NLTK corpora once, as sorted fixed width byte arrays saved in .npy files
+that every process memory maps read only
+eg: python vocab_index.py --out-dir ../models/vocab
+'''
+import os
+import sys
+import argparse
+import tempfile
+from pathlib import Path
+from functools import lru_cache
+
+import numpy as np
+
+from utils import check_file_exists
+
+# next to the models, whatever the cwd of the process loading it
+VOCAB_DIR = Path(__file__).resolve().parents[1] / 'models' / 'vocab'
+
+
+def build_vocab_index(words, path: Path) -> Path:
+    '''
+    Saves the sorted unique utf-8 encoded words as a fixed width bytes
+    array (the width of the longest word) in the .npy file of path. The
+    array is written to a temp file then swapped in, so the workers
+    building it at once never load a partial file
+    eg: build_vocab_index(["the", "a", "an"], Path('stopwords.npy'))
+        -> array([b'a', b'an', b'the'], dtype='|S3')
+    '''
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    encoded = sorted({word.encode('utf-8') for word in words})
+    width = max(map(len, encoded), default=1)
+    fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=path.parent)
+    with os.fdopen(fd, 'wb') as fp:
+        np.save(fp, np.array(encoded, dtype=f'S{width}'))
+    os.replace(tmp, path)
+    return path
+
+
+class VocabIndex:
+    '''
+    Membership tests against a vocabulary built by build_vocab_index, the
+    sorted array is memory mapped so the workers share its pages and a
+    load takes a few milliseconds, a batch of tokens is looked up by a
+    single np.searchsorted
+    eg: vocab = VocabIndex(Path('../models/vocab/words.npy'))
+        "ticket" in vocab -> True
+        vocab.contains(["reset", "pwd", "password"]) -> [True, False, True]
+    '''
+
+    def __init__(self, path: Path):
+        if check_file_exists(Path(path)):
+            self.words = np.load(path, mmap_mode='r')
+        self.width = self.words.dtype.itemsize
+
+    def __len__(self):
+        return len(self.words)
+
+    def __contains__(self, word: str) -> bool:
+        return bool(self.contains([word])[0])
+
+    def contains(self, tokens):
+        '''Returns the boolean array of the tokens found'''
+        encoded = [token.encode('utf-8') for token in tokens]
+        if not encoded or not len(self.words):
+            return np.zeros(len(encoded), dtype=bool)
+        # one byte wider than the longest word, the longer tokens stay
+        # longer than any word once truncated
+        keys = np.array(encoded, dtype=f'S{self.width+1}')
+        idx = np.searchsorted(self.words, keys)
+        found = np.zeros(len(keys), dtype=bool)
+        inside = idx < len(self.words)
+        found[inside] = self.words[idx[inside]] == keys[inside]
+        return found
+
+    def filter(self, text: str, keep=True, lower=True) -> str:
+        '''
+        Returns the words of the text found (keep) or not found (not
+        keep) in the vocabulary, looked up lowercased when lower
+        eg: Input = "Reset my pwd", keep = True
+            Output = "Reset my"
+        '''
+        words = text.split()
+        found = self.contains([word.lower() for word in words]
+                              if lower else words)
+        return ' '.join(word for word, hit in zip(words, found)
+                        if hit == keep)
+
+
+def build_nltk_vocab(out_dir=VOCAB_DIR):
+    '''Builds words.npy and stopwords.npy from the NLTK corpora'''
+    from nltk.corpus import stopwords, words
+
+    out_dir = Path(out_dir)
+    return (build_vocab_index(words.words(), out_dir / 'words.npy'),
+            build_vocab_index(stopwords.words('english'),
+                              out_dir / 'stopwords.npy'))
+
+
+@lru_cache(maxsize=None)
+def load_vocab(name: str, out_dir=VOCAB_DIR) -> VocabIndex:
+    '''
+    Returns the VocabIndex of words or stopwords, building the indexes
+    from the NLTK corpora the first time
+    '''
+    path = Path(out_dir) / f'{name}.npy'
+    if not path.is_file():
+        build_nltk_vocab(out_dir)
+    return VocabIndex(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--out-dir', type=Path, default=VOCAB_DIR)
+    args = parser.parse_args(argv)
+
+    for path in build_nltk_vocab(args.out_dir):
+        index = VocabIndex(path)
+        print(f'{path}: {len(index)} words of up to {index.width} bytes, '
+              f'{path.stat().st_size/2**20:.1f} MB')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())